@@ -0,0 +1,58 @@
+"""
+Compares evaluating K parameter sets one at a time with meta_population_sample
+against a single ensemble solve with meta_population_ensemble_sample.
+Run from the repository root:
+    python -m benchmarks.bench_ensemble -k 1 10 50 100
+"""
+import argparse
+import time
+
+import numpy as np
+
+from tools import (meta_population_sample, meta_population_ensemble_sample,
+                   load_case_counts, load_specific_city, data_travel)
+
+parser = argparse.ArgumentParser(description="Ensemble Benchmark Arguments")
+parser.add_argument('-k', type=int, action='store', nargs='+', default=[1, 10, 50, 100],
+                    dest='k', help='ensemble sizes')
+parser.add_argument('-seed', type=int, action='store', default=0,
+                    dest='seed', help='seed of the random parameter sets')
+args = parser.parse_args()
+
+start_date = '1992-02-08'
+end_date = '1998-07-28'
+cities = ['Tartagal', 'Oran', 'Jujuy']
+M_c = len(cities)
+Ns = np.array([4.4e4, 5.1e4, 2e5])
+gamma = 1.0 / 7.0
+shift = 0.0
+
+travel_matrix = data_travel()[:M_c, :M_c]
+
+data = load_case_counts()
+sampling = dict()
+for city in cities:
+    x, z = load_specific_city(data, city, start_date, end_date)
+    sampling[city] = x[z > 0.0]
+
+rng = np.random.default_rng(args.seed)
+
+print('{:>6}{:>14}{:>14}{:>10}{:>14}'.format('K', 'loop [s]', 'ensemble [s]', 'speed-up', 'max abs diff'))
+for K in args.k:
+    pars = np.stack([rng.random(K), rng.random(K) * 0.179 + 0.001, rng.random(K) * 0.179 + 0.001,
+                     rng.random(K) * 20.0, rng.random(K) * 20.0 + 4.0, rng.random(K) * 2.0 * np.pi], axis=1)
+    betas = pars[:, [1, 1, 2]]
+
+    tic = time.perf_counter()
+    loop = np.array([meta_population_sample(sampling, p[0], b, gamma, p[5], p[3], p[4], shift,
+                                            Ns, M_c, travel_matrix, init_n=M_c) for p, b in zip(pars, betas)])
+    loop_time = time.perf_counter() - tic
+
+    tic = time.perf_counter()
+    ensemble = meta_population_ensemble_sample(sampling, pars[:, 0], betas, gamma, pars[:, 5], pars[:, 3],
+                                               pars[:, 4], shift, Ns, M_c, travel_matrix, init_n=M_c)
+    ensemble_time = time.perf_counter() - tic
+
+    print('{:>6}{:>14.3f}{:>14.3f}{:>10.2f}{:>14.2e}'.format(K, loop_time, ensemble_time,
+                                                            loop_time / ensemble_time,
+                                                            np.abs(loop - ensemble).max()))
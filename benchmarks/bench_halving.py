@@ -0,0 +1,63 @@
+"""
+Compares running every random restart of the Tartagal, Oran and Jujuy fit until convergence
+with a successive halving of the same restarts: all of them get a few iterations, and only
+the best fraction continues with larger budgets. Reports the wall time, the number of
+objective evaluations and the best objective value of both, e.g.
+    python -m benchmarks.bench_halving -m 20 -budgets 5 0 -keep 0.2
+Run from the repository root.
+"""
+import argparse
+import time
+
+import numpy as np
+
+from tools import squared_error, fidelity_ladder, aggregate_samples, data_travel, load_case_counts, SamplingPlan
+from tools.api import observed_cases
+from tools.data_tools import all_cities, all_Ns
+
+parser = argparse.ArgumentParser(description="Successive Halving Benchmark Arguments")
+parser.add_argument('-m', type=int, action='store', default=20,
+                    dest='m', help='number of random restarts')
+parser.add_argument('-budgets', type=int, action='store', nargs='+', default=[5, 0],
+                    dest='budgets', help='maximal iterations of the halving stages (0 until convergence)')
+parser.add_argument('-keep', type=float, action='store', default=0.2,
+                    dest='keep', help='fraction of the restarts kept after every stage')
+parser.add_argument('-tol', type=float, action='store', default=1e-6,
+                    dest='tol', help='integration tolerance')
+parser.add_argument('-period', type=int, action='store', default=7,
+                    dest='period', help='data aggregation period in days')
+parser.add_argument('-seed', type=int, action='store', default=0,
+                    dest='seed', help='seed of the restarts')
+args = parser.parse_args()
+
+M_c = 3
+Ns = all_Ns[:M_c]
+travel_matrix = data_travel()[:M_c, :M_c]
+sampling, y_sample = observed_cases(load_case_counts(), all_cities[:M_c], '1992-02-08', '1998-07-28')
+sampling, y_sample = aggregate_samples(sampling, y_sample, args.period)
+arguments = (0.0, 1.0 / 7.0, Ns, M_c, travel_matrix, SamplingPlan(sampling, 0.0, 14), y_sample, 14, None, args.tol)
+limits = [[0.0, 1.0], [0.0, None], [0.0, None], [0.0, None], [4.0, None], [0.0, 2.0 * np.pi]]
+calls = [0]
+
+
+def counted_error(*arguments):
+    calls[0] += 1
+    return squared_error(*arguments)
+
+
+def run(budgets):
+    """
+    :param budgets: maximal iterations of every stage (list)
+    :return: wall time, objective evaluations and best objective value (float, int, float)
+    """
+    calls[0] = 0
+    tic = time.perf_counter()
+    ws, _, _ = fidelity_ladder(counted_error, [arguments] * len(budgets), limits, args.m, keep=args.keep,
+                               seed=args.seed, budgets=budgets)
+    return time.perf_counter() - tic, calls[0], ws[:, -1].min()
+
+
+print('{:>12}{:>10}{:>14}{:>14}'.format('schedule', 'time [s]', 'evaluations', 'best'))
+for name, budgets in [('full', [0]), ('halving', args.budgets)]:
+    elapsed, evaluations, best = run(budgets)
+    print('{:>12}{:>10.1f}{:>14}{:>14.4f}'.format(name, elapsed, evaluations, best))
@@ -0,0 +1,134 @@
+"""
+Compares the dictionary based right hand side (meta_population_siarw, with the
+Jacobian estimated by finite differences) against the precompiled
+MetaPopulationModel (with the exact Jacobian passed to the integrator).
+Run from the repository root:
+    python -m benchmarks.bench_rhs -m 20
+"""
+import argparse
+import time
+
+import numpy as np
+
+from scipy.integrate import odeint
+
+from tools import (meta_population_siarw, MetaPopulationModel, meta_population_sample,
+                   initial_conditions, load_case_counts, load_specific_city, data_travel)
+from tools.integration_tools import t_max
+
+parser = argparse.ArgumentParser(description="RHS Benchmark Arguments")
+parser.add_argument('-m', type=int, action='store', default=20,
+                    dest='m', help='number of random parameter sets')
+parser.add_argument('-seed', type=int, action='store', default=0,
+                    dest='seed', help='seed of the random parameter sets')
+args = parser.parse_args()
+
+start_date = '1992-02-08'
+end_date = '1998-07-28'
+cities = ['Tartagal', 'Oran', 'Jujuy']
+M_c = len(cities)
+Ns = np.array([4.4e4, 5.1e4, 2e5])
+gamma = 1.0 / 7.0
+shift = 0.0
+
+travel_matrix = data_travel()[:M_c, :M_c]
+
+data = load_case_counts()
+sampling = dict()
+y_sample = []
+for city in cities:
+    x, z = load_specific_city(data, city, start_date, end_date)
+    sampling[city] = x[z > 0.0]
+    y_sample.append(z[z > 0.0])
+y_sample = np.concatenate(y_sample)
+
+
+def legacy_sample(pars):
+    """
+    Reproduces meta_population_sample as it was before the precompiled model.
+    :param pars: asym, beta_1, beta_2, t_0, init, phi (numpy.array)
+    :return: one dimensional array of all samples (numpy.array)
+    """
+    p = {'asym': pars[0], 'beta': np.array([pars[1], pars[1], pars[2]]), 'gamma': gamma, 'phi': pars[5],
+         't_0': pars[3], 'Ns': Ns, 'M_c': M_c, 'travel_matrix': travel_matrix}
+    y0 = initial_conditions(pars[4], Ns, M_c, M_c)
+    output = odeint(meta_population_siarw, y0, np.arange(shift, t_max), args=(p,),
+                    mxstep=10000, rtol=1e-11, atol=1e-11)
+
+    res = []
+    for j, city in enumerate(sampling.keys()):
+        pre_sampling = np.insert(sampling[city][:-1], 0, shift)
+        pre_sampling[pre_sampling < shift] = shift
+        pre_sampling = np.max([sampling[city] - 14, pre_sampling], axis=0)
+        res.append(output[sampling[city], 4 + 5 * j] - output[pre_sampling, 4 + 5 * j])
+    return np.concatenate(res)
+
+
+def current_sample(pars):
+    """
+    Calls meta_population_sample as the fitting objectives do.
+    :param pars: asym, beta_1, beta_2, t_0, init, phi (numpy.array)
+    :return: one dimensional array of all samples (numpy.array)
+    """
+    betas = np.array([pars[1], pars[1], pars[2]])
+    return meta_population_sample(sampling, pars[0], betas, gamma, pars[5], pars[3], pars[4], shift,
+                                  Ns, M_c, travel_matrix, init_n=M_c)
+
+
+def count_evaluations(pars, exact_jacobian):
+    """
+    Counts the right hand side and Jacobian evaluations of a single solve.
+    :param pars: asym, beta_1, beta_2, t_0, init, phi (numpy.array)
+    :param exact_jacobian: whether to use the precompiled model with its Jacobian (bool)
+    :return: number of RHS and Jacobian evaluations (int, int)
+    """
+    betas = np.array([pars[1], pars[1], pars[2]])
+    y0 = initial_conditions(pars[4], Ns, M_c, M_c)
+    t = np.arange(shift, t_max)
+    if exact_jacobian:
+        model = MetaPopulationModel(pars[0], betas, gamma, pars[5], pars[3], Ns, M_c, travel_matrix)
+        _, info = odeint(model.rhs, y0, t, Dfun=model.jac, mxstep=10000, rtol=1e-11, atol=1e-11,
+                         full_output=True)
+    else:
+        p = {'asym': pars[0], 'beta': betas, 'gamma': gamma, 'phi': pars[5],
+             't_0': pars[3], 'Ns': Ns, 'M_c': M_c, 'travel_matrix': travel_matrix}
+        _, info = odeint(meta_population_siarw, y0, t, args=(p,), mxstep=10000, rtol=1e-11, atol=1e-11,
+                         full_output=True)
+    return info['nfe'][-1], info['nje'][-1]
+
+
+def objective_time(sample, pars):
+    """
+    Measures the wall time of a single objective evaluation.
+    :param sample: function computing the samples (callable)
+    :param pars: asym, beta_1, beta_2, t_0, init, phi (numpy.array)
+    :return: wall time in seconds and the objective value (float, float)
+    """
+    tic = time.perf_counter()
+    objs = (sample(pars) - y_sample)**2.0
+    value = objs.sum() / objs.shape[0]
+    return time.perf_counter() - tic, value
+
+
+rng = np.random.default_rng(args.seed)
+stats = {'legacy': [], 'current': []}
+for ii in range(args.m):
+    pars = np.array([rng.random(), rng.random() * 0.179 + 0.001, rng.random() * 0.179 + 0.001,
+                     rng.random() * 20.0, rng.random() * 20.0 + 4.0, rng.random() * 2.0 * np.pi])
+
+    for name, sample, exact_jacobian in (('legacy', legacy_sample, False), ('current', current_sample, True)):
+        wall, value = objective_time(sample, pars)
+        nfe, nje = count_evaluations(pars, exact_jacobian)
+        stats[name].append([wall, nfe, nje, value])
+
+legacy = np.array(stats['legacy'])
+current = np.array(stats['current'])
+
+print('{:<10}{:>16}{:>16}{:>16}'.format('', 'objective [ms]', 'RHS evals', 'Jacobian evals'))
+for name, values in (('legacy', legacy), ('current', current)):
+    print('{:<10}{:>16.2f}{:>16.1f}{:>16.1f}'.format(name, 1e3 * values[:, 0].mean(),
+                                                     values[:, 1].mean(), values[:, 2].mean()))
+print('speed-up of the objective: {:.2f}x'.format(legacy[:, 0].sum() / current[:, 0].sum()))
+print('RHS evaluations saved: {:.1f}%'.format(100.0 * (1.0 - current[:, 1].sum() / legacy[:, 1].sum())))
+print('max relative objective difference: {:.2e}'.format(
+    np.max(np.abs(legacy[:, 3] - current[:, 3]) / np.abs(legacy[:, 3]))))
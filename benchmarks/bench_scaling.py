@@ -0,0 +1,114 @@
+"""
+Measures how the model scales with the number of cities on synthetic mobility
+networks: the wall time and memory high-water mark of meta_population_solution
+over the whole horizon, of meta_population_sample on a random sampling plan and
+of a single squared_error evaluation, with dense and/or sparse travel matrices.
+The results are written to a JSON file, so that they can be compared between
+versions.
+Run from the repository root:
+    python -m benchmarks.bench_scaling -c 3 10 30 100 300 1000 -formats sparse
+"""
+import argparse
+import json
+import platform
+import resource
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import scipy
+
+from tools import (meta_population_solution, meta_population_sample, squared_error, beta_classes,
+                   solution_cache, synthetic_network)
+from tools.integration_tools import t_max
+
+parser = argparse.ArgumentParser(description="Scaling Benchmark Arguments")
+parser.add_argument('-c', type=int, action='store', nargs='+', default=[3, 10, 30, 100, 300],
+                    dest='c', help='numbers of cities')
+parser.add_argument('-formats', type=str, action='store', nargs='+', default=['dense', 'sparse'],
+                    choices=['dense', 'sparse'], dest='formats', help='formats of the travel matrix')
+parser.add_argument('-model', type=str, action='store', default='gravity', choices=['gravity', 'radiation'],
+                    dest='model', help='mobility model')
+parser.add_argument('-neighbours', type=int, action='store', default=10,
+                    dest='neighbours', help='number of the strongest destinations kept for every city')
+parser.add_argument('-samples', type=int, action='store', default=50,
+                    dest='samples', help='number of sampling days of every city')
+parser.add_argument('-tol', type=float, action='store', default=1e-11,
+                    dest='tol', help='relative and absolute tolerance of the integrator')
+parser.add_argument('-repeats', type=int, action='store', default=1,
+                    dest='repeats', help='number of timed repeats (the fastest is reported)')
+parser.add_argument('-seed', type=int, action='store', default=0,
+                    dest='seed', help='seed of the networks and sampling plans')
+parser.add_argument('-out', type=str, action='store', default='bench_scaling.json',
+                    dest='out', help='file the results are written to')
+args = parser.parse_args()
+
+pars = np.array([0.3, 0.16, 0.15, 10.0, 10.0, 5.8])
+gamma = 1.0 / 7.0
+shift = 0.0
+active_sampling = 14
+
+# every objective evaluation has to solve the model
+solution_cache.resize(0)
+
+
+def measure(function):
+    """
+    Measures the fastest wall time of a function over the repeats, and the peak of the
+    memory allocated during one more (traced) call.
+    :param function: function without arguments (callable)
+    :return: wall time in seconds and peak memory in bytes (float, int)
+    """
+    times = []
+    for _ in range(args.repeats):
+        tic = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - tic)
+
+    tracemalloc.start()
+    function()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return min(times), peak
+
+
+records = []
+print('{:>6}{:>8}{:>12}{:>12}{:>14}{:>12}'.format('M_c', 'format', 'operation', 'time [s]', 'peak [MB]',
+                                                  'rss [MB]'))
+for M_c in args.c:
+    rng = np.random.default_rng([args.seed, M_c])
+    sampling = dict()
+    for j in range(M_c):
+        sampling['city {}'.format(j)] = np.sort(rng.choice(np.arange(1, t_max), size=args.samples, replace=False))
+
+    for travel_format in args.formats:
+        Ns, travel_matrix, _ = synthetic_network(M_c, model=args.model, seed=args.seed,
+                                                 neighbours=args.neighbours, as_sparse=travel_format == 'sparse')
+        betas = beta_classes(Ns).dot(pars[1:3])
+        model_args = (pars[0], betas, gamma, pars[5], pars[3], pars[4])
+
+        y_sample = meta_population_sample(sampling, *model_args, shift, Ns, M_c, travel_matrix, init_n=M_c,
+                                          rtol=args.tol, atol=args.tol)
+        y_sample = np.maximum(y_sample + rng.normal(size=y_sample.shape[0]), 0.0)
+
+        operations = {
+            'solution': lambda: meta_population_solution(np.arange(shift, t_max), *model_args, Ns, M_c,
+                                                         travel_matrix, init_n=M_c, rtol=args.tol, atol=args.tol),
+            'sample': lambda: meta_population_sample(sampling, *model_args, shift, Ns, M_c, travel_matrix,
+                                                     init_n=M_c, rtol=args.tol, atol=args.tol),
+            'objective': lambda: squared_error(pars, shift, gamma, Ns, M_c, travel_matrix, sampling, y_sample,
+                                               active_sampling, None, args.tol)}
+
+        for operation, function in operations.items():
+            wall, peak = measure(function)
+            rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == 'darwin' else 1024)
+            records.append({'M_c': M_c, 'format': travel_format, 'operation': operation, 'time': wall,
+                            'peak_memory': peak, 'max_rss': rss})
+            print('{:>6}{:>8}{:>12}{:>12.3f}{:>14.1f}{:>12.1f}'.format(M_c, travel_format, operation, wall,
+                                                                      peak / 2**20, rss / 2**20))
+
+with open(args.out, 'w') as f:
+    json.dump({'settings': vars(args), 'python': platform.python_version(), 'numpy': np.__version__,
+               'scipy': scipy.__version__, 'machine': platform.platform(),
+               'date': time.strftime('%Y-%m-%dT%H:%M:%S'), 'records': records}, f, indent=1)
@@ -0,0 +1,83 @@
+"""
+Times the pairwise SNP distances of the packed alignments for growing numbers of synthetic
+genomes (random mutations of a common root, with the length and the gaps of the study
+alignment), against comparing the unpacked sites, and checks that both agree.
+Run from the repository root:
+    python -m benchmarks.bench_snp -n 186 1000 4000
+"""
+import argparse
+import time
+
+import numpy as np
+
+from tools import Alignment, load_alignment, pack_sequence, unpack_codes, pairwise_distances
+
+parser = argparse.ArgumentParser(description="SNP Distance Benchmark Arguments")
+parser.add_argument('-n', type=int, action='store', nargs='+', default=[186, 1000, 4000],
+                    dest='n', help='numbers of genomes')
+parser.add_argument('-naive', type=int, action='store', default=1000,
+                    dest='naive', help='largest number of genomes compared site by site')
+parser.add_argument('-block', type=int, action='store', default=128,
+                    dest='block', help='number of genomes of a block')
+parser.add_argument('-snps', type=float, action='store', default=10.0,
+                    dest='snps', help='mean number of mutations of a genome from the root')
+parser.add_argument('-seed', type=int, action='store', default=0,
+                    dest='seed', help='seed of the genomes')
+args = parser.parse_args()
+
+study = load_alignment()
+length = study.length
+gaps = study.mask.mean()
+rng = np.random.default_rng(args.seed)
+
+
+def synthetic_alignment(n):
+    """
+    :param n: number of genomes (int)
+    :return: alignment (Alignment)
+    """
+    root = rng.integers(0, 4, length)
+    sites = np.repeat(root[None, :], n, axis=0)
+    mutated = rng.random((n, length)) < args.snps / length
+    sites[mutated] = (sites[mutated] + rng.integers(1, 4, mutated.sum())) % 4
+    characters = np.frombuffer(b'ACGT-', dtype=np.uint8)[np.where(rng.random((n, length)) < gaps, 4, sites)]
+
+    rows = [pack_sequence(row.tobytes().decode('ascii')) for row in characters]
+    return Alignment(np.arange(n).astype(str), np.zeros(n, dtype='datetime64[D]'), length,
+                     np.array([codes for codes, _ in rows]), np.array([mask for _, mask in rows]))
+
+
+def naive_distances(alignment, block=64):
+    """
+    :param alignment: alignment (Alignment)
+    :param block: number of genomes of a block (int)
+    :return: number of SNPs between every pair of genomes, comparing the sites one by one (numpy.array)
+    """
+    sites = unpack_codes(alignment.codes, alignment.mask, alignment.length)
+    distances = np.zeros((len(alignment), len(alignment)), dtype=np.int32)
+    for i in range(0, len(alignment), block):
+        a = sites[i:i + block, None, :]
+        distances[i:i + block] = ((a != sites[None, :, :]) & (a < 4) & (sites[None, :, :] < 4)).sum(-1)
+    return distances
+
+
+print('{:>8}{:>12}{:>12}{:>10}{:>14}{:>10}'.format('n', 'packed [s]', 'sites [s]', 'speed-up', 'pairs per s',
+                                                   'equal'))
+for n in args.n:
+    alignment = synthetic_alignment(n)
+
+    tic = time.perf_counter()
+    distances = pairwise_distances(alignment, args.block)
+    packed_time = time.perf_counter() - tic
+
+    if n <= args.naive:
+        tic = time.perf_counter()
+        reference = naive_distances(alignment)
+        naive_time = time.perf_counter() - tic
+        print('{:>8}{:>12.3f}{:>12.3f}{:>10.1f}{:>14.3g}{:>10}'.format(n, packed_time, naive_time,
+                                                                      naive_time / packed_time,
+                                                                      n * (n - 1) / 2 / packed_time,
+                                                                      str(np.array_equal(distances, reference))))
+    else:
+        print('{:>8}{:>12.3f}{:>12}{:>10}{:>14.3g}{:>10}'.format(n, packed_time, '-', '-',
+                                                                n * (n - 1) / 2 / packed_time, '-'))
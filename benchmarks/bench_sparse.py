@@ -0,0 +1,65 @@
+"""
+Compares the time of a single solve with a dense travel matrix (dense Jacobian)
+against a sparse one (reordered cities and banded Jacobian) for growing numbers
+of cities. The travel network links every city with its k nearest neighbours
+along a line, listed in a random order as real networks are, and a fixed fraction
+of every population travels daily, split among the neighbours by their size.
+Run from the repository root:
+    python -m benchmarks.bench_sparse -c 10 100 300 500
+"""
+import argparse
+import time
+
+import numpy as np
+
+from scipy import sparse
+
+from tools import meta_population_solution, travel_ordering, MetaPopulationModel
+
+parser = argparse.ArgumentParser(description="Sparse Travel Benchmark Arguments")
+parser.add_argument('-c', type=int, action='store', nargs='+', default=[10, 50, 100, 200],
+                    dest='c', help='numbers of cities')
+parser.add_argument('-k', type=int, action='store', default=2,
+                    dest='k', help='number of neighbours on each side linked by travel')
+parser.add_argument('-travel', type=float, action='store', default=0.05,
+                    dest='travel', help='fraction of the population travelling daily')
+parser.add_argument('-beta', type=float, action='store', default=0.3,
+                    dest='beta', help='transmission rate')
+parser.add_argument('-days', type=float, action='store', default=2300.0,
+                    dest='days', help='length of the solved period')
+parser.add_argument('-tol', type=float, action='store', default=1e-11,
+                    dest='tol', help='relative and absolute tolerance of the integrator')
+parser.add_argument('-seed', type=int, action='store', default=0,
+                    dest='seed', help='seed of the random network')
+args = parser.parse_args()
+
+rng = np.random.default_rng(args.seed)
+t = np.arange(0.0, args.days + 1.0)
+
+print('{:>6}{:>12}{:>12}{:>12}{:>10}{:>14}'.format('M_c', 'band width', 'dense [s]', 'sparse [s]', 'speed-up',
+                                                     'max rel diff'))
+for M_c in args.c:
+    position = rng.permutation(M_c)
+    distance = np.abs(position[:, None] - position[None, :])
+    Ns = np.exp(rng.normal(np.log(1e5), 1.0, M_c))
+    travel_matrix = np.where((distance > 0) & (distance <= args.k), np.sqrt(np.outer(Ns, Ns)), 0.0)
+    travel_matrix *= args.travel * Ns[:, None] / travel_matrix.sum(1, keepdims=True)
+    travel_sparse = sparse.csr_matrix(travel_matrix)
+
+    order = travel_ordering(travel_sparse)
+    model = MetaPopulationModel(0.3, args.beta, 1.0 / 7.0, 5.8, 10.0, Ns[order], M_c, travel_sparse[order][:, order])
+    band = model.ml + model.mu + 1
+
+    tic = time.perf_counter()
+    dense = meta_population_solution(t, 0.3, args.beta, 1.0 / 7.0, 5.8, 10.0, 10.0, Ns, M_c, travel_matrix,
+                                     init_n=1, rtol=args.tol, atol=args.tol)
+    dense_time = time.perf_counter() - tic
+
+    tic = time.perf_counter()
+    banded = meta_population_solution(t, 0.3, args.beta, 1.0 / 7.0, 5.8, 10.0, 10.0, Ns, M_c, travel_sparse,
+                                      init_n=1, rtol=args.tol, atol=args.tol)
+    sparse_time = time.perf_counter() - tic
+
+    print('{:>6}{:>12}{:>12.3f}{:>12.3f}{:>10.2f}{:>14.2e}'.format(M_c, band, dense_time, sparse_time,
+                                                                 dense_time / sparse_time,
+                                                                 np.abs(dense - banded).max() / np.abs(dense).max()))
@@ -0,0 +1,61 @@
+"""
+Times the stochastic samples of the Tartagal, Oran and Jujuy setup for growing numbers of
+replicates simulated in one batch, against simulating the replicates one by one, and
+compares the mean of the established epidemics with the ODE samples.
+Run from the repository root:
+    python -m benchmarks.bench_stochastic -r 10 100 1000
+"""
+import argparse
+import time
+
+import numpy as np
+
+from tools import (meta_population_sample, meta_population_stochastic_sample, load_case_counts,
+                   load_specific_city, data_travel)
+
+parser = argparse.ArgumentParser(description="Stochastic Benchmark Arguments")
+parser.add_argument('-r', type=int, action='store', nargs='+', default=[10, 100, 1000],
+                    dest='r', help='numbers of replicates')
+parser.add_argument('-single', type=int, action='store', default=10,
+                    dest='single', help='number of replicates simulated one by one')
+parser.add_argument('-dt', type=float, action='store', default=0.25,
+                    dest='dt', help='length of a step in days')
+parser.add_argument('-seed', type=int, action='store', default=0,
+                    dest='seed', help='seed of the simulations')
+args = parser.parse_args()
+
+cities = ['Tartagal', 'Oran', 'Jujuy']
+M_c = len(cities)
+Ns = np.array([4.4e4, 5.1e4, 2e5])
+travel_matrix = data_travel()[:M_c, :M_c]
+params = (0.32, np.array([0.157, 0.157, 0.155]), 1.0 / 7.0, 5.8, 11.0, 10.0, 0.0)
+
+data = load_case_counts()
+sampling = dict()
+for city in cities:
+    x, z = load_specific_city(data, city, '1992-02-08', '1998-07-28')
+    sampling[city] = x[z > 0.0]
+
+y_sample = meta_population_sample(sampling, *params, Ns, M_c, travel_matrix, init_n=M_c)
+rng = np.random.default_rng(args.seed)
+
+tic = time.perf_counter()
+for _ in range(args.single):
+    meta_population_stochastic_sample(sampling, *params, Ns, M_c, travel_matrix, 1, rng, init_n=M_c, dt=args.dt)
+single_time = (time.perf_counter() - tic) / args.single
+
+print('{:>8}{:>12}{:>16}{:>10}{:>14}{:>12}'.format('r', 'batch [s]', 'one by one [s]', 'speed-up', 'established',
+                                                   'mean / ODE'))
+for r in args.r:
+    tic = time.perf_counter()
+    replicates = meta_population_stochastic_sample(sampling, *params, Ns, M_c, travel_matrix, r, rng, init_n=M_c,
+                                                   dt=args.dt)
+    batch_time = time.perf_counter() - tic
+
+    # the replicates going extinct early are left out of the comparison with the ODE
+    totals = replicates.sum(1)
+    established = totals > 0.05 * y_sample.sum()
+    print('{:>8}{:>12.3f}{:>16.3f}{:>10.1f}{:>14.2f}{:>12.3f}'.format(r, batch_time, r * single_time,
+                                                                      r * single_time / batch_time,
+                                                                      established.mean(),
+                                                                      totals[established].mean() / y_sample.sum()))
@@ -0,0 +1,163 @@
+"""
+Times the hot paths of the model on the real Tartagal, Oran and Jujuy setup, from
+single right hand side evaluations up to a full fit with a single restart, together
+with the number of right hand side evaluations of the ODE based ones. The results
+can be saved as a baseline and compared against a stored one, e.g.
+    python -m benchmarks.bench_suite -save benchmarks/baseline.json
+    python -m benchmarks.bench_suite -compare benchmarks/baseline.json
+Run from the repository root.
+"""
+import argparse
+import json
+import platform
+import time
+
+import numpy as np
+import scipy
+
+from tools import (meta_population_siarw, MetaPopulationModel, meta_population_solution,
+                   meta_population_sample, initial_conditions, squared_error, fidelity_ladder, solution_cache,
+                   load_case_counts, load_specific_city, data_travel)
+from tools.integration_tools import t_max
+from tools.model_tools import seasonal_function
+
+parser = argparse.ArgumentParser(description="Benchmark Suite Arguments")
+parser.add_argument('-repeats', type=int, action='store', default=5,
+                    dest='repeats', help='number of timed repeats (the fastest is reported)')
+parser.add_argument('-calls', type=int, action='store', default=10000,
+                    dest='calls', help='number of calls timed together by the micro benchmarks')
+parser.add_argument('-skip_fit', action='store_const', default=False, const=True,
+                    dest='skip_fit', help='whether to skip the full fit')
+parser.add_argument('-save', type=str, action='store', default=None,
+                    dest='save', help='file the results are saved to as a baseline')
+parser.add_argument('-compare', type=str, action='store', default=None,
+                    dest='compare', help='baseline file to compare against')
+args = parser.parse_args()
+
+start_date = '1992-02-08'
+end_date = '1998-07-28'
+cities = ['Tartagal', 'Oran', 'Jujuy']
+M_c = len(cities)
+Ns = np.array([4.4e4, 5.1e4, 2e5])
+gamma = 1.0 / 7.0
+shift = 0.0
+active_sampling = 14
+
+travel_matrix = data_travel()[:M_c, :M_c]
+
+data = load_case_counts()
+sampling = dict()
+y_sample = []
+for city in cities:
+    x, z = load_specific_city(data, city, start_date, end_date)
+    sampling[city] = x[z > 0.0]
+    y_sample.append(z[z > 0.0])
+y_sample = np.concatenate(y_sample)
+
+pars = np.array([0.32, 0.157, 0.155, 11.0, 10.0, 5.8])
+betas = np.array([pars[1], pars[1], pars[2]])
+limits = [[0.0, 1.0], [0.0, None], [0.0, None], [0.0, None], [4.0, None], [0.0, 2.0 * np.pi]]
+objective_arguments = (shift, gamma, Ns, M_c, travel_matrix, sampling, y_sample, active_sampling, None, 1e-11)
+
+y0 = initial_conditions(pars[4], Ns, M_c, M_c)
+p = {'asym': pars[0], 'beta': betas, 'gamma': gamma, 'phi': pars[5], 't_0': pars[3], 'Ns': Ns, 'M_c': M_c,
+     'travel_matrix': travel_matrix}
+model = MetaPopulationModel(pars[0], betas, gamma, pars[5], pars[3], Ns, M_c, travel_matrix)
+days = np.arange(shift, t_max)
+
+# every objective evaluation has to solve the model
+solution_cache.resize(0)
+
+
+def best_time(function, calls=1):
+    """
+    Measures the fastest wall time of a function over the repeats.
+    :param function: function without arguments (callable)
+    :param calls: number of calls timed together (int)
+    :return: wall time of a single call in seconds (float)
+    """
+    times = []
+    for _ in range(args.repeats):
+        tic = time.perf_counter()
+        for _ in range(calls):
+            function()
+        times.append((time.perf_counter() - tic) / calls)
+    return min(times)
+
+
+def rhs_evaluations(function):
+    """
+    Counts the evaluations of the model right hand side during a call of a function.
+    :param function: function without arguments (callable)
+    :return: number of evaluations (int)
+    """
+    rhs = MetaPopulationModel.rhs
+    calls = [0]
+
+    def counted_rhs(self, y, t):
+        calls[0] += 1
+        return rhs(self, y, t)
+
+    MetaPopulationModel.rhs = counted_rhs
+    try:
+        function()
+    finally:
+        MetaPopulationModel.rhs = rhs
+    return calls[0]
+
+
+def full_fit():
+    """
+    Runs the fit of fit_data.py with a single restart.
+    :return: optimal parameters followed by the objective value (numpy.array)
+    """
+    ws, _, _ = fidelity_ladder(squared_error, [objective_arguments], limits, 1, seed=0)
+    return ws[0]
+
+
+micro = {
+    'seasonal_function': lambda: seasonal_function(100.0, pars[5], pars[3]),
+    'seasonal_function (2300 days)': lambda: seasonal_function(days, pars[5], pars[3]),
+    'meta_population_siarw': lambda: meta_population_siarw(y0, 100.0, p),
+    'MetaPopulationModel.rhs': lambda: model.rhs(y0, 100.0),
+    'MetaPopulationModel.jac': lambda: model.jac(y0, 100.0),
+}
+macro = {
+    'meta_population_solution': lambda: meta_population_solution(days, pars[0], betas, gamma, pars[5], pars[3],
+                                                                 pars[4], Ns, M_c, travel_matrix, init_n=M_c),
+    'meta_population_sample': lambda: meta_population_sample(sampling, pars[0], betas, gamma, pars[5], pars[3],
+                                                             pars[4], shift, Ns, M_c, travel_matrix, init_n=M_c),
+    'objective': lambda: squared_error(pars, *objective_arguments),
+}
+
+results = dict()
+for name, function in micro.items():
+    results[name] = {'time': best_time(function, args.calls), 'rhs_evaluations': None}
+for name, function in macro.items():
+    results[name] = {'time': best_time(function), 'rhs_evaluations': rhs_evaluations(function)}
+if not args.skip_fit:
+    # a single run, with the evaluations counted along (the counting adds a few percent)
+    tic = time.perf_counter()
+    evaluations = rhs_evaluations(full_fit)
+    results['fit (-m 1)'] = {'time': time.perf_counter() - tic, 'rhs_evaluations': evaluations}
+
+baseline = None
+if args.compare is not None:
+    with open(args.compare) as f:
+        baseline = json.load(f)['results']
+
+print('{:<32}{:>14}{:>14}{:>12}'.format('benchmark', 'time', 'RHS evals', 'vs base'))
+for name, result in results.items():
+    wall = result['time']
+    shown = '{:.2f} us'.format(1e6 * wall) if wall < 1e-3 else '{:.3f} s'.format(wall)
+    evaluations = '' if result['rhs_evaluations'] is None else str(result['rhs_evaluations'])
+    ratio = ''
+    if baseline is not None and name in baseline:
+        ratio = '{:.2f}x'.format(baseline[name]['time'] / wall)
+    print('{:<32}{:>14}{:>14}{:>12}'.format(name, shown, evaluations, ratio))
+
+if args.save is not None:
+    with open(args.save, 'w') as f:
+        json.dump({'python': platform.python_version(), 'numpy': np.__version__, 'scipy': scipy.__version__,
+                   'machine': platform.platform(), 'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                   'results': results}, f, indent=1)
@@ -0,0 +1,7 @@
+from tools import calibrate_solvers, format_calibration
+from config import get_arguments
+
+if __name__ == '__main__':
+    args = get_arguments()
+    runs, best = calibrate_solvers(args)
+    print(format_calibration(runs, best))
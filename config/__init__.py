@@ -1,2 +1 @@
-
-from config.config import get_arguments
+from config.config import get_arguments, default_arguments
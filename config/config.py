@@ -52,8 +52,64 @@ parser.add_argument('-min_init', type=float, action='store', default=4.0,
 parser.add_argument('-noise', type=float, action='store', default=0.0,
                     dest='noise', help='noise for synthetic experiments')
 
+parser.add_argument('-cs', type=int, action='store', nargs='+', default=[3],
+                    dest='cs', help='numbers of cities of the sweep')
+parser.add_argument('-models', type=str, action='store', nargs='+', default=['gauss'],
+                    choices=['data', 'gauss', 'gamma', 'negbinom'],
+                    dest='models', help='noise models of the sweep (data for the observed cases)')
+parser.add_argument('-noises', type=float, action='store', nargs='+', default=[0.0],
+                    dest='noises', help='noise levels of the sweep')
+parser.add_argument('-losses', type=str, action='store', nargs='+', default=['repeated'],
+                    choices=['squared', 'undercount', 'repeated'],
+                    dest='losses', help='losses of the sweep')
+
 parser.add_argument('-m', type=int, action='store', default=100,
                     dest='m', help='number of different initial conditions')
+parser.add_argument('-workers', type=int, action='store', default=1,
+                    dest='workers', help='number of worker processes for the restarts')
+parser.add_argument('-seed', type=int, action='store', default=None,
+                    dest='seed', help='seed of the random initial conditions')
+parser.add_argument('-weight', type=float, action='store', default=0.5,
+                    dest='weight', help='exponent of the cases weighting the residuals')
+parser.add_argument('-tols', type=float, action='store', nargs='+', default=[1e-11],
+                    dest='tols', help='integration tolerances of the fitting stages')
+parser.add_argument('-periods', type=int, action='store', nargs='+', default=[1],
+                    dest='periods', help='data aggregation periods (in days) of the fitting stages')
+parser.add_argument('-solver', type=str, action='store', default='odeint',
+                    choices=['odeint', 'lsoda', 'radau', 'bdf', 'rk', 'auto'],
+                    dest='solver', help='ODE solver (odeint, solve_ivp with LSODA, Radau or BDF, explicit rk, '
+                                        'or auto for the choice of the solver calibration)')
+parser.add_argument('-calibration', type=str, action='store', default=None,
+                    dest='calibration', help='solver calibration of calibrate.py used by -solver auto '
+                                             '(default results/<name>_solvers.json)')
+parser.add_argument('-error', type=float, action='store', default=1e-6,
+                    dest='error', help='largest relative error of the samples accepted by the solver calibration')
+parser.add_argument('-screen', type=int, action='store', default=1,
+                    dest='screen', help='number of random points every restart screens its starting point from')
+parser.add_argument('-keep', type=float, action='store', default=0.2,
+                    dest='keep', help='fraction of candidates kept after each fitting stage')
+parser.add_argument('-budgets', type=int, action='store', nargs='+', default=[0],
+                    dest='budgets', help='maximal optimiser iterations of the fitting stages (0 until convergence)')
+parser.add_argument('-warm', type=int, action='store', default=5,
+                    dest='warm', help='number of optima a rolling refit keeps and restarts from')
+parser.add_argument('-cache', type=int, action='store', default=128,
+                    dest='cache', help='number of model solutions kept in the cache of every process')
+parser.add_argument('-log', type=str, action='store', default=None,
+                    dest='log', help='JSON lines file the solver and restart statistics are appended to')
+parser.add_argument('-particles', type=int, action='store', default=500,
+                    dest='particles', help='effective number of particles of the posterior sampler')
+parser.add_argument('-max_particles', type=int, action='store', default=None,
+                    dest='max_particles', help='maximal number of particles of a generation (4 * particles if not set)')
+parser.add_argument('-generations', type=int, action='store', default=10,
+                    dest='generations', help='number of generations of the posterior sampler')
+parser.add_argument('-quantile', type=float, action='store', default=0.5,
+                    dest='quantile', help='quantile of the distances giving the next tolerance of the sampler')
+parser.add_argument('-min_acceptance', type=float, action='store', default=0.01,
+                    dest='min_acceptance', help='acceptance rate below which the sampler stops')
+parser.add_argument('-points', type=int, action='store', default=20,
+                    dest='points', help='number of grid points of every profile')
+parser.add_argument('-level', type=float, action='store', default=0.95,
+                    dest='level', help='confidence level of the profile likelihood intervals')
 parser.add_argument('-r', type=int, action='store', default=1,
                     dest='r', help='number of sample repeats')
 
@@ -70,13 +126,36 @@ parser.add_argument('--phi', action='store_const', default=False, const=True, de
 parser.add_argument('--shift', action='store_const', default=False, const=True, dest='fit_shift',
                     help='whether to fit shift')
 
+parser.add_argument('--gradient', action='store_const', default=False, const=True, dest='gradient',
+                    help='whether to use exact gradients from the sensitivity equations')
+parser.add_argument('--weighted', action='store_const', default=False, const=True, dest='weighted',
+                    help='whether the residuals are weighted by the number of cases')
+
 parser.add_argument('--negative_cases', action='store_const', default=False, const=True, dest='negative_cases',
                     help='whether negative case counts are possible (for synthetic experiments)')
+parser.add_argument('--demographic', action='store_const', default=False, const=True, dest='demographic',
+                    help='whether synthetic cases follow the stochastic model (for synthetic experiments)')
 parser.add_argument('--neglect_zeros', action='store_const', default=False, const=True, dest='neglect_zeros',
                     help='whether non-positive case counts should be neglected (for synthetic experiments)')
 
-args = parser.parse_args()
-
 
-def get_arguments():
+def get_arguments(argv=None):
+    """
+    :param argv: command line options, None for the ones of the running script (list)
+    :return: settings (argparse.Namespace)
+    """
+    return parser.parse_args(argv)
+
+
+def default_arguments(**settings):
+    """
+    Settings of the command line defaults, for the programmatic use of the experiments.
+    :param settings: settings replacing the defaults, by the name of their field (dict)
+    :return: settings (argparse.Namespace)
+    """
+    args = parser.parse_args([])
+    for name, value in settings.items():
+        if not hasattr(args, name):
+            raise ValueError('unknown setting {}'.format(name))
+        setattr(args, name, value)
     return args
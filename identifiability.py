@@ -0,0 +1,16 @@
+from tools import profile_parameters, format_stages, format_cache, solution_cache
+from tools.api import parameter_names
+from config import get_arguments
+
+if __name__ == '__main__':
+    args = get_arguments()
+    tasks, results, stages, schedule = profile_parameters(args)
+    print(format_stages(stages, schedule))
+
+    for task, saved in zip(tasks, results):
+        print(task['label'])
+        for k, name in enumerate(parameter_names):
+            lower, upper = saved[name + '_interval']
+            print('{:>8}: optimum {:.4g}, {:g}% interval [{:.4g}, {:.4g}]'.format(name, saved['optimum'][k],
+                                                                                100 * args.level, lower, upper))
+    print(format_cache(solution_cache.info()))
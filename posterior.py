@@ -0,0 +1,16 @@
+from tools import sample_posterior, format_history, format_cache, solution_cache
+from tools.api import parameter_names
+from config import get_arguments
+
+if __name__ == '__main__':
+    args = get_arguments()
+    tasks, samplers = sample_posterior(args)
+    for task, sampler in zip(tasks, samplers):
+        mean, quantiles = sampler.summary()
+
+        print(task['label'])
+        print(format_history(sampler.history))
+        for name, value, (lower, median, upper) in zip(parameter_names, mean, quantiles.T):
+            print('{:>8}: mean {:.4g}, median {:.4g}, 95% interval [{:.4g}, {:.4g}]'.format(name, value, median,
+                                                                                           lower, upper))
+    print(format_cache(solution_cache.info()))
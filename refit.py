@@ -0,0 +1,8 @@
+from tools import refit, format_stages, format_cache, solution_cache
+from config import get_arguments
+
+if __name__ == '__main__':
+    args = get_arguments()
+    ws, stages, schedule = refit(args, 'data')
+    print(format_stages(stages, schedule))
+    print(format_cache(solution_cache.info()))
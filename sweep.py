@@ -0,0 +1,9 @@
+from tools import run_sweep, format_stages, format_cache, solution_cache
+from config import get_arguments
+
+if __name__ == '__main__':
+    args = get_arguments()
+    tasks, results, stages, schedule = run_sweep(args)
+    print('{} tasks, {} restarts each'.format(len(tasks), args.m))
+    print(format_stages(stages, schedule))
+    print(format_cache(solution_cache.info()))
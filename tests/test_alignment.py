@@ -0,0 +1,102 @@
+import os
+
+import numpy as np
+import pytest
+
+from tools import Alignment, load_alignment, parse_beast_alignment
+
+# 70 sites, so that the rows span three words of codes, with gaps, ambiguity codes and lower case
+sequences = {'26237_7_46_8406_I1': 'ACGT' * 17 + 'AC',
+             '26237_7_59_8397_I3': 'acgt' * 17 + 'GG',
+             '26268_1_69_8422_I2': 'A-GTN' * 14,
+             '26268_1_302_8449_I3': 'TTGCARYA' * 8 + 'CCGGTT'}
+dates = {'26237_7_46_8406_I1': '8406', '26237_7_59_8397_I3': '8397', '26268_1_69_8422_I2': '2193-01-01'}
+demes = {taxon: taxon[-2:] for taxon in sequences}
+
+
+def beast_xml(sequences, dates, demes):
+    lines = ['<?xml version="1.0" encoding="UTF-8" standalone="no"?><beast version="2.0">',
+             '<data id="threecity" spec="Alignment" name="alignment">']
+    # the second sequence is given as text, split over lines, the others as the value attribute
+    for k, (taxon, sequence) in enumerate(sequences.items()):
+        if k == 1:
+            lines.append('<sequence id="seq_{0}" spec="Sequence" taxon="{0}" totalcount="4">\n{1}\n{2}\n'
+                         '</sequence>'.format(taxon, sequence[:30], sequence[30:]))
+        else:
+            lines.append('<sequence id="seq_{0}" spec="Sequence" taxon="{0}" totalcount="4" value="{1}"/>'.format(
+                taxon, sequence))
+    lines.append('</data>')
+    lines.append('<trait id="types" spec="beast.evolution.tree.TraitSet" traitname="type" value="{}">'
+                 '<taxa id="taxa" spec="TaxonSet"><alignment idref="threecity"/></taxa></trait>'.format(
+                     ','.join('{}={}'.format(taxon, deme) for taxon, deme in demes.items())))
+    lines.append('<trait id="dateTrait" spec="beast.evolution.tree.TraitSet" traitname="date">\n{}\n'
+                 '<taxa id="TaxonSet" spec="TaxonSet"><alignment idref="threecity"/></taxa></trait>'.format(
+                     ',\n'.join('{}={}'.format(taxon, date) for taxon, date in dates.items())))
+    lines.append('</beast>')
+    return '\n'.join(lines)
+
+
+def expected_sequence(sequence):
+    return ''.join(site if site in 'ACGT' else 'N' for site in sequence.upper())
+
+
+def check_alignment(alignment, sequences):
+    assert list(alignment.taxa) == list(sequences)
+    assert len(alignment) == len(sequences) and alignment.length == 70
+    for i, sequence in enumerate(sequences.values()):
+        assert alignment.sequence(i) == expected_sequence(sequence)
+
+
+def test_parse_beast_alignment(tmp_path):
+    path = tmp_path / 'threecity.xml'
+    path.write_text(beast_xml(sequences, dates, demes))
+    parse_beast_alignment(str(path), str(tmp_path / 'cache'))
+
+    assert sorted(os.listdir(tmp_path / 'cache')) == ['codes.npy', 'mask.npy', 'meta.npz']
+    with np.load(tmp_path / 'cache' / 'meta.npz') as meta:
+        alignment = Alignment(meta['taxa'], meta['dates'], meta['length'], np.load(tmp_path / 'cache' / 'codes.npy'),
+                              np.load(tmp_path / 'cache' / 'mask.npy'), {'type': meta['trait_type']})
+    check_alignment(alignment, sequences)
+
+    # rows of codes and mask are whole 64 bit words
+    assert alignment.codes.dtype == np.uint8 and alignment.codes.shape == (4, 24)
+    assert alignment.mask.dtype == np.uint8 and alignment.mask.shape == (4, 16)
+    np.testing.assert_array_equal(alignment.dates, np.array(['1993-01-06', '1992-12-28', '2193-01-01', 'NaT'],
+                                                            dtype='datetime64[D]'))
+    assert list(alignment.traits['type']) == ['I1', 'I3', 'I2', 'I3']
+    assert list(alignment.isolates()) == ['26237_7#46', '26237_7#59', '26268_1#69', '26268_1#302']
+
+
+def test_cache_round_trip(tmp_path):
+    path, cache = tmp_path / 'threecity.xml', str(tmp_path / 'threecity.alignment')
+    path.write_text(beast_xml(sequences, dates, demes))
+
+    built = load_alignment(str(path))
+    assert os.path.isdir(cache)
+    check_alignment(built, sequences)
+
+    # an unchanged file is read from the cache, memory-mapped and equal to the parsed alignment
+    os.utime(os.path.join(cache, 'codes.npy'), ns=(0, 0))
+    loaded = load_alignment(str(path), cache=cache, mmap_mode='r')
+    assert os.stat(os.path.join(cache, 'codes.npy')).st_mtime_ns == 0
+    assert isinstance(loaded.codes, np.memmap) and isinstance(loaded.mask, np.memmap)
+    np.testing.assert_array_equal(loaded.codes, built.codes)
+    np.testing.assert_array_equal(loaded.mask, built.mask)
+    np.testing.assert_array_equal(loaded.dates, built.dates)
+    check_alignment(loaded, sequences)
+    del loaded
+
+    # an edited file rebuilds the cache in place, leaving no temporary directory behind
+    edited = dict(sequences)
+    edited['26237_7_46_8406_I1'] = 'T' * 70
+    path.write_text(beast_xml(edited, dates, demes))
+    check_alignment(load_alignment(str(path), cache=cache), edited)
+    assert sorted(os.listdir(tmp_path)) == ['threecity.alignment', 'threecity.xml']
+    assert sorted(os.listdir(cache)) == ['codes.npy', 'mask.npy', 'meta.npz', 'source']
+
+
+def test_sequences_of_different_lengths_are_rejected(tmp_path):
+    path = tmp_path / 'threecity.xml'
+    path.write_text(beast_xml(dict(sequences, extra_1_1_1_I1='ACGT'), dates, demes))
+    with pytest.raises(ValueError, match='extra_1_1_1_I1'):
+        parse_beast_alignment(str(path), str(tmp_path / 'cache'))
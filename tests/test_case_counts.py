@@ -0,0 +1,98 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from tools import build_case_counts, load_case_counts, load_full_dataset, load_specific_city_dates
+
+records = [('Human', 'O1', '03/02/1992', 'Tartagal, Salta'),
+           ('Human', 'O1', '03/02/1992', 'Tartagal, Salta'),
+           ('Human', 'O1', '10/02/1992', 'Oran, Salta'),
+           ('Human', 'O1', '12/02/1992', 'Pericho, Jujuy'),
+           ('Human', 'O1', '20/02/1992', 'Jujuy'),
+           ('Human', 'O1', '01/03/1992', 'San Miguel de Tucuman'),
+           ('Human', 'O1', '05/03/1992', 'Tartagal, Salta'),
+           ('Environmental', 'O1', '05/03/1992', 'Tartagal, Salta'),
+           ('Human', 'O139', '06/03/1992', 'Tartagal, Salta'),
+           ('Human', 'O1', None, 'Tartagal, Salta')]
+windows = [('Tartagal', '1992-02-01', '1992-03-31'), ('Tartagal', '1992-03-01', '1992-03-05'),
+           ('Jujuy', '1992-02-12', '1992-02-25'), ('Oran', '1992-01-01', '1992-02-10'),
+           ('Salta', '1992-02-01', '1992-03-31')]
+
+
+def write_dataset(path, rows):
+    frame = pd.DataFrame(rows, columns=['Origin', 'Serogroup.x', 'Isolate.date', 'Geographic.origin_NR'])
+    frame.to_csv(path)
+
+
+def assert_windows_equal(case_counts, path):
+    data = load_full_dataset(path)
+    for window in windows:
+        dates, counts = load_specific_city_dates(case_counts, *window)
+        expected_dates, expected_counts = load_specific_city_dates(data, *window)
+        np.testing.assert_array_equal(dates, expected_dates)
+        np.testing.assert_array_equal(counts, expected_counts)
+
+
+def test_windows_match_the_csv_loaders(tmp_path):
+    source, store = str(tmp_path / 'dataset.csv'), str(tmp_path / 'case_counts.npz')
+    write_dataset(source, records)
+
+    assert_windows_equal(build_case_counts(load_full_dataset(source)), source)
+    load_case_counts(store, source)
+    assert_windows_equal(load_case_counts(store, source), source)
+
+    # windows reaching beyond the calendar of the store are padded with zeros
+    case_counts = load_case_counts(store, source)
+    window = case_counts.window('Tartagal', '1992-01-30', '1992-02-04')
+    np.testing.assert_array_equal(window, [0, 0, 0, 0, 2, 0])
+    assert case_counts.window('Tartagal', '1993-01-01', '1993-01-10').sum() == 0
+
+
+def test_store_is_rebuilt_when_the_dataset_changes(tmp_path):
+    source, store = str(tmp_path / 'dataset.csv'), str(tmp_path / 'case_counts.npz')
+    write_dataset(source, records)
+    load_case_counts(store, source)
+    built = os.stat(store).st_mtime_ns
+
+    # an unchanged dataset is read from the store, which is not written again
+    os.utime(store, ns=(0, 0))
+    load_case_counts(store, source)
+    assert os.stat(store).st_mtime_ns == 0
+    assert built != 0
+
+    write_dataset(source, records + [('Human', 'O1', '07/03/1992', 'Tartagal, Salta')])
+    case_counts = load_case_counts(store, source)
+    assert os.stat(store).st_mtime_ns != 0
+    assert_windows_equal(case_counts, source)
+    assert_windows_equal(load_case_counts(store, source), source)
+    assert case_counts.window('Tartagal', '1992-03-07', '1992-03-07')[0] == 1
+
+    # the store is replaced at once, no temporary file is left behind
+    assert sorted(os.listdir(tmp_path)) == ['case_counts.npz', 'dataset.csv']
+    with np.load(store) as stored:
+        assert set(stored.files) == {'cities', 'first_date', 'counts', 'source'}
+
+
+def test_failed_rebuild_keeps_the_previous_store(tmp_path, monkeypatch):
+    source, store = str(tmp_path / 'dataset.csv'), str(tmp_path / 'case_counts.npz')
+    write_dataset(source, records)
+    load_case_counts(store, source)
+    with open(store, 'rb') as f:
+        previous = f.read()
+
+    def partial_write(f, **arrays):
+        f.write(b'PK partial')
+        raise OSError('disk full')
+
+    write_dataset(source, records[:3])
+    monkeypatch.setattr(np, 'savez', partial_write)
+    with pytest.raises(OSError):
+        load_case_counts(store, source)
+    monkeypatch.undo()
+
+    with open(store, 'rb') as f:
+        assert f.read() == previous
+    assert sorted(os.listdir(tmp_path)) == ['case_counts.npz', 'dataset.csv']
+    assert_windows_equal(load_case_counts(store, source), source)
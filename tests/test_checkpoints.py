@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+
+from tools import SolutionCheckpoints, integrator, meta_population_solution, solution_checkpoints, synthetic_network
+
+M_c = 3
+Ns, travel_matrix, _ = synthetic_network(M_c, seed=2)
+beta = np.array([0.3, 0.4, 0.35])
+parameters = (0.9, beta, 1.0 / 7.0, 1.0, 0.5, 20.0, Ns, M_c, travel_matrix)
+
+
+@pytest.fixture(autouse=True)
+def empty_checkpoints():
+    solution_checkpoints.clear()
+    yield
+    solution_checkpoints.clear()
+
+
+def checkpoint(t, pars=parameters):
+    solution_checkpoints.add(SolutionCheckpoints.key(*pars, M_c), t, meta_population_solution(t, *pars, init_n=M_c))
+
+
+def test_extended_solution_matches_a_full_solve():
+    full = meta_population_solution(np.arange(0.0, 120.0), *parameters, init_n=M_c)
+    checkpoint(np.arange(0.0, 90.0))
+
+    extended = meta_population_solution(np.arange(0.0, 120.0), *parameters, init_n=M_c)
+    assert solution_checkpoints.hits == 1
+    np.testing.assert_allclose(extended, full, rtol=1e-7, atol=1e-6)
+
+    # times within the checkpoint are read from it as they are
+    known = meta_population_solution(np.arange(10.0, 50.0, 5.0), *parameters, init_n=M_c)
+    assert solution_checkpoints.hits == 2
+    np.testing.assert_array_equal(known, solution_checkpoints.entries[SolutionCheckpoints.key(*parameters, M_c)][1]
+                                  [10:50:5])
+
+
+def test_checkpoint_of_other_parameters_is_not_used():
+    checkpoint(np.arange(0.0, 90.0))
+    other = (parameters[0], 1.1 * beta) + parameters[2:]
+    output = meta_population_solution(np.arange(0.0, 120.0), *other, init_n=M_c)
+    assert solution_checkpoints.hits == 0
+    np.testing.assert_array_equal(output, meta_population_solution(np.arange(0.0, 120.0), *other, init_n=M_c))
+
+    # nor is a checkpoint that does not start at the first time
+    meta_population_solution(np.arange(-5.0, 120.0), *parameters, init_n=M_c)
+    assert solution_checkpoints.hits == 0
+
+
+def test_checkpoints_survive_saving_and_loading(tmp_path):
+    checkpoint(np.arange(0.0, 90.0))
+    checkpoint(np.arange(0.0, 60.0, 0.5), (parameters[0], 1.1 * beta) + parameters[2:])
+    assert len(solution_checkpoints) == 2
+    saved = dict(solution_checkpoints.entries)
+    solution_checkpoints.save(str(tmp_path / 'checkpoints.npz'))
+
+    loaded = SolutionCheckpoints()
+    loaded.load(str(tmp_path / 'checkpoints.npz'))
+    assert loaded.entries.keys() == saved.keys()
+    for key, (t, output) in saved.items():
+        np.testing.assert_array_equal(loaded.entries[key][0], t)
+        np.testing.assert_array_equal(loaded.entries[key][1], output)
+
+
+def test_checkpoint_of_another_solver_is_not_used():
+    checkpoint(np.arange(0.0, 90.0))
+    try:
+        integrator.select('radau')
+        meta_population_solution(np.arange(0.0, 120.0), *parameters, init_n=M_c)
+        assert solution_checkpoints.hits == 0
+    finally:
+        integrator.select('odeint')
+    meta_population_solution(np.arange(0.0, 120.0), *parameters, init_n=M_c)
+    assert solution_checkpoints.hits == 1
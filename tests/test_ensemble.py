@@ -0,0 +1,73 @@
+import numpy as np
+
+from tools import (meta_population_sample, meta_population_ensemble_sample, squared_error, repeated_squared_error,
+                   undercount_error, screened_point, evaluate_points, sample_arguments, solution_cache,
+                   synthetic_network, SamplingPlan)
+from tools.fitting_tools import random_initial_point
+
+M_c = 3
+Ns, travel_matrix, _ = synthetic_network(M_c, seed=2)
+plan = SamplingPlan({city: np.arange(5 + 2 * j, 400, 7) for j, city in enumerate(['a', 'b', 'c'])}, 0)
+gamma = 1.0 / 7.0
+
+
+def test_ensemble_matches_serial_solves():
+    rng = np.random.default_rng(0)
+    K = 5
+    asym, phi = rng.random(K), 2.0 * np.pi * rng.random(K)
+    beta, t_0, init = 0.2 + 0.2 * rng.random((K, M_c)), rng.random(K), 1.0 + 20.0 * rng.random(K)
+
+    ensemble = meta_population_ensemble_sample(plan, asym, beta, gamma, phi, t_0, init, 0, Ns, M_c, travel_matrix,
+                                               init_n=M_c)
+    assert ensemble.shape == (K, len(plan))
+    for k in range(K):
+        serial = meta_population_sample(plan, asym[k], beta[k], gamma, phi[k], t_0[k], init[k], 0, Ns, M_c,
+                                        travel_matrix, init_n=M_c)
+        np.testing.assert_allclose(ensemble[k], serial, rtol=1e-7, atol=1e-7 * np.abs(serial).max())
+
+
+def test_screening_picks_the_best_serial_point():
+    y_sample = meta_population_sample(plan, 0.9, 0.3, gamma, 1.0, 0.5, 10.0, 0, Ns, M_c, travel_matrix,
+                                      init_n=M_c)
+    arguments = (0, gamma, Ns, M_c, travel_matrix, plan, y_sample, 14, None, 1e-8)
+
+    chosen = screened_point(np.random.default_rng(4), 20, squared_error, arguments)
+    rng = np.random.default_rng(4)
+    points = [random_initial_point(rng) for _ in range(20)]
+    values = [squared_error(point, *arguments) for point in points]
+    np.testing.assert_array_equal(chosen, points[int(np.argmin(values))])
+    # the ensemble samples are only provided while screening
+    assert len(solution_cache.provided) == 0
+
+
+def test_screening_unpacks_the_arguments_by_name():
+    y_sample = meta_population_sample(plan, 0.9, 0.3, gamma, 1.0, 0.5, 10.0, 0, Ns, M_c, travel_matrix,
+                                      init_n=M_c)
+    r = 2
+    # repeated_squared_error with the default tolerance, and undercount_error with a given one
+    problems = [(repeated_squared_error, (0, gamma, Ns, M_c, travel_matrix, plan, np.repeat(y_sample, r), 14, r,
+                                          np.repeat(True, r * y_sample.shape[0]))),
+                (undercount_error, (0, gamma, Ns, M_c, travel_matrix, plan, y_sample, 14, 1e-8))]
+    for objective, arguments in problems:
+        assert sample_arguments(objective, arguments)[-2:] == (14, 1e-11 if objective is repeated_squared_error
+                                                               else 1e-8)
+        misses = solution_cache.info()['misses']
+        chosen = screened_point(np.random.default_rng(5), 20, objective, arguments)
+        # all the points come from the ensemble solve
+        assert solution_cache.info()['misses'] == misses
+
+        rng = np.random.default_rng(5)
+        points = [random_initial_point(rng) for _ in range(20)]
+        values = [objective(point, *arguments) for point in points]
+        np.testing.assert_array_equal(chosen, points[int(np.argmin(values))])
+
+
+def test_other_objectives_are_evaluated_point_by_point():
+    def distance(x, centre):
+        return np.sum((x - centre)**2)
+
+    centre = np.array([0.5, 0.1, 0.1, 10.0, 10.0, 3.0])
+    assert sample_arguments(distance, (centre,)) is None
+    points = np.random.default_rng(6).random((4, 6))
+    np.testing.assert_array_equal(evaluate_points(points, distance, (centre,)),
+                                  [distance(point, centre) for point in points])
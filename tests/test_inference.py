@@ -0,0 +1,76 @@
+import numpy as np
+
+from scipy.stats import multivariate_normal
+
+from tools import ABCSMC, meta_population_sample, solution_cache, squared_error, synthetic_network, SamplingPlan
+
+centre = np.array([0.4, 0.05, 0.12, 7.0, 3.0, 2.0])
+limits = [[0.0, 1.0], [0.0, None], [0.0, None], [0.0, None], [0.0, None], [0.0, 2.0 * np.pi]]
+
+
+def distance(x, scale):
+    return np.sum(((x - centre) / scale)**2)
+
+
+problem = (distance, (np.array([0.2, 0.02, 0.02, 4.0, 4.0, 1.0]),), limits, None)
+
+
+def test_generations_accept_within_the_tolerance_with_importance_weights():
+    sampler = ABCSMC(particles=200, seed=1).run(problem, 2)
+    previous_theta, previous_weights = sampler.theta.copy(), sampler.weights.copy()
+    previous_distances = sampler.distances.copy()
+    sampler.run(problem, 3)
+    record = sampler.history[-1]
+
+    # every particle is within the tolerance, a quantile of the previous distances
+    assert record['epsilon'] == np.quantile(previous_distances, 0.5)
+    assert np.all(sampler.distances <= record['epsilon'])
+    np.testing.assert_array_equal(sampler.distances, [distance(x, *problem[1]) for x in sampler.theta])
+    assert np.all((sampler.theta >= sampler.bounds[:, 0]) & (sampler.theta <= sampler.bounds[:, 1]))
+    assert record['acceptance'] == record['particles'] / record['evaluations']
+
+    # the weights are the uniform prior over the mixture of the perturbation kernels
+    covariance = 2.0 * np.cov(previous_theta.T, aweights=previous_weights)
+    covariance += 1e-12 * np.diag((sampler.bounds[:, 1] - sampler.bounds[:, 0])**2)
+    mixture = sum(w * multivariate_normal(mean, covariance).pdf(sampler.theta)
+                  for mean, w in zip(previous_theta, previous_weights))
+    np.testing.assert_allclose(sampler.weights, (1.0 / mixture) / (1.0 / mixture).sum(), rtol=1e-8)
+    np.testing.assert_allclose(record['ess'], 1.0 / (sampler.weights**2).sum())
+
+    # the tolerance shrinks and the population concentrates around the minimum
+    epsilons = [record['epsilon'] for record in sampler.history]
+    assert epsilons[0] == np.inf and epsilons[1] > epsilons[2]
+    assert np.all(np.abs(sampler.summary()[0] - centre) < problem[1][0])
+
+
+def test_resumed_sampler_matches_an_uninterrupted_one(tmp_path):
+    full = ABCSMC(str(tmp_path / 'full.npz'), particles=100, seed=2).run(problem, 4)
+
+    ABCSMC(str(tmp_path / 'resumed.npz'), particles=100, seed=2).run(problem, 2)
+    resumed = ABCSMC(str(tmp_path / 'resumed.npz'), particles=100, seed=2)
+    assert resumed.generation == 1
+    resumed.run(problem, 4)
+
+    np.testing.assert_array_equal(resumed.theta, full.theta)
+    np.testing.assert_array_equal(resumed.weights, full.weights)
+    np.testing.assert_array_equal(resumed.distances, full.distances)
+    assert [record['epsilon'] for record in resumed.history] == [record['epsilon'] for record in full.history]
+
+
+def test_model_proposals_are_evaluated_in_ensemble_solves():
+    M_c = 3
+    Ns, travel_matrix, _ = synthetic_network(M_c, seed=2)
+    plan = SamplingPlan({city: np.arange(5 + 2 * j, 300, 7) for j, city in enumerate(['a', 'b', 'c'])}, 0)
+    y_sample = meta_population_sample(plan, 0.9, 0.05, 1.0 / 7.0, 1.0, 0.5, 10.0, 0, Ns, M_c, travel_matrix,
+                                      init_n=M_c)
+    model_problem = (squared_error, (0, 1.0 / 7.0, Ns, M_c, travel_matrix, plan, y_sample, 14, None, 1e-8),
+                     limits, None)
+
+    sampler = ABCSMC(particles=10, ensemble=4)
+    points = np.random.default_rng(3).random((10, 6)) * np.array([1.0, 0.1, 0.1, 10.0, 10.0, 6.0])
+    misses = solution_cache.info()['misses']
+    distances = sampler.evaluate(points, model_problem, 1)
+    assert solution_cache.info()['misses'] == misses
+    serial = [squared_error(x, *model_problem[1]) for x in points]
+    np.testing.assert_allclose(distances, serial, rtol=1e-5)
+    np.testing.assert_allclose(sampler.evaluate(points, model_problem, 2), distances, rtol=1e-5)
@@ -0,0 +1,31 @@
+import argparse
+
+import numpy as np
+
+from tools import ResultStore, fidelity_ladder, multi_start
+
+centre = np.array([0.4, 0.05, 0.12, 7.0, 3.0, 2.0])
+limits = [[0.0, 1.0], [0.0, None], [0.0, None], [0.0, None], [0.0, None], [0.0, 2.0 * np.pi]]
+
+
+def objective(x, scale):
+    return np.sum((x - scale * centre)**2) + 0.1 * (1.0 - np.cos(3.0 * x[5]))
+
+
+def test_restarts_do_not_depend_on_the_workers():
+    serial = multi_start(objective, (1.0,), limits, 6, seed=11)
+    np.testing.assert_array_equal(multi_start(objective, (1.0,), limits, 6, seed=11, workers=2), serial)
+    np.testing.assert_array_equal(multi_start(objective, (1.0,), limits, 6, seed=11), serial)
+    assert not np.array_equal(multi_start(objective, (1.0,), limits, 6, seed=12), serial)
+
+
+def test_stored_ladder_does_not_depend_on_the_workers(tmp_path):
+    results = []
+    for workers in (1, 2):
+        store = ResultStore(str(tmp_path / 'run{}'.format(workers)),
+                            argparse.Namespace(seed=5, m=8, workers=workers), len(centre))
+        results.append(fidelity_ladder(objective, [(1.1,), (1.0,)], limits, 8, keep=0.5, seed=store.seed,
+                                       workers=workers, store=store))
+    (ws, _, finals), (parallel_ws, _, parallel_finals) = results
+    np.testing.assert_array_equal(parallel_ws, ws)
+    np.testing.assert_array_equal(parallel_finals, finals)
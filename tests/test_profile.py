@@ -0,0 +1,95 @@
+import numpy as np
+
+import tools.profile_tools
+from tools import mse_threshold, profile_grid, profile_interval, profile_likelihood
+from tools.profile_tools import profile_chain
+
+centre = np.array([0.5, -1.0, 2.0])
+hessian = np.array([[2.0, 0.6, 0.3], [0.6, 1.0, -0.2], [0.3, -0.2, 0.5]])
+minimum = 0.25
+limits = [[-10.0, 10.0]] * 3
+
+
+def quadratic(x, centre, hessian, minimum):
+    return minimum + (x - centre).dot(hessian).dot(x - centre)
+
+
+def quadratic_gradient(x, centre, hessian, minimum):
+    return quadratic(x, centre, hessian, minimum), 2.0 * hessian.dot(x - centre)
+
+
+arguments = (centre, hessian, minimum)
+optimum = np.append(centre, minimum)
+
+
+def analytic_profile(k, value):
+    """
+    Minimum of the quadratic over the other parameters with parameter k fixed at value, and
+    the optimal parameters.
+    """
+    others = [j for j in range(centre.shape[0]) if j != k]
+    x = centre.copy()
+    x[k] = value
+    x[others] -= np.linalg.solve(hessian[np.ix_(others, others)], hessian[others, k]) * (value - centre[k])
+    return minimum + (value - centre[k])**2 / np.linalg.inv(hessian)[k, k], x
+
+
+def test_chain_fixes_the_parameter_and_starts_from_the_previous_optimum(monkeypatch):
+    starts = []
+
+    def recording_start(x0, objective, arguments, limits, gradient=None):
+        starts.append((np.array(x0), [list(limit) for limit in limits]))
+        return local_start(x0, objective, arguments, limits, gradient)
+
+    local_start = tools.profile_tools.local_start
+    monkeypatch.setattr(tools.profile_tools, 'local_start', recording_start)
+
+    values = np.array([1.0, 1.5, 2.5])
+    rows = profile_chain((0, values, centre), quadratic, arguments, limits)
+
+    assert len(rows) == values.shape[0]
+    for i, (row, value) in enumerate(zip(rows, values)):
+        x0, fixed = starts[i]
+        # the parameter is fixed through equal bounds and kept exactly at its value
+        assert fixed[0] == [value, value] and fixed[1:] == limits[1:]
+        assert row[0] == value
+        # the first minimisation starts from the optimum, the next ones from the previous row
+        previous = centre if i == 0 else np.array(rows[i - 1][:-1])
+        np.testing.assert_array_equal(np.delete(x0, 0), np.delete(previous, 0))
+        assert x0[0] == value
+
+        profile, x = analytic_profile(0, value)
+        np.testing.assert_allclose(row[:-1], x, atol=1e-4)
+        np.testing.assert_allclose(row[-1], profile, rtol=1e-6)
+
+
+def test_profiles_and_intervals_match_the_quadratic():
+    n = 40
+    threshold = mse_threshold(minimum, n)
+    grids = {k: profile_grid(centre[k], centre[k] - 1.5, centre[k] + 1.5, 150) for k in range(centre.shape[0])}
+    profiles = profile_likelihood(quadratic, arguments, limits, optimum, grids, gradient=quadratic_gradient)
+
+    for k, (values, profile, parameters) in profiles.items():
+        # the grid is run in increasing order with the optimum in between
+        assert np.all(np.diff(values) > 0)
+        assert values.shape[0] == 151 and centre[k] in values
+        expected = [analytic_profile(k, value) for value in values]
+        np.testing.assert_allclose(profile, [p for p, _ in expected], rtol=1e-8)
+        np.testing.assert_allclose(parameters, [x for _, x in expected], atol=1e-5)
+
+        half_width = np.sqrt((threshold - minimum) * np.linalg.inv(hessian)[k, k])
+        lower, upper = profile_interval(values, profile, threshold)
+        # the linear interpolation of the crossings errs by a fraction of the grid spacing
+        np.testing.assert_allclose([lower, upper], [centre[k] - half_width, centre[k] + half_width], atol=1e-3)
+
+
+def test_interval_is_open_where_the_threshold_is_not_reached():
+    values = np.linspace(-1.0, 1.0, 21)
+    profile = minimum + values**2
+    assert profile_interval(values, profile, minimum + 0.25) == (-0.5, 0.5)
+
+    lower, upper = profile_interval(values, profile, minimum + 4.0)
+    assert lower == -np.inf and upper == np.inf
+
+    lower, upper = profile_interval(values, minimum + np.maximum(values, 0.0)**2, minimum + 0.25)
+    assert lower == -np.inf and upper == 0.5
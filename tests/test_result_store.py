@@ -0,0 +1,58 @@
+import argparse
+import os
+
+import numpy as np
+import pytest
+
+from tools import ResultStore, fidelity_ladder, load_results
+
+centre = np.array([0.4, 0.05, 0.12, 7.0, 3.0, 2.0])
+limits = [[0.0, 1.0], [0.0, None], [0.0, None], [0.0, None], [0.0, None], [0.0, 2.0 * np.pi]]
+# a coarse stage with a shifted optimum and the exact one
+stage_arguments = [(1.1,), (1.0,)]
+
+
+def objective(x, scale):
+    return np.sum((x - scale * centre)**2) + 0.1 * (1.0 - np.cos(3.0 * x[5]))
+
+
+def ladder(path, seed=3, workers=1):
+    store = ResultStore(path, argparse.Namespace(seed=seed, m=8, workers=workers), len(centre))
+    return fidelity_ladder(objective, stage_arguments, limits, 8, keep=0.5, seed=store.seed, workers=workers,
+                           store=store)
+
+
+def test_interrupted_run_resumes_with_the_same_results(tmp_path):
+    ws, stages, finals = ladder(str(tmp_path / 'full'))
+    assert [stage['resumed'] for stage in stages] == [0, 0]
+
+    # a run interrupted in the middle of its first stage, while writing a record
+    path = str(tmp_path / 'interrupted')
+    ladder(path)
+    header, records = load_results(path)
+    width = len(header['columns'])
+    assert records.shape == (8 + 4, width)
+    os.truncate(path + '.rows', 8 * width * 5 + 17)
+
+    resumed_ws, resumed_stages, resumed_finals = ladder(path)
+    assert [stage['resumed'] for stage in resumed_stages] == [5, 0]
+    np.testing.assert_array_equal(resumed_ws, ws)
+    np.testing.assert_array_equal(resumed_finals, finals)
+    assert len(ResultStore(path, argparse.Namespace(seed=3, m=8, workers=1), len(centre))) == 8 + 4
+
+    # a finished run is read from the store as it is
+    _, again, _ = ladder(path)
+    assert [stage['resumed'] for stage in again] == [8, 4]
+
+
+def test_store_refuses_other_settings(tmp_path):
+    ladder(str(tmp_path / 'run'))
+    # the number of workers does not change the results and may differ
+    ResultStore(str(tmp_path / 'run'), argparse.Namespace(seed=3, m=8, workers=4), len(centre))
+    with pytest.raises(ValueError):
+        ResultStore(str(tmp_path / 'run'), argparse.Namespace(seed=4, m=8, workers=1), len(centre))
+
+
+def test_drawn_seed_is_kept_for_the_resumed_run(tmp_path):
+    store = ResultStore(str(tmp_path / 'run'), argparse.Namespace(seed=None), len(centre))
+    assert ResultStore(str(tmp_path / 'run'), argparse.Namespace(seed=None), len(centre)).seed == store.seed
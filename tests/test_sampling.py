@@ -0,0 +1,33 @@
+import numpy as np
+import pytest
+
+from tools import SamplingPlan, meta_population_sample, meta_population_solution, synthetic_network
+
+M_c = 3
+Ns, travel_matrix, _ = synthetic_network(M_c, seed=6)
+parameters = (0.9, np.array([0.3, 0.4, 0.35]), 1.0 / 7.0, 1.0, 0.5, 20.0)
+# sampling days of every city, counted from the shift, with gaps longer and shorter than a window
+sampling = {'a': np.array([3, 10, 30, 31, 80]), 'b': np.array([1, 50, 57]), 'c': np.array([20, 200, 214, 260])}
+
+
+def naive_samples(shift, active_sampling=14):
+    # a dense solve from the shift, read at the sampling days and at the openings of their
+    # windows, which do not open before the shift-th day
+    output = meta_population_solution(np.arange(shift, 300.0), *parameters, Ns, M_c, travel_matrix, init_n=M_c)
+    samples = []
+    for j, days in enumerate(sampling.values()):
+        opening = np.maximum(np.maximum(np.concatenate(([shift], days[:-1])), shift), days - active_sampling)
+        samples.append(output[days, 4 + 5 * j] - output[opening, 4 + 5 * j])
+    return np.concatenate(samples)
+
+
+@pytest.mark.parametrize('shift', [0, 5, 12])
+def test_samples_match_a_dense_solve(shift):
+    samples = meta_population_sample(sampling, *parameters, shift, Ns, M_c, travel_matrix, init_n=M_c)
+    np.testing.assert_allclose(samples, naive_samples(shift), rtol=1e-8, atol=1e-8)
+
+    # the plan solves only up to the last sampling day
+    plan = SamplingPlan(sampling, shift)
+    assert plan.times[0] == shift and plan.times[-1] == shift + 260
+    np.testing.assert_array_equal(
+        meta_population_sample(plan, *parameters, shift, Ns, M_c, travel_matrix, init_n=M_c), samples)
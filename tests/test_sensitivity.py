@@ -0,0 +1,59 @@
+import numpy as np
+
+from tools import (meta_population_sample, meta_population_sample_gradient, model_samples, model_samples_gradient,
+                   solution_cache, synthetic_network, SamplingPlan)
+
+M_c = 3
+Ns, travel_matrix, _ = synthetic_network(M_c, seed=1)
+sampling = {city: np.arange(10 + 3 * j, 500, 7) for j, city in enumerate(['a', 'b', 'c'])}
+gamma = 1.0 / 7.0
+# the tolerance of the fits, and of the references the finite differences are taken from
+tol = 1e-11
+reference_tol = 1e-13
+
+
+def central_differences(at, parameters, h=1e-5):
+    differences = []
+    for k in range(parameters.shape[0]):
+        step = np.zeros(parameters.shape[0])
+        step[k] = h * max(abs(parameters[k]), 1.0)
+        differences.append((at(parameters + step) - at(parameters - step)) / (2.0 * step[k]))
+    return np.array(differences).T
+
+
+def test_gradient_matches_finite_differences():
+    parameters = np.array([0.9, 0.25, 0.3, 0.35, 0.5, 20.0, 1.0])  # asym, betas, t_0, init, phi
+
+    def at(p, tolerance=reference_tol):
+        return meta_population_sample(sampling, p[0], p[1:1 + M_c], gamma, p[3 + M_c], p[1 + M_c], p[2 + M_c], 0,
+                                      Ns, M_c, travel_matrix, init_n=M_c, rtol=tolerance, atol=tolerance)
+
+    values, gradient = meta_population_sample_gradient(sampling, parameters[0], parameters[1:1 + M_c], gamma,
+                                                       parameters[3 + M_c], parameters[1 + M_c],
+                                                       parameters[2 + M_c], 0, Ns, M_c, travel_matrix,
+                                                       init_n=M_c, rtol=tol, atol=tol)
+    differences = central_differences(at, parameters)
+
+    np.testing.assert_allclose(values, at(parameters, tol), rtol=1e-8, atol=1e-6)
+    # the finite differences themselves are accurate to about 1e-7 of the largest derivative
+    scale = np.abs(differences).max(0)
+    assert np.all(np.abs(gradient - differences) <= 1e-6 * scale)
+
+
+def test_fitted_gradient_is_controlled_by_the_tolerance():
+    plan = SamplingPlan(sampling, 0)
+    arguments = (0, gamma, Ns, M_c, travel_matrix, plan, 14)
+    pars = np.array([0.9, 0.12, 0.3, 0.5, 20.0, 1.0])  # asym, beta_1, beta_2, t_0, init, phi
+    size = solution_cache.maxsize
+    solution_cache.resize(0)
+    try:
+        differences = central_differences(lambda p: model_samples(p, *arguments, reference_tol), pars)
+    finally:
+        solution_cache.resize(size)
+
+    values, gradient = model_samples_gradient(pars, *arguments, tol)
+    _, reference = model_samples_gradient(pars, *arguments, reference_tol)
+    scale = np.abs(reference).max(0)
+    assert np.all(np.abs(gradient - differences) <= 1e-6 * scale)
+    # against the sensitivities at a tighter tolerance the error is within a few tolerances
+    assert np.all(np.abs(gradient - reference) <= 100.0 * tol * scale)
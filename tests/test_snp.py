@@ -0,0 +1,43 @@
+import numpy as np
+
+from tools import Alignment, pack_sequence, pairwise_distances, reference_distances
+
+rng = np.random.default_rng(4)
+# not a whole number of words, with gaps, ambiguous sites and lower case bases
+length = 150
+characters = np.array(list('ACGTACGTacgt-NRY'))
+sequences = [''.join(rng.choice(characters, length)) for _ in range(13)]
+# a few close sequences, so that the distances are not all about the same
+sequences[1] = sequences[0][:40] + sequences[1][40:45] + sequences[0][45:]
+
+
+def alignment_of(sequences):
+    codes, mask = zip(*(pack_sequence(sequence) for sequence in sequences))
+    dates = np.datetime64('2010-10-20') + np.arange(len(sequences))
+    return Alignment(np.arange(len(sequences)).astype(str), dates, length, np.array(codes), np.array(mask))
+
+
+def naive_distance(a, b):
+    return sum(x.upper() != y.upper() for x, y in zip(a, b) if x.upper() in 'ACGT' and y.upper() in 'ACGT')
+
+
+def test_pairwise_distances_count_the_snps():
+    naive = np.array([[naive_distance(a, b) for b in sequences] for a in sequences])
+    alignment = alignment_of(sequences)
+    for block in (1, 4, 128):
+        np.testing.assert_array_equal(pairwise_distances(alignment, block=block), naive)
+    assert naive[0, 1] <= 5
+
+
+def test_reference_distances_count_the_snps():
+    reference = ''.join(rng.choice(characters, length))
+    naive = np.array([naive_distance(sequence, reference) for sequence in sequences])
+    np.testing.assert_array_equal(reference_distances(alignment_of(sequences), pack_sequence(reference), block=5),
+                                  naive)
+
+
+def test_sequences_are_unpacked_as_packed():
+    alignment = alignment_of(sequences)
+    for i, sequence in enumerate(sequences):
+        expected = ''.join(x.upper() if x.upper() in 'ACGT' else 'N' for x in sequence)
+        assert alignment.sequence(i) == expected
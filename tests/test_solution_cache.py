@@ -0,0 +1,109 @@
+import numpy as np
+import pytest
+
+from tools import (SolutionCache, integrator, meta_population_sample, meta_population_sample_cached, solution_cache,
+                   synthetic_network)
+
+M_c = 3
+Ns, travel_matrix, _ = synthetic_network(M_c, seed=1)
+sampling = {city: np.arange(10 + 3 * j, 200, 7) for j, city in enumerate(['a', 'b', 'c'])}
+beta = np.array([0.25, 0.3, 0.35])
+
+
+def sample_arguments(beta=beta, travel_matrix=travel_matrix):
+    # sampling, asym, beta, gamma, phi, t_0, init, shift, Ns, M_c, travel_matrix
+    return sampling, 0.9, beta, 1.0 / 7.0, 1.0, 0.5, 20.0, 0, Ns, M_c, travel_matrix
+
+
+def counted(calls):
+    def square(x, power=2):
+        calls.append(x)
+        return np.asarray(x, dtype=float)**power
+    return square
+
+
+@pytest.fixture
+def global_cache():
+    # the state of the cache of the process is restored afterwards
+    state = solution_cache.maxsize, solution_cache.entries.copy(), solution_cache.hits, solution_cache.misses
+    solution_cache.clear()
+    yield solution_cache
+    solution_cache.maxsize, solution_cache.entries, solution_cache.hits, solution_cache.misses = state
+
+
+def test_least_recently_used_results_are_evicted():
+    calls = []
+    square = counted(calls)
+    cache = SolutionCache(maxsize=3)
+
+    for x in [1.0, 2.0, 3.0]:
+        cache(square, np.array([x]))
+    # reading 1 makes 2 the least recently used result, which the fourth one evicts
+    cache(square, np.array([1.0]))
+    cache(square, np.array([4.0]))
+    assert cache.info() == {'hits': 1, 'misses': 4, 'size': 3, 'maxsize': 3}
+
+    cache(square, np.array([1.0]))
+    cache(square, np.array([3.0]))
+    assert len(calls) == 4
+    cache(square, np.array([2.0]))
+    assert len(calls) == 5 and cache.info()['size'] == 3
+
+    # shrinking evicts the oldest results, a size of 0 disables the cache
+    cache.resize(1)
+    assert cache.info()['size'] == 1
+    cache(square, np.array([2.0]))
+    assert len(calls) == 5
+    cache.resize(0)
+    cache(square, np.array([2.0]))
+    assert len(calls) == 6 and cache.info() == {'hits': 4, 'misses': 5, 'size': 0, 'maxsize': 0}
+
+
+def test_results_are_keyed_on_the_values_of_the_arguments():
+    calls = []
+    square = counted(calls)
+    cache = SolutionCache()
+
+    first = cache(square, np.array([1.0, 2.0]))
+    # equal arrays hit, whatever the object, and the stored result is not shared
+    first[0] = -1.0
+    np.testing.assert_array_equal(cache(square, np.array([1.0, 2.0])), [1.0, 4.0])
+    cache(square, np.array([1.0, 2.0]), power=2)
+    assert len(calls) == 2 and cache.hits == 1
+
+    cache(square, np.array([1.0, 2.0]), power=3)
+    cache(square, np.array([1.0, 2.5]))
+    cache(square, np.array([1.0, 2.0], dtype=np.float32))
+    assert len(calls) == 5 and cache.hits == 1 and cache.misses == 5
+
+
+def test_model_samples_hit_for_equal_parameters(global_cache):
+    expected = meta_population_sample(*sample_arguments(), init_n=M_c)
+
+    np.testing.assert_array_equal(meta_population_sample_cached(*sample_arguments(), init_n=M_c), expected)
+    np.testing.assert_array_equal(meta_population_sample_cached(*sample_arguments(beta.copy(), travel_matrix.copy()),
+                                                                init_n=M_c), expected)
+    assert global_cache.info()['hits'] == 1 and global_cache.info()['misses'] == 1
+
+
+def test_model_samples_miss_for_other_parameters_tolerances_or_solver(global_cache):
+    meta_population_sample_cached(*sample_arguments(), init_n=M_c)
+
+    changed_travel = travel_matrix.copy()
+    changed_travel[0, 1] *= 1.01
+    meta_population_sample_cached(*sample_arguments(beta * 1.01), init_n=M_c)
+    meta_population_sample_cached(*sample_arguments(travel_matrix=changed_travel), init_n=M_c)
+    meta_population_sample_cached(*sample_arguments(), init_n=M_c, rtol=1e-8)
+    meta_population_sample_cached(*sample_arguments(), init_n=M_c, atol=1e-8)
+    assert global_cache.info()['hits'] == 0 and global_cache.info()['misses'] == 5
+
+    try:
+        integrator.select('radau')
+        radau = meta_population_sample_cached(*sample_arguments(), init_n=M_c)
+        assert global_cache.info()['hits'] == 0 and global_cache.info()['misses'] == 6
+        np.testing.assert_array_equal(meta_population_sample_cached(*sample_arguments(), init_n=M_c), radau)
+        assert global_cache.info()['hits'] == 1
+    finally:
+        integrator.select('odeint')
+    meta_population_sample_cached(*sample_arguments(), init_n=M_c)
+    assert global_cache.info() == {'hits': 2, 'misses': 6, 'size': 6, 'maxsize': global_cache.maxsize}
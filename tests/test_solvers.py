@@ -0,0 +1,85 @@
+import argparse
+import json
+
+import numpy as np
+import pytest
+
+from tools import (integrator, meta_population_solution, calibrate, load_calibration, meta_population_sample,
+                   solvers, synthetic_network, SamplingPlan)
+from tools.api import start_run
+from tools.solver_tools import reference_tol
+
+M_c = 3
+Ns, travel_matrix, _ = synthetic_network(M_c, seed=8)
+parameters = (0.9, np.array([0.3, 0.4, 0.35]), 1.0 / 7.0, 1.0, 0.5, 20.0)
+t = np.arange(0.0, 400.0, 3.0)
+
+
+@pytest.fixture(autouse=True)
+def default_solver():
+    yield
+    integrator.select('odeint')
+
+
+def solution(name, matrix=travel_matrix, tol=1e-9, **kwargs):
+    integrator.select(name)
+    return meta_population_solution(t, *parameters, Ns, M_c, matrix, init_n=M_c, rtol=tol, atol=tol, **kwargs)
+
+
+@pytest.mark.parametrize('name', list(solvers))
+def test_solver_matches_the_reference(name):
+    reference = solution('odeint', tol=reference_tol)
+    error = np.abs(solution(name) - reference).max() / np.abs(reference).max()
+    assert error < 1e-6
+    # with the banded Jacobian of a sparse network
+    sparse_reference = solution('odeint', matrix=synthetic_network(M_c, seed=8, as_sparse=True)[1], tol=reference_tol)
+    np.testing.assert_allclose(sparse_reference, reference, rtol=1e-8, atol=1e-6)
+    error = np.abs(solution(name, matrix=synthetic_network(M_c, seed=8, as_sparse=True)[1]) - reference).max()
+    assert error < 1e-6 * np.abs(reference).max()
+
+
+@pytest.mark.parametrize('name', ['lsoda', 'radau', 'bdf', 'rk'])
+def test_solver_stops_after_mxstep_steps(name):
+    integrator.select(name)
+    model_rhs = lambda y, s: -y  # noqa: E731
+    with pytest.warns(UserWarning):
+        output, _ = integrator.solve(model_rhs, np.ones(2), np.array([0.0, 1.0, 100.0]), rtol=1e-12, atol=1e-12,
+                                     mxstep=5)
+    assert np.isnan(output[-1]).all()
+    output, statistics = integrator.solve(model_rhs, np.ones(2), np.array([0.0, 1.0, 2.0]), rtol=1e-10,
+                                          atol=1e-10, statistics=True)
+    np.testing.assert_allclose(output[:, 0], np.exp(-np.array([0.0, 1.0, 2.0])), rtol=1e-8)
+    assert statistics['message'] == 'success'
+
+
+def test_calibration_picks_the_fastest_accepted_solver(tmp_path):
+    plan = SamplingPlan({city: np.arange(10 + 3 * j, 300, 7) for j, city in enumerate(['a', 'b', 'c'])}, 0)
+
+    def samples(pars, tol):
+        return meta_population_sample(plan, *pars, 0, Ns, M_c, travel_matrix, init_n=M_c, rtol=tol, atol=tol)
+
+    runs, best = calibrate(samples, [parameters], [1e-4, 1e-9], error=1e-6, names=['odeint', 'rk'])
+    assert [(run['solver'], run['tol']) for run in runs] == [('odeint', 1e-4), ('odeint', 1e-9), ('rk', 1e-4),
+                                                              ('rk', 1e-9)]
+    assert all(run['accepted'] == (run['error'] <= 1e-6) for run in runs)
+    assert not runs[0]['accepted'] and runs[1]['accepted']
+    assert best == min((run for run in runs if run['accepted']), key=lambda run: run['time'])
+    assert integrator.name == 'odeint'
+
+    path = str(tmp_path / 'run_solvers.json')
+    with open(path, 'w') as f:
+        json.dump({'error': 1e-6, 'runs': runs, 'best': best}, f)
+    assert load_calibration(path) == best
+
+    # -solver auto selects the calibrated solver, with a warning for looser tolerances
+    args = argparse.Namespace(solver='auto', calibration=path, name='run', tols=[best['tol']], cache=0, log=None)
+    start_run(args)
+    assert integrator.name == best['solver']
+    args.tols = [10.0 * best['tol']]
+    with pytest.warns(UserWarning):
+        start_run(args)
+
+    with open(path, 'w') as f:
+        json.dump({'error': 0.0, 'runs': runs, 'best': None}, f)
+    with pytest.raises(ValueError):
+        load_calibration(path)
@@ -0,0 +1,30 @@
+import numpy as np
+
+from tools import MetaPopulationModel, meta_population_solution, synthetic_network, initial_conditions
+from tools.solver_tools import banded_to_sparse
+
+M_c = 12
+Ns, travel_sparse, _ = synthetic_network(M_c, seed=3, neighbours=2, as_sparse=True)
+travel_dense = travel_sparse.toarray()
+beta = np.linspace(0.25, 0.4, M_c)
+
+
+def test_banded_jacobian_matches_dense():
+    sparse_model = MetaPopulationModel(0.9, beta, 1.0 / 7.0, 1.0, 0.5, Ns, M_c, travel_sparse)
+    dense_model = MetaPopulationModel(0.9, beta, 1.0 / 7.0, 1.0, 0.5, Ns, M_c, travel_dense)
+    y = initial_conditions(50.0, Ns, M_c, M_c) + np.random.default_rng(0).random(5 * M_c) * 100.0
+
+    np.testing.assert_allclose(sparse_model.rhs(y, 30.0), dense_model.rhs(y, 30.0), rtol=1e-12, atol=1e-12)
+    banded = banded_to_sparse(sparse_model.jac_banded(y, 30.0), sparse_model.ml, sparse_model.mu).toarray()
+    np.testing.assert_allclose(banded, dense_model.jac(y, 30.0), rtol=1e-12, atol=1e-15)
+
+
+def test_sparse_solution_matches_dense():
+    t = np.arange(0.0, 300.0, 5.0)
+    sparse_output = meta_population_solution(t, 0.9, beta, 1.0 / 7.0, 1.0, 0.5, 10.0, Ns, M_c, travel_sparse,
+                                             init_n=2)
+    dense_output = meta_population_solution(t, 0.9, beta, 1.0 / 7.0, 1.0, 0.5, 10.0, Ns, M_c, travel_dense,
+                                            init_n=2)
+    np.testing.assert_allclose(sparse_output, dense_output, rtol=1e-7, atol=1e-7 * Ns.max())
+    # the epidemic reaches the cities without initial cases only through the travel network
+    assert np.all(sparse_output[-1, 4::5] > 0.0)
@@ -0,0 +1,36 @@
+import numpy as np
+import pytest
+
+from tools import (meta_population_cumulative, meta_population_sample, synthetic_data, synthetic_plan,
+                   synthetic_network, SamplingPlan)
+
+M_c = 3
+Ns, travel_matrix, _ = synthetic_network(M_c, seed=7)
+parameters = (0.9, np.array([0.3, 0.4, 0.35]), 1.0 / 7.0, 1.0, 0.5, 20.0)
+sampling = {'a': np.array([8, 15, 30, 31, 80]), 'b': np.array([9, 50, 57]), 'c': np.array([20, 200, 214, 260])}
+shift = 5
+
+
+def test_synthetic_samples_are_taken_at_times():
+    # the synthetic experiments observe every city as meta_population_cumulative does
+    expected = np.concatenate([
+        meta_population_cumulative(days, *parameters, shift, Ns, M_c, travel_matrix, init_n=M_c)[:, 4 + 5 * j]
+        for j, days in enumerate(sampling.values())])
+    y_sample, replicates, flat = synthetic_data(sampling, *parameters, shift, Ns, M_c, travel_matrix, 'gauss', 0.0,
+                                                3, np.random.default_rng(0), init_n=M_c)
+    np.testing.assert_allclose(y_sample, expected, rtol=1e-8, atol=1e-8)
+    np.testing.assert_array_equal(replicates, np.tile(y_sample, (3, 1)))
+    np.testing.assert_array_equal(flat, np.repeat(y_sample, 3))
+
+    # unlike the fits, which read the day d at the time shift + d
+    relative = meta_population_sample(sampling, *parameters, shift, Ns, M_c, travel_matrix, init_n=M_c)
+    assert np.abs(relative - y_sample).max() > 0.01 * np.abs(y_sample).max()
+
+
+def test_synthetic_plan_refuses_days_from_the_shift():
+    plan = synthetic_plan(sampling, shift)
+    assert synthetic_plan(plan, shift) is plan
+    with pytest.raises(ValueError):
+        synthetic_plan(SamplingPlan(sampling, shift), shift)
+    with pytest.raises(ValueError):
+        synthetic_plan(plan, shift + 1)
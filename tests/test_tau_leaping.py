@@ -0,0 +1,41 @@
+import numpy as np
+
+from tools import meta_population_tau_leaping, meta_population_solution, synthetic_network
+
+M_c = 4
+Ns, travel_matrix, _ = synthetic_network(M_c, seed=5)
+beta = np.full(M_c, 0.35)
+t = np.arange(0.0, 200.0, 1.0)
+
+
+def simulate(r, seed):
+    return meta_population_tau_leaping(t, 0.9, beta, 1.0 / 7.0, 1.0, 0.5, 20.0, Ns, M_c, travel_matrix, r,
+                                       np.random.default_rng(seed), init_n=M_c)
+
+
+def test_tau_leaping_conserves_the_populations():
+    output = simulate(20, 0).reshape(t.shape[0], 20, M_c, 5)
+
+    # the compartments hold whole, non-negative individuals, and travel swaps individuals
+    # between the cities, so every city keeps its population
+    assert np.all(output >= 0.0)
+    np.testing.assert_array_equal(output, np.round(output))
+    populations = output[:, :, :, :4].sum(-1)
+    np.testing.assert_array_equal(populations, np.broadcast_to(populations[0], populations.shape))
+    np.testing.assert_array_equal(populations[0], np.broadcast_to(np.round(Ns), (20, M_c)))
+    # the new cases only accumulate
+    assert np.all(np.diff(output[:, :, :, 4], axis=0) >= 0.0)
+
+
+def test_tau_leaping_follows_the_odes_on_average():
+    # over the first weeks, before the cases die out in some of the replicates
+    early = t[:41]
+    mean = meta_population_tau_leaping(early, 0.9, beta, 1.0 / 7.0, 1.0, 0.5, 500.0, Ns, M_c, travel_matrix, 200,
+                                       np.random.default_rng(1), init_n=M_c).mean(1)
+    odes = meta_population_solution(early, 0.9, beta, 1.0 / 7.0, 1.0, 0.5, 500.0, Ns, M_c, travel_matrix,
+                                    init_n=M_c)
+    assert np.abs(mean[:, 4::5] - odes[:, 4::5]).max() < 0.1 * odes[:, 4::5].max()
+
+
+def test_tau_leaping_is_reproducible():
+    np.testing.assert_array_equal(simulate(5, 7), simulate(5, 7))
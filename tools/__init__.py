@@ -1,7 +1,62 @@
+import importlib
 
-from tools.model_tools import meta_population_siarw
-from tools.data_tools import (load_full_dataset, load_specific_city,
-                              load_specific_city_dates, data_travel)
-from tools.integration_tools import (meta_population_sample, meta_population_cumulative,
-                                     meta_population_solution)
-from tools.other_tools import fill_cumsum
+# the names exported by every module; a module (with its scipy and pandas dependencies) is only
+# imported when one of its names is first used, so that e.g. simulating the model does not
+# import the optimisers and the case count data
+_exports = {
+    'model_tools': ['meta_population_siarw', 'MetaPopulationModel', 'MetaPopulationEnsemble',
+                    'MetaPopulationSensitivity', 'MetaPopulationTauLeaping', 'dense_travel', 'beta_classes'],
+    'data_tools': ['load_full_dataset', 'load_specific_city',
+                   'load_specific_city_dates', 'data_travel', 'CaseCounts',
+                   'build_case_counts', 'load_case_counts'],
+    'alignment_tools': ['Alignment', 'load_alignment', 'parse_beast_alignment', 'pack_sequence', 'unpack_codes',
+                        'isolate_id'],
+    'snp_tools': ['pairwise_distances', 'distance_blocks', 'reference_distances', 'consensus_sequence',
+                  'temporal_signal', 'sequence_cities', 'city_distances'],
+    'integration_tools': ['meta_population_sample', 'meta_population_cumulative',
+                          'meta_population_solution', 'initial_conditions', 'sampling_windows',
+                          'sampling_times', 'meta_population_ensemble_solution',
+                          'meta_population_ensemble_sample', 'meta_population_sensitivity',
+                          'meta_population_sample_gradient', 'SolutionCache', 'solution_cache',
+                          'meta_population_sample_cached', 'meta_population_cumulative_cached',
+                          'travel_ordering', 'SolverLog', 'solver_log', 'SamplingPlan', 'sampling_plan',
+                          'SolutionCheckpoints', 'solution_checkpoints',
+                          'meta_population_tau_leaping', 'meta_population_stochastic_cumulative',
+                          'meta_population_stochastic_sample'],
+    'solver_tools': ['solvers', 'Integrator', 'integrator', 'solve_odeint', 'ivp_solver', 'solve_rk', 'calibrate',
+                     'load_calibration', 'format_calibration'],
+    'fitting_tools': ['model_samples', 'model_checkpoint', 'squared_error', 'undercount_error',
+                      'repeated_squared_error', 'model_samples_ensemble', 'screened_point', 'evaluate_points',
+                      'sample_arguments',
+                      'model_samples_gradient', 'squared_error_gradient', 'undercount_error_gradient',
+                      'repeated_squared_error_gradient',
+                      'aggregate_samples', 'multi_start', 'fidelity_ladder', 'fidelity_ladders',
+                      'fidelity_schedule', 'format_stages', 'format_cache'],
+    'synthetic_tools': ['noisy_replicates', 'synthetic_data', 'synthetic_plan'],
+    'sweep_tools': ['expand_sweep', 'SweepData'],
+    'store_tools': ['ResultStore', 'load_results'],
+    'network_tools': ['synthetic_network', 'gravity_travel', 'radiation_travel'],
+    'inference_tools': ['ABCSMC', 'prior_bounds', 'format_history'],
+    'profile_tools': ['profile_grid', 'profile_likelihood', 'mse_threshold', 'profile_interval'],
+    'api': ['fit', 'refit', 'run_sweep', 'sample_posterior', 'profile_parameters', 'simulate',
+            'calibrate_solvers'],
+    'other_tools': ['fill_cumsum'],
+}
+_modules = {name: module for module, names in _exports.items() for name in names}
+
+__all__ = list(_modules)
+
+
+def __getattr__(name):
+    """
+    Imports the module of an exported name on its first use.
+    """
+    if name not in _modules:
+        raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name))
+    value = getattr(importlib.import_module('tools.' + _modules[name]), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
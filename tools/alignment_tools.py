@@ -0,0 +1,275 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import xml.etree.ElementTree as ElementTree
+
+import numpy as np
+
+alignment_paths = {'free-p': 'data/threecity_free-p_free-m.xml', 'fixed-p': 'data/threecity_fixed-p_free-m.xml'}
+
+# 2-bit codes of the bases; every other character (gap, N and the IUPAC ambiguity codes) is
+# stored as 0 and flagged in the mask
+bases = 'ACGT'
+_base_codes = np.zeros(256, dtype=np.uint8)
+_base_valid = np.zeros(256, dtype=bool)
+for _k, _base in enumerate(bases):
+    _base_codes[[ord(_base), ord(_base.lower())]] = _k
+    _base_valid[[ord(_base), ord(_base.lower())]] = True
+
+# rows are padded to whole 64 bit words, 32 sites per word of codes and 64 per word of mask
+word_sites = 32
+
+
+def packed_width(length):
+    """
+    :param length: number of sites (int)
+    :return: number of bytes of a row of packed codes and of its mask (int, int)
+    """
+    words = -(-length // word_sites)
+    return 8 * words, 4 * words + 4 * (words % 2)
+
+
+def pack_sequence(sequence):
+    """
+    Packs a sequence into 2 bits per site, the first site in the highest bits of the first
+    byte, with a bit mask of the sites which are not one of the four bases.
+    :param sequence: aligned sequence (str)
+    :return: packed codes and mask (numpy.array, numpy.array)
+    """
+    characters = np.frombuffer(sequence.encode('ascii'), dtype=np.uint8)
+    codes_width, mask_width = packed_width(characters.shape[0])
+
+    codes = np.zeros(4 * codes_width, dtype=np.uint8)
+    codes[:characters.shape[0]] = _base_codes[characters]
+    codes = codes.reshape(-1, 4)
+    packed = (codes[:, 0] << 6) | (codes[:, 1] << 4) | (codes[:, 2] << 2) | codes[:, 3]
+
+    mask = np.zeros(8 * mask_width, dtype=bool)
+    mask[:characters.shape[0]] = ~_base_valid[characters]
+    return packed, np.packbits(mask)
+
+
+def unpack_codes(codes, mask, length):
+    """
+    :param codes: packed codes of one or more sequences, one per row (numpy.array)
+    :param mask: packed mask of the sequences (numpy.array)
+    :param length: number of sites (int)
+    :return: codes of the sites, 0 to 3 for the bases and 4 for the masked sites (numpy.array)
+    """
+    codes = np.asarray(codes)
+    shifts = np.array([6, 4, 2, 0], dtype=np.uint8)
+    sites = ((codes[..., None] >> shifts) & 3).reshape(*codes.shape[:-1], -1)[..., :length]
+    masked = np.unpackbits(np.asarray(mask), axis=-1)[..., :length].astype(bool)
+    return np.where(masked, 4, sites).astype(np.uint8)
+
+
+def isolate_id(taxon):
+    """
+    :param taxon: BEAST taxon, sequencing run, lane and tag followed by the date and the deme,
+                  e.g. 26268_1_246_8422_I2 (str)
+    :return: lane of the isolate in the Lane column of the full dataset, e.g. 26268_1#246 (str)
+    """
+    run, lane, tag = taxon.split('_')[:3]
+    return '{}_{}#{}'.format(run, lane, tag)
+
+
+def parse_trait(value):
+    """
+    :param value: value of a BEAST trait set, comma separated taxon=value pairs (str)
+    :return: value of every taxon (dict)
+    """
+    pairs = (pair.strip().split('=', 1) for pair in value.split(',') if '=' in pair)
+    return {taxon.strip(): trait.strip() for taxon, trait in pairs}
+
+
+def trait_dates(values):
+    """
+    Converts the dates of a BEAST date trait, given either as days since 1970-01-01 (as in
+    the files of the study) or as calendar dates.
+    :param values: dates, '' for a missing one (list)
+    :return: dates (numpy.array)
+    """
+    dates = np.full(len(values), np.datetime64('NaT'), dtype='datetime64[D]')
+    for i, value in enumerate(values):
+        if value:
+            try:
+                dates[i] = np.datetime64('1970-01-01', 'D') + int(round(float(value)))
+            except ValueError:
+                dates[i] = np.datetime64(value, 'D')
+    return dates
+
+
+def file_signature(path):
+    """
+    :param path: path of the file (str)
+    :return: SHA-1 digest of the file, read in chunks (str)
+    """
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def write_npy(path, raw, dtype, shape):
+    """
+    Writes a .npy file from the raw bytes of an array, without reading them in memory.
+    :param path: path of the .npy file (str)
+    :param raw: open file with the raw bytes (file)
+    :param dtype: type of the array (numpy.dtype)
+    :param shape: shape of the array (tuple)
+    """
+    raw.seek(0)
+    with open(path, 'wb') as f:
+        np.lib.format.write_array_header_1_0(f, {'descr': np.lib.format.dtype_to_descr(np.dtype(dtype)),
+                                                 'fortran_order': False, 'shape': shape})
+        shutil.copyfileobj(raw, f)
+
+
+class Alignment:
+    """
+    Aligned sequences packed into 2 bits per site with a mask of the gaps and ambiguous
+    sites, and the taxa, isolation dates and traits of the sequences. The packed rows are
+    whole 64 bit words, so that they can be compared a word at a time, and the arrays can
+    be memory-mapped from the cache.
+    """
+
+    def __init__(self, taxa, dates, length, codes, mask, traits=None):
+        """
+        :param taxa: taxa of the sequences (numpy.array)
+        :param dates: isolation dates of the sequences (numpy.array)
+        :param length: number of sites (int)
+        :param codes: packed codes with a row per sequence (numpy.array)
+        :param mask: packed mask of the gaps and ambiguous sites with a row per sequence (numpy.array)
+        :param traits: other traits of the sequences, e.g. the deme, by trait name (dict)
+        """
+        self.taxa = np.asarray(taxa)
+        self.dates = np.asarray(dates, dtype='datetime64[D]')
+        self.length = int(length)
+        self.codes = codes
+        self.mask = mask
+        self.traits = traits if traits is not None else dict()
+
+    def __len__(self):
+        return self.taxa.shape[0]
+
+    def sequence(self, i):
+        """
+        :param i: index of the sequence (int)
+        :return: sequence, with N at the gaps and ambiguous sites (str)
+        """
+        return ''.join(np.array(list(bases + 'N'))[unpack_codes(self.codes[i], self.mask[i], self.length)])
+
+    def isolates(self):
+        """
+        :return: lane of every sequence in the full dataset (numpy.array)
+        """
+        return np.array([isolate_id(taxon) for taxon in self.taxa])
+
+    def metadata(self, data):
+        """
+        Joins the records of the full dataset to the sequences by isolate, i.e. by lane and
+        isolation date (a few lanes appear in records of different years).
+        :param data: full dataset (pandas.DataFrame)
+        :return: record of every sequence, empty where no record matches, indexed by taxon
+                 (pandas.DataFrame)
+        """
+        import pandas as pd
+
+        records = data[data['Lane'].notnull()].copy()
+        records['_date'] = pd.to_datetime(records['Isolate.date'], format='%d/%m/%Y').to_numpy().astype(
+            'datetime64[D]')
+        records = records.drop_duplicates(['Lane', '_date'])
+
+        keys = pd.DataFrame({'Lane': self.isolates(), '_date': self.dates})
+        joined = keys.merge(records, on=['Lane', '_date'], how='left').drop(columns='_date')
+        joined.index = pd.Index(self.taxa, name='taxon')
+        return joined
+
+
+def parse_beast_alignment(path, directory):
+    """
+    Stream-parses the alignment of a BEAST XML file into the cache directory: the packed
+    codes and mask (codes.npy and mask.npy) and the taxa, dates and other traits
+    (meta.npz). Every element is dropped once read, so the memory does not grow with the
+    number of sequences.
+    :param path: path of the XML file (str)
+    :param directory: cache directory (str)
+    """
+    os.makedirs(directory, exist_ok=True)
+    taxa = []
+    traits = dict()
+    length = None
+    stack = []
+    with tempfile.TemporaryFile(dir=directory) as codes, tempfile.TemporaryFile(dir=directory) as mask:
+        for event, element in ElementTree.iterparse(path, events=('start', 'end')):
+            if event == 'start':
+                stack.append(element)
+                continue
+            stack.pop()
+
+            if element.tag == 'sequence':
+                value = ''.join((element.get('value') or element.text or '').split())
+                if length is None:
+                    length = len(value)
+                elif len(value) != length:
+                    raise ValueError('sequence {} of {} has {} sites instead of {}'.format(
+                        element.get('taxon'), path, len(value), length))
+                row_codes, row_mask = pack_sequence(value)
+                codes.write(row_codes.tobytes())
+                mask.write(row_mask.tobytes())
+                taxa.append(element.get('taxon') or element.get('id'))
+            elif element.tag == 'trait' and element.get('traitname') is not None:
+                traits[element.get('traitname')] = parse_trait(element.get('value') or element.text or '')
+
+            # the children of an element are dropped at their end, so a parent holds at most one
+            if stack:
+                stack[-1].remove(element)
+
+        if length is None:
+            raise ValueError('no sequences in {}'.format(path))
+        codes_width, mask_width = packed_width(length)
+        write_npy(os.path.join(directory, 'codes.npy'), codes, np.uint8, (len(taxa), codes_width))
+        write_npy(os.path.join(directory, 'mask.npy'), mask, np.uint8, (len(taxa), mask_width))
+
+    date_trait = traits.pop('date', dict())
+    dates = trait_dates([date_trait.get(taxon, '') for taxon in taxa])
+    np.savez(os.path.join(directory, 'meta.npz'), taxa=np.array(taxa), dates=dates, length=length,
+             **{'trait_' + name: np.array([values.get(taxon, '') for taxon in taxa])
+                for name, values in traits.items()})
+
+
+def load_alignment(path=alignment_paths['free-p'], cache=None, mmap_mode='r'):
+    """
+    Loads the alignment of a BEAST XML file from its cache directory, which is (re)built
+    from the file when it does not exist or when the file has changed.
+    :param path: path of the XML file (str)
+    :param cache: cache directory, None for the path with the extension .alignment (str)
+    :param mmap_mode: memory-map mode of the packed arrays, None to read them in memory (str)
+    :return: alignment (Alignment)
+    """
+    if cache is None:
+        cache = os.path.splitext(path)[0] + '.alignment'
+    signature = file_signature(path)
+
+    source = os.path.join(cache, 'source')
+    current = None
+    if os.path.exists(source):
+        with open(source) as f:
+            current = f.read()
+    if current != signature:
+        # built in a temporary directory first, so concurrent jobs never read a partial cache
+        temporary = tempfile.mkdtemp(dir=os.path.dirname(os.path.abspath(cache)), suffix='.alignment')
+        parse_beast_alignment(path, temporary)
+        with open(os.path.join(temporary, 'source'), 'w') as f:
+            f.write(signature)
+        os.chmod(temporary, 0o755)
+        shutil.rmtree(cache, ignore_errors=True)
+        os.replace(temporary, cache)
+
+    with np.load(os.path.join(cache, 'meta.npz')) as meta:
+        traits = {name[len('trait_'):]: meta[name] for name in meta.files if name.startswith('trait_')}
+        return Alignment(meta['taxa'], meta['dates'], meta['length'],
+                         np.load(os.path.join(cache, 'codes.npy'), mmap_mode=mmap_mode),
+                         np.load(os.path.join(cache, 'mask.npy'), mmap_mode=mmap_mode), traits)
@@ -0,0 +1,455 @@
+"""
+Programmatic entry points of the experiments, for the use from notebooks, services or other
+scripts. The command line scripts are thin wrappers around them. The settings are given as a
+namespace with the fields of the command line options, e.g. from config.default_arguments.
+The heavy modules are imported inside the functions, so importing this module is cheap.
+"""
+import json
+import os
+import time
+import warnings
+
+import numpy as np
+
+from tools.data_tools import all_cities, all_Ns
+
+# order of the fitted parameters
+parameter_names = ['asym', 'beta_1', 'beta_2', 't_0', 'init', 'phi']
+
+synthetic_models = ['gauss', 'gamma', 'negbinom']
+experiments = ['data', 'undercount', 'travel_noise'] + synthetic_models
+
+# settings of the model and the loss, which must not change between the updates of a rolling fit
+rolling_settings = ['start', 'c', 'gamma', 'shift', 'travel_norm', 'active_sampling', 'min_init', 'weight',
+                    'weighted', 'tols', 'periods']
+
+
+def observed_cases(data, cities, start_date, end_date):
+    """
+    :param data: daily number of cases (CaseCounts)
+    :param cities: names of the cities (list)
+    :param start_date: model starting date (str)
+    :param end_date: model last date (str)
+    :return: sampling structure and the observed positive number of cases (dict, numpy.array)
+    """
+    from tools import load_specific_city
+
+    sampling = dict()
+    y_sample = []
+    for city in cities:
+        x, z = load_specific_city(data, city, start_date, end_date)
+        sampling[city] = x[z > 0.0]
+        y_sample.append(z[z > 0.0])
+    return sampling, np.concatenate(y_sample)
+
+
+def start_run(args):
+    """
+    Prepares the solver, the solution cache and the solver log of a run. With -solver auto
+    the solver is the choice of the calibration in -calibration, or in
+    results/<name>_solvers.json by default, which is only valid for tolerances of the fit
+    at most as large as the calibrated one.
+    :param args: settings (argparse.Namespace)
+    """
+    from tools import integrator, load_calibration, solution_cache, solver_log
+
+    if args.solver == 'auto':
+        path = args.calibration if args.calibration is not None else 'results/' + args.name + '_solvers.json'
+        best = load_calibration(path)
+        if max(args.tols) > best['tol']:
+            warnings.warn('the tolerances {} exceed the calibrated tolerance {:.0e} of {}'.format(
+                args.tols, best['tol'], best['solver']))
+        integrator.select(best['solver'])
+    else:
+        integrator.select(args.solver)
+    solution_cache.resize(args.cache)
+    if args.log is not None:
+        solver_log.open(args.log)
+
+
+def fit(args, experiment='data'):
+    """
+    Fits the parameters for one of the experiments of the command line scripts: the observed
+    cases with the squared error ('data', fit_data.py), with the undercount error ('undercount',
+    only_undercount.py) or with noisy travel ('travel_noise', travel_noise.py), or synthetic
+    cases with 'gauss', 'gamma' or 'negbinom' noise (synth_*.py). The restarts are written to
+    the store results/<name> and the final ones are saved as results/<name>.npy, with the last
+    stage, parameters and objective value of every restart in results/<name>_candidates.npy.
+    :param args: settings (argparse.Namespace)
+    :param experiment: name of the experiment, from experiments (str)
+    :return: final optimal parameters followed by the objective value (prefixed by the true
+             parameters for the synthetic cases), the number of candidates, resumed candidates
+             and wall time of every stage, and the tolerance, aggregation period and iteration
+             budget of every stage (numpy.array, list, list)
+    """
+    from tools import (repeated_squared_error, repeated_squared_error_gradient, fidelity_ladder,
+                       fidelity_schedule, aggregate_samples, synthetic_data, load_case_counts, data_travel,
+                       ResultStore, SamplingPlan, beta_classes)
+
+    if experiment not in experiments:
+        raise ValueError('unknown experiment {}'.format(experiment))
+
+    M_c = args.c
+    cities = all_cities[:M_c]
+    Ns = all_Ns[:M_c]
+
+    store = ResultStore('results/' + args.name, args, len(parameter_names))
+    seed = store.seed
+    if experiment in synthetic_models or experiment == 'travel_noise':
+        # the noise and the restarts have their own seeds, kept in the store for resumed runs
+        noise_seed, seed = np.random.SeedSequence(store.seed).spawn(2)
+
+    travel_matrix = data_travel() / args.travel_norm
+    travel_matrix = travel_matrix[:M_c, :M_c]
+    if experiment == 'travel_noise':
+        # 30% noise on every rate, kept non-negative and symmetric
+        noise = np.random.default_rng(noise_seed).normal(scale=travel_matrix * 0.3)
+        travel_matrix = np.maximum(travel_matrix + noise, 0.0)
+        lower = np.tril_indices(M_c, -1)
+        travel_matrix[lower] = travel_matrix.T[lower]
+
+    data = load_case_counts()
+    sampling, y_sample = observed_cases(data, cities, args.start, args.end)
+    schedule = fidelity_schedule(args.tols, args.periods, args.budgets)
+
+    if experiment in synthetic_models:
+        params = [args.asym, beta_classes(Ns).dot(args.betas2[:2]), args.gamma, args.phi, args.sin_0, args.init,
+                  args.shift, Ns, M_c, travel_matrix]
+        limits = [[0.0, 1.0], [0.0, None], [0.0, None], [0.0, None], [0.0, None], [0.0, 2.0 * np.pi]]
+        _, _, y_sample = synthetic_data(sampling, *params, experiment, args.noise, args.r,
+                                        np.random.default_rng(noise_seed), init_n=M_c,
+                                        active_sampling=args.active_sampling, negative_cases=args.negative_cases,
+                                        demographic=args.demographic)
+
+        stage_arguments = []
+        for tol, period, _ in schedule:
+            stage_sampling, stage_sample = aggregate_samples(sampling, y_sample, period, args.r)
+            if args.neglect_zeros:
+                opt_ids = stage_sample > 0.0
+            else:
+                opt_ids = np.repeat(True, stage_sample.shape[0])
+            stage_plan = SamplingPlan(stage_sampling, args.shift, args.active_sampling)
+            stage_arguments.append((args.shift, args.gamma, Ns, M_c, travel_matrix, stage_plan, stage_sample,
+                                    args.active_sampling, args.r, opt_ids, tol))
+        objective, gradient = repeated_squared_error, repeated_squared_error_gradient
+        true_parameters = [args.asym, *args.betas2, args.sin_0, args.init, args.phi, args.noise, args.shift,
+                           args.gamma]
+    else:
+        objective, stage_arguments, limits, gradient = observed_problem(args, experiment, travel_matrix, sampling,
+                                                                        y_sample, schedule)
+        true_parameters = None
+
+    start_run(args)
+    ws, stages, finals = fidelity_ladder(objective, stage_arguments, limits, args.m, keep=args.keep, seed=seed,
+                                         gradient=gradient if args.gradient else None, workers=args.workers,
+                                         store=store, budgets=[budget for _, _, budget in schedule],
+                                         screen=args.screen)
+    if true_parameters is not None:
+        ws = np.array([true_parameters + list(w) for w in ws])
+
+    np.save('results/' + args.name + '.npy', ws)
+    np.save('results/' + args.name + '_candidates.npy', finals)
+    return ws, stages, schedule
+
+
+def refit(args, experiment='data'):
+    """
+    Rolling fit of the observed cases for data arriving day by day. The first call fits
+    the data from scratch as fit does. Every call keeps the best -warm optima, the
+    settings and the end date in results/<name>_rolling.json, and the model solutions of
+    the optima at the times of the data in results/<name>_rolling.npz. A later call with
+    a later end date only minimises again from the kept optima, on the data up to the new
+    end and at the tolerance of the last stage, and the solutions of the unchanged
+    parameters (the first evaluation of every restart) only integrate the new days from
+    the checkpoints. The results of every update are saved as results/<name>_<end>.npy.
+    :param args: settings (argparse.Namespace)
+    :param experiment: name of the experiment, 'data' or 'undercount' (str)
+    :return: final optimal parameters followed by the objective value, the number of
+             candidates, resumed candidates and wall time of every stage, and the tolerance,
+             aggregation period and iteration budget of every stage (numpy.array, list, list)
+    """
+    from tools import (fidelity_schedule, aggregate_samples, load_case_counts, data_travel, model_checkpoint,
+                       solution_checkpoints, SamplingPlan)
+    from tools.fitting_tools import local_start, run_problems
+
+    if experiment not in ('data', 'undercount'):
+        raise ValueError('experiment {} cannot be refitted'.format(experiment))
+
+    path = 'results/' + args.name + '_rolling'
+    settings = json.loads(json.dumps({name: getattr(args, name) for name in rolling_settings}))
+    settings['experiment'] = experiment
+
+    M_c = args.c
+    Ns = all_Ns[:M_c]
+    travel_matrix = (data_travel() / args.travel_norm)[:M_c, :M_c]
+    sampling, y_sample = observed_cases(load_case_counts(), all_cities[:M_c], args.start, args.end)
+    schedule = fidelity_schedule(args.tols, args.periods, args.budgets)
+
+    if not os.path.exists(path + '.json'):
+        ws, stages, schedule = fit(args, experiment)
+    else:
+        with open(path + '.json') as f:
+            state = json.load(f)
+        changed = sorted(name for name in settings if settings[name] != state['settings'].get(name))
+        if changed:
+            raise ValueError('rolling fit {} was created with different settings ({}), use another name'.format(
+                path, ', '.join(changed)))
+        if np.datetime64(args.end) < np.datetime64(state['end']):
+            raise ValueError('end date {} is before the end of the last update {}'.format(args.end, state['end']))
+
+        # the last stage is the full fidelity problem, and the restarts start from the kept optima
+        schedule = schedule[-1:]
+        objective, stage_arguments, limits, gradient = observed_problem(args, experiment, travel_matrix, sampling,
+                                                                        y_sample, schedule)
+        start_run(args)
+        solution_checkpoints.load(path + '.npz')
+        tic = time.perf_counter()
+        tasks = [(0, np.array(optimum[:-1])) for optimum in state['optima']]
+        ws = np.array(run_problems(local_start, tasks, [(objective, stage_arguments[0], limits, gradient,
+                                                         schedule[0][2])], args.workers))
+        stages = [{'candidates': len(tasks), 'resumed': 0, 'time': time.perf_counter() - tic}]
+        np.save('results/' + args.name + '_' + args.end + '.npy', ws)
+
+    # the checkpoints of the new optima, at the times of the data up to the new end
+    optima = ws[np.argsort(ws[:, -1], kind='stable')[:args.warm]]
+    plan = SamplingPlan(aggregate_samples(sampling, y_sample, schedule[-1][1])[0], args.shift, args.active_sampling)
+    solution_checkpoints.clear()
+    for optimum in optima:
+        model_checkpoint(optimum[:-1], args.gamma, Ns, M_c, travel_matrix, plan, schedule[-1][0])
+    solution_checkpoints.save(path + '.npz')
+
+    temporary = path + '.json.tmp'
+    with open(temporary, 'w') as f:
+        json.dump({'settings': settings, 'end': args.end, 'optima': optima.tolist()}, f, indent=1)
+    os.replace(temporary, path + '.json')
+    return ws, stages, schedule
+
+
+def observed_problem(args, experiment, travel_matrix, sampling, y_sample, schedule):
+    """
+    Builds the fitting problem of the observed cases, with the squared error or, for the
+    'undercount' experiment, the undercount error.
+    :param args: settings (argparse.Namespace)
+    :param experiment: name of the experiment, 'data', 'undercount' or 'travel_noise' (str)
+    :param travel_matrix: travelling rates (numpy.array)
+    :param sampling: sampling structure (dict)
+    :param y_sample: observed number of cases (numpy.array)
+    :param schedule: tolerance, aggregation period and iteration budget of every stage (list)
+    :return: objective, its additional arguments for every stage, bounds of the parameters
+             and objective with gradient (or None) (tuple)
+    """
+    from tools import (squared_error, squared_error_gradient, undercount_error, undercount_error_gradient,
+                       aggregate_samples, SamplingPlan)
+
+    M_c = args.c
+    Ns = all_Ns[:M_c]
+    stage_arguments = []
+    for tol, period, _ in schedule:
+        stage_sampling, stage_sample = aggregate_samples(sampling, y_sample, period)
+        # the objectives get the plan of the stage, built once instead of on every call
+        stage_plan = SamplingPlan(stage_sampling, args.shift, args.active_sampling)
+        common = (args.shift, args.gamma, Ns, M_c, travel_matrix, stage_plan, stage_sample, args.active_sampling)
+        if experiment == 'undercount':
+            stage_arguments.append(common + (tol,))
+        else:
+            stage_arguments.append(common + (args.weight if args.weighted else None, tol))
+
+    min_init = 0.0 if experiment == 'undercount' else args.min_init
+    limits = [[0.0, 1.0], [0.0, None], [0.0, None], [0.0, None], [min_init, None], [0.0, 2.0 * np.pi]]
+    if experiment == 'undercount':
+        objective, gradient = undercount_error, undercount_error_gradient
+    else:
+        objective, gradient = squared_error, squared_error_gradient
+    return objective, stage_arguments, limits, gradient if args.gradient else None
+
+
+def sweep_problems(args, tasks, schedule):
+    """
+    Builds the fitting problems of the tasks of a sweep, with the results store holding
+    the seeds of the run.
+    :param args: settings (argparse.Namespace)
+    :param tasks: tasks of the sweep, from expand_sweep (list)
+    :param schedule: tolerance, aggregation period and iteration budget of every stage (list)
+    :return: data of the sweep, store, fitting problems and the seeds of the restarts of
+             every task (SweepData, ResultStore, list, list)
+    """
+    from tools import SweepData, ResultStore, load_case_counts
+
+    store = ResultStore('results/' + args.name, args, len(parameter_names), labels=[task['label'] for task in tasks])
+    # every task gets its own seeds of the noise and of the restarts
+    task_seeds = [seed.spawn(2) for seed in np.random.SeedSequence(store.seed).spawn(len(tasks))]
+
+    sweep = SweepData(load_case_counts(), args)
+    problems = [sweep.problem(task, schedule, np.random.default_rng(noise_seed))
+                for task, (noise_seed, _) in zip(tasks, task_seeds)]
+    return sweep, store, problems, [seed for _, seed in task_seeds]
+
+
+def run_sweep(args):
+    """
+    Fits every task of a sweep (sweep.py), with the restarts of all the tasks sharing one
+    pool of processes. The results of every task are saved as results/<name>_<task>.npy, and
+    the last stage, parameters and objective value of its restarts as
+    results/<name>_<task>_candidates.npy.
+    :param args: settings (argparse.Namespace)
+    :return: tasks, their final optimal parameters followed by the objective value (prefixed
+             by the true parameters for the synthetic cases), the number of candidates,
+             resumed candidates and wall time of every stage, and the tolerance,
+             aggregation period and iteration budget of every stage (list, list, list, list)
+    """
+    from tools import expand_sweep, fidelity_ladders, fidelity_schedule
+
+    tasks = expand_sweep(args.cs, args.models, args.noises, args.losses)
+    schedule = fidelity_schedule(args.tols, args.periods, args.budgets)
+    sweep, store, problems, seeds = sweep_problems(args, tasks, schedule)
+
+    start_run(args)
+    wss, stages, finals = fidelity_ladders(problems, args.m, keep=args.keep, seeds=seeds, workers=args.workers,
+                                           store=store, budgets=[budget for _, _, budget in schedule],
+                                           screen=args.screen)
+
+    results = []
+    for task, ws, final in zip(tasks, wss, finals):
+        params = sweep.true_parameters(task)
+        results.append(np.array([params + list(w) for w in ws]))
+        np.save('results/' + args.name + '_' + task['label'] + '.npy', results[-1])
+        np.save('results/' + args.name + '_' + task['label'] + '_candidates.npy', final)
+    return tasks, results, stages, schedule
+
+
+def sample_posterior(args):
+    """
+    Samples the posterior of the parameters of every task of a sweep (posterior.py) with
+    ABCSMC, using the full fidelity stage of the schedule. The state of every sampler is
+    written to results/<name>_<task>_posterior.npz after every generation.
+    :param args: settings (argparse.Namespace)
+    :return: tasks and their samplers (list, list)
+    """
+    from tools import expand_sweep, SweepData, ABCSMC, fidelity_schedule, load_case_counts
+
+    tasks = expand_sweep(args.cs, args.models, args.noises, args.losses)
+    schedule = fidelity_schedule(args.tols, args.periods, args.budgets)[-1:]
+
+    # every task has its own sampler, whose state is written after every generation
+    samplers = [ABCSMC('results/' + args.name + '_' + task['label'] + '_posterior.npz', particles=args.particles,
+                       quantile=args.quantile, max_particles=args.max_particles, seed=args.seed) for task in tasks]
+
+    # the synthetic noise is drawn from the seed of the sampler, so that a resumed run sees the same data
+    sweep = SweepData(load_case_counts(), args)
+    problems = [sweep.problem(task, schedule, np.random.default_rng(np.random.SeedSequence(sampler.seed).spawn(1)[0]))
+                for task, sampler in zip(tasks, samplers)]
+
+    start_run(args)
+    for (objective, stage_arguments, limits, gradient), sampler in zip(problems, samplers):
+        sampler.run((objective, stage_arguments[0], limits, gradient), args.generations, workers=args.workers,
+                    min_acceptance=args.min_acceptance)
+    return tasks, samplers
+
+
+def profile_parameters(args):
+    """
+    Fits every task of a sweep and profiles all the parameters from the best restart
+    (identifiability.py), using the full fidelity stage of the schedule. The profiles and
+    confidence intervals of every task are saved as results/<name>_<task>_profile.npz.
+    :param args: settings (argparse.Namespace)
+    :return: tasks, their profiles (optimum, threshold and, for every parameter, the values,
+             profile, optimal parameters along it and interval), the number of candidates,
+             resumed candidates and wall time of every stage, and the tolerance,
+             aggregation period and iteration budget of every stage (list, list, list, list)
+    """
+    from tools import (expand_sweep, fidelity_ladders, fidelity_schedule, prior_bounds, profile_grid,
+                       profile_likelihood, mse_threshold, profile_interval)
+
+    tasks = expand_sweep(args.cs, args.models, args.noises, args.losses)
+    schedule = fidelity_schedule(args.tols, args.periods, args.budgets)
+    _, store, problems, seeds = sweep_problems(args, tasks, schedule)
+
+    start_run(args)
+    wss, stages, _ = fidelity_ladders(problems, args.m, keep=args.keep, seeds=seeds, workers=args.workers,
+                                      store=store, budgets=[budget for _, _, budget in schedule])
+
+    results = []
+    for task, (objective, stage_arguments, limits, gradient), ws in zip(tasks, problems, wss):
+        optimum = ws[np.argmin(ws[:, -1])]
+        arguments = stage_arguments[-1]
+        bounds = prior_bounds(limits)
+        grids = {k: profile_grid(optimum[k], *bounds[k], args.points) for k in range(len(parameter_names))}
+        profiles = profile_likelihood(objective, arguments, limits, optimum, grids, gradient, args.workers)
+
+        # the residuals entering the mean of the loss (selected entries for the repeated samples)
+        n = int(np.sum(arguments[9])) if task['loss'] == 'repeated' else arguments[6].shape[0]
+        threshold = mse_threshold(optimum[-1], n, args.level)
+
+        saved = {'optimum': optimum, 'threshold': threshold}
+        for k, name in enumerate(parameter_names):
+            values, profile, params = profiles[k]
+            saved.update({name + '_values': values, name + '_profile': profile, name + '_params': params,
+                          name + '_interval': np.array(profile_interval(values, profile, threshold))})
+        np.savez('results/' + args.name + '_' + task['label'] + '_profile.npz', **saved)
+        results.append(saved)
+    return tasks, results, stages, schedule
+
+
+def calibrate_solvers(args):
+    """
+    Times every solver at every tolerance of -tols on -m random parameter sets drawn as
+    the random restarts, on the observed data of the first c cities, and picks the fastest
+    one whose samples stay within -error of reference samples (calibrate.py). The runs
+    are saved as results/<name>_solvers.json.
+    :param args: settings (argparse.Namespace)
+    :return: solver, tolerance, mean wall time of a solve, relative error and whether it is
+             accepted of every run, and the fastest accepted run, None if none is (list, dict)
+    """
+    from tools import beta_classes, calibrate, data_travel, load_case_counts, meta_population_sample, SamplingPlan
+    from tools.fitting_tools import random_initial_point, restart_seeds
+
+    M_c = args.c
+    Ns = all_Ns[:M_c]
+    travel_matrix = (data_travel() / args.travel_norm)[:M_c, :M_c]
+    sampling, _ = observed_cases(load_case_counts(), all_cities[:M_c], args.start, args.end)
+    plan = SamplingPlan(sampling, args.shift, args.active_sampling)
+    parameter_sets = [random_initial_point(np.random.default_rng(seed)) for seed in restart_seeds(args.seed, args.m)]
+
+    def samples(pars, tol):
+        # without the solution cache, so that every solve is timed
+        betas = beta_classes(Ns).dot(pars[1:3])
+        return meta_population_sample(plan, pars[0], betas, args.gamma, pars[5], pars[3], pars[4], args.shift, Ns,
+                                      M_c, travel_matrix, init_n=M_c, active_sampling=args.active_sampling,
+                                      rtol=tol, atol=tol)
+
+    runs, best = calibrate(samples, parameter_sets, args.tols, args.error)
+    os.makedirs('results', exist_ok=True)
+    with open('results/' + args.name + '_solvers.json', 'w') as f:
+        json.dump({'error': args.error, 'runs': runs, 'best': best}, f, indent=1, default=float)
+    return runs, best
+
+
+def simulate(pars, c=3, gamma=1.0 / 7.0, shift=0.0, travel_norm=1.0, t=None, r=None, seed=None):
+    """
+    Solves the model of the experiments (the first c cities with the travel of
+    data/travel.csv and the transmission rates by city size) for fitted parameters, or
+    simulates replicates of its stochastic version.
+    :param pars: asym, beta_1, beta_2, t_0, init, phi (numpy.array)
+    :param c: number of cities (int)
+    :param gamma: recovery rate (float)
+    :param shift: difference in days between first day and the first cases day (float)
+    :param travel_norm: normalisation constant for travel (float)
+    :param t: times of the trajectories, None for every day from the shift to t_max (numpy.array)
+    :param r: number of replicates of the stochastic model, None for the ODEs (int)
+    :param seed: seed of the stochastic model (int)
+    :return: trajectories with axes time and variable, and replicate in between for the
+             stochastic model (numpy.array)
+    """
+    from tools import beta_classes, data_travel, meta_population_solution, meta_population_tau_leaping
+    from tools.integration_tools import t_max
+
+    Ns = all_Ns[:c]
+    travel_matrix = (data_travel() / travel_norm)[:c, :c]
+    betas = beta_classes(Ns).dot(pars[1:3])
+    t = np.arange(shift, t_max) if t is None else np.asarray(t, dtype=float)
+
+    if r is None:
+        return meta_population_solution(t, pars[0], betas, gamma, pars[5], pars[3], pars[4], Ns, c, travel_matrix,
+                                        init_n=c)
+    return meta_population_tau_leaping(t, pars[0], betas, gamma, pars[5], pars[3], pars[4], Ns, c, travel_matrix, r,
+                                       np.random.default_rng(seed), init_n=c)
@@ -1,41 +1,151 @@
 
-import numpy as np
-import pandas as pd
+import hashlib
+import os
+import tempfile
 
+import numpy as np
+import scipy.sparse
+
+full_dataset_path = 'data/joined_metadata_with_seq_lanes_and_geo_MANUAL_EDIT.csv'
+case_counts_path = 'data/case_counts.npz'
+
+set_of_names = {'Tartagal': ['Tartagal, Salta'],
+                'Jujuy': ['Jujuy', 'Pericho, Jujuy'],  # I assume it's Pericho plus San Salvador de Jujuy
+                'Oran': ['Oran, Salta'],
+                'Tucuman': ['Tucuman', 'San Miguel de Tucuman'],  # I assume it's mostly San Miguel
+                'Mendoza': ['Mendoza'],
+                'Buenos Aires': ['Buenos Aires (city)', 'Avellaneda, Buenos Aires', 'La Plata, Buenos Aires'],
+                'Santa Fe': ['Santa Fe', 'Rosario, Santa Fe'],
+                'Guemes': ['General Guemes, Salta'],
+                'Salta': ['Apolinario Saravia, Salta', 'Colonia Santa Rosa, Salta', 'Embarcación, Salta',
+                          'General Guemes, Salta', 'Metan, Salta', 'Tartagal, Salta', 'Oran, Salta',
+                          'Pichanal, Salta', 'Rosario de la Frontera, Salta', 'Salta, Salta', 'Salta',
+                          'Salvador Mazza, Salta', 'Santa Rosa, Salta']}
+
+# cities of the experiments, in the order of data/travel.csv, and their populations
+all_cities = ['Tartagal', 'Oran', 'Jujuy', 'Guemes', 'Tucuman', 'Santa Fe', 'Mendoza', 'Buenos Aires']
+all_Ns = np.array([4.4e4, 5.1e4, 2e5, 2.3e4, 6.3e5, 4e5, 8e5, 2e6])
+
+
+class CaseCounts:
+    """
+    Daily number of cases of every city in set_of_names on a common calendar, from
+    which any city and period is read by slicing.
+    """
 
-def load_full_dataset():
+    def __init__(self, cities, first_date, counts):
+        """
+        :param cities: city names, one per row of counts (numpy.array)
+        :param first_date: date of the first column of counts (numpy.datetime64)
+        :param counts: daily number of cases with axes city and day (numpy.array)
+        """
+        self.cities = list(cities)
+        self.first_date = np.datetime64(first_date, 'D')
+        self.counts = counts
+
+    def window(self, city, start_date, end_date):
+        """
+        Reads the daily number of cases in a given period (both ends included).
+        :param city: city name (str)
+        :param start_date: starting date (str)
+        :param end_date: ending date (str)
+        :return: number of cases for every day of the period (numpy.array)
+        """
+        row = self.counts[self.cities.index(city)]
+        first = (np.datetime64(start_date, 'D') - self.first_date).astype(int)
+        last = (np.datetime64(end_date, 'D') - self.first_date).astype(int) + 1
+
+        window = np.zeros(max(last - first, 0), dtype=row.dtype)
+        lo, hi = max(first, 0), min(last, row.shape[0])
+        if hi > lo:
+            window[lo - first:hi - first] = row[lo:hi]
+        return window
+
+
+def load_full_dataset(path=full_dataset_path):
     """
     Generates a data frame with records meeting certain conditions
     (human origin, assigned timestamp and serogroup O1).
+    :param path: path of the full dataset (str)
     :return: full dataset (pandas.DataFrame)
     """
-    data = pd.read_csv('data/joined_metadata_with_seq_lanes_and_geo_MANUAL_EDIT.csv')
+    import pandas as pd
+
+    data = pd.read_csv(path)
 
     condition = ((data['Isolate.date'].notnull()) & (data['Origin'] == 'Human') & (data['Serogroup.x'] == 'O1'))
     return data[condition]
 
 
+def build_case_counts(data):
+    """
+    Counts the daily cases of every city in set_of_names.
+    :param data: full dataset (pandas.DataFrame)
+    :return: daily number of cases (CaseCounts)
+    """
+    import pandas as pd
+
+    dates = pd.to_datetime(data['Isolate.date'], format='%d/%m/%Y').to_numpy().astype('datetime64[D]')
+    first_date = dates.min()
+    days = (dates - first_date).astype(int)
+
+    counts = np.zeros((len(set_of_names), days.max() + 1), dtype=np.int32)
+    for j, names in enumerate(set_of_names.values()):
+        city_days = days[data['Geographic.origin_NR'].isin(names).to_numpy()]
+        counts[j] = np.bincount(city_days, minlength=counts.shape[1])
+
+    return CaseCounts(list(set_of_names.keys()), first_date, counts)
+
+
+def load_case_counts(path=case_counts_path, source=full_dataset_path):
+    """
+    Loads the daily number of cases from the compact store, which is (re)built from the
+    full dataset when it does not exist or when the dataset file has changed.
+    :param path: path of the store (str)
+    :param source: path of the full dataset (str)
+    :return: daily number of cases (CaseCounts)
+    """
+    with open(source, 'rb') as f:
+        signature = hashlib.sha1(f.read()).hexdigest()
+
+    if os.path.exists(path):
+        with np.load(path) as store:
+            if str(store['source']) == signature and list(store['cities']) == list(set_of_names.keys()):
+                return CaseCounts(store['cities'], store['first_date'], store['counts'])
+
+    case_counts = build_case_counts(load_full_dataset(source))
+
+    # written to a temporary file first, so concurrent jobs never read a partial store
+    handle, temporary = tempfile.mkstemp(dir=os.path.dirname(path) or '.', suffix='.npz')
+    try:
+        with os.fdopen(handle, 'wb') as f:
+            np.savez(f, cities=np.array(case_counts.cities), first_date=case_counts.first_date,
+                     counts=case_counts.counts, source=signature)
+        os.chmod(temporary, 0o644)
+        os.replace(temporary, path)
+    except BaseException:
+        os.remove(temporary)
+        raise
+
+    return case_counts
+
+
 def load_specific_city(data, city, start_date, end_date):
     """
     Loads number of cases in a given period for a specified city.
-    :param data: full dataset (pandas.DataFrame)
+    :param data: full dataset or daily number of cases (pandas.DataFrame/CaseCounts)
     :param city: city name (str)
     :param start_date: starting date (str)
     :param end_date: ending date (str)
     :return: iterator and number of cases for specified city (numpy.array, numpy.array)
     """
-    set_of_names = {'Tartagal': ['Tartagal, Salta'],
-                    'Jujuy': ['Jujuy', 'Pericho, Jujuy'],  # I assume it's Pericho plus San Salvador de Jujuy
-                    'Oran': ['Oran, Salta'],
-                    'Tucuman': ['Tucuman', 'San Miguel de Tucuman'],  # I assume it's mostly San Miguel
-                    'Mendoza': ['Mendoza'],
-                    'Buenos Aires': ['Buenos Aires (city)', 'Avellaneda, Buenos Aires', 'La Plata, Buenos Aires'],
-                    'Santa Fe': ['Santa Fe', 'Rosario, Santa Fe'],
-                    'Guemes': ['General Guemes, Salta'],
-                    'Salta': ['Apolinario Saravia, Salta', 'Colonia Santa Rosa, Salta', 'Embarcación, Salta',
-                              'General Guemes, Salta', 'Metan, Salta', 'Tartagal, Salta', 'Oran, Salta',
-                              'Pichanal, Salta', 'Rosario de la Frontera, Salta', 'Salta, Salta', 'Salta',
-                              'Salvador Mazza, Salta', 'Santa Rosa, Salta']}
+    if isinstance(data, CaseCounts):
+        z = data.window(city, start_date, end_date)
+        d = np.flatnonzero(z).max() + 1
+        return np.arange(d), z[:d].astype(float)
+
+    import pandas as pd
+
     names = set_of_names[city]
 
     start_dt = np.datetime64(start_date)
@@ -58,24 +168,19 @@ def load_specific_city(data, city, start_date, end_date):
 def load_specific_city_dates(data, city, start_date, end_date):
     """
     Loads number of cases in a given period for a specified city (with dates).
-    :param data: full dataset (pandas.DataFrame)
+    :param data: full dataset or daily number of cases (pandas.DataFrame/CaseCounts)
     :param city: city name (str)
     :param start_date: starting date (str)
     :param end_date: ending date (str)
     :return: dates and number of cases for specified city (numpy.array, numpy.array)
     """
-    set_of_names = {'Tartagal': ['Tartagal, Salta'],
-                    'Jujuy': ['Jujuy', 'Pericho, Jujuy'],  # I assume it's Pericho plus San Salvador de Jujuy
-                    'Oran': ['Oran, Salta'],
-                    'Tucuman': ['Tucuman', 'San Miguel de Tucuman'],  # I assume it's mostly San Miguel
-                    'Mendoza': ['Mendoza'],
-                    'Buenos Aires': ['Buenos Aires (city)', 'Avellaneda, Buenos Aires', 'La Plata, Buenos Aires'],
-                    'Santa Fe': ['Santa Fe', 'Rosario, Santa Fe'],
-                    'Guemes': ['General Guemes, Salta'],
-                    'Salta': ['Apolinario Saravia, Salta', 'Colonia Santa Rosa, Salta', 'Embarcación, Salta',
-                              'General Guemes, Salta', 'Metan, Salta', 'Tartagal, Salta', 'Oran, Salta',
-                              'Pichanal, Salta', 'Rosario de la Frontera, Salta', 'Salta, Salta', 'Salta',
-                              'Salvador Mazza, Salta', 'Santa Rosa, Salta']}
+    if isinstance(data, CaseCounts):
+        z = data.window(city, start_date, end_date)
+        days = np.flatnonzero(z)
+        return (np.datetime64(start_date, 'D') + days).astype('datetime64[ns]'), z[days].astype(np.int64)
+
+    import pandas as pd
+
     names = set_of_names[city]
 
     start_dt = np.datetime64(start_date)
@@ -89,9 +194,17 @@ def load_specific_city_dates(data, city, start_date, end_date):
     return x, y
 
 
-def data_travel():
+def data_travel(path='data/travel.csv', sparse=False):
     """
-    Loads the travelling rates from a file.
-    :return: matrix of travelling rates (numpy.array)
+    Loads the travelling rates from a file, either a semicolon separated table or a
+    scipy.sparse matrix saved with scipy.sparse.save_npz (for large travel networks).
+    :param path: path of the file (str)
+    :param sparse: whether to return a sparse matrix (bool)
+    :return: matrix of travelling rates (numpy.array/scipy.sparse.csr_matrix)
     """
-    return np.loadtxt('data/travel.csv', delimiter=';')
+    if path.endswith('.npz'):
+        travel_matrix = scipy.sparse.load_npz(path).tocsr()
+        return travel_matrix if sparse else travel_matrix.toarray()
+
+    travel_matrix = np.loadtxt(path, delimiter=';')
+    return scipy.sparse.csr_matrix(travel_matrix) if sparse else travel_matrix
@@ -0,0 +1,694 @@
+import inspect
+import multiprocessing
+import time
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import partial
+
+import numpy as np
+
+from scipy.optimize import minimize
+
+from tools import (meta_population_sample, meta_population_sample_cached, meta_population_sample_gradient,
+                   meta_population_ensemble_sample, meta_population_solution, solution_cache, solution_checkpoints,
+                   SolutionCheckpoints, solver_log, beta_classes)
+
+_worker_problems = None
+
+# parameters of the objectives passed on to model_samples
+_sample_parameters = ('shift', 'gamma', 'Ns', 'M_c', 'travel_matrix', 'sampling', 'active_sampling', 'tol')
+
+
+def model_samples(pars, shift, gamma, Ns, M_c, travel_matrix, sampling, active_sampling, tol=1e-11):
+    """
+    Computes the samples for the fitted parameters, where the cities of the same size
+    class share the transmission rate (for Tartagal, Oran and Jujuy the first two).
+    :param pars: asym, beta_1, beta_2, t_0, init, phi (numpy.array)
+    :param shift: difference in days between first day and the first cases day (int)
+    :param gamma: recovery rate (float)
+    :param Ns: populations of the cities (numpy.array)
+    :param M_c: number of analysed cities (int)
+    :param travel_matrix: travelling rates (numpy.array)
+    :param sampling: sampling structure or its plan (dict/SamplingPlan)
+    :param active_sampling: number of past days a single sampling includes (int)
+    :param tol: relative and absolute tolerance of the integrator (float)
+    :return: one dimensional array of all samples (numpy.array)
+    """
+    args, kwargs = _sample_call(pars, shift, gamma, Ns, M_c, travel_matrix, sampling, active_sampling, tol)
+    return meta_population_sample_cached(*args, **kwargs)
+
+
+def _sample_call(pars, shift, gamma, Ns, M_c, travel_matrix, sampling, active_sampling, tol=1e-11):
+    """
+    Arguments of the meta_population_sample call of model_samples (same parameters).
+    :return: positional and keyword arguments (tuple, dict)
+    """
+    betas = beta_classes(Ns).dot(pars[1:3])
+    return ((sampling, pars[0], betas, gamma, pars[5], pars[3], pars[4], shift, Ns, M_c, travel_matrix),
+            {'init_n': M_c, 'active_sampling': active_sampling, 'rtol': tol, 'atol': tol})
+
+
+def model_samples_ensemble(points, shift, gamma, Ns, M_c, travel_matrix, sampling, active_sampling, tol=1e-11):
+    """
+    Computes the samples of model_samples for many parameter sets within a single ODE
+    solve (meta_population_ensemble_sample).
+    :param points: asym, beta_1, beta_2, t_0, init, phi of every parameter set, one per row (numpy.array)
+    :return: samples of all the parameter sets, one per row (numpy.array)
+    """
+    betas = points[:, 1:3].dot(beta_classes(Ns).T)
+    return meta_population_ensemble_sample(sampling, points[:, 0], betas, gamma, points[:, 5], points[:, 3],
+                                           points[:, 4], shift, Ns, M_c, travel_matrix, init_n=M_c,
+                                           active_sampling=active_sampling, rtol=tol, atol=tol)
+
+
+def model_checkpoint(pars, gamma, Ns, M_c, travel_matrix, plan, tol=1e-11):
+    """
+    Solves the model for the fitted parameters at the times of a plan and keeps the
+    solution in solution_checkpoints, so that model_samples with the same parameters and
+    a plan extending to later days only integrates the new days.
+    :param pars: asym, beta_1, beta_2, t_0, init, phi (numpy.array)
+    :param gamma: recovery rate (float)
+    :param Ns: populations of the cities (numpy.array)
+    :param M_c: number of analysed cities (int)
+    :param travel_matrix: travelling rates (numpy.array)
+    :param plan: plan of the sampling structure (SamplingPlan)
+    :param tol: relative and absolute tolerance of the integrator (float)
+    """
+    betas = beta_classes(Ns).dot(pars[1:3])
+    output = meta_population_solution(plan.times, pars[0], betas, gamma, pars[5], pars[3], pars[4], Ns, M_c,
+                                      travel_matrix, M_c, tol, tol)
+    solution_checkpoints.add(SolutionCheckpoints.key(pars[0], betas, gamma, pars[5], pars[3], pars[4], Ns, M_c,
+                                                     travel_matrix, M_c, tol, tol), plan.times, output)
+
+
+def squared_error(pars, shift, gamma, Ns, M_c, travel_matrix, sampling, y_sample, active_sampling,
+                  weight=None, tol=1e-11):
+    """
+    Mean squared error between the model samples and the data, optionally with each
+    residual divided by the data raised to a given power.
+    :param pars: asym, beta_1, beta_2, t_0, init, phi (numpy.array)
+    :param shift: difference in days between first day and the first cases day (int)
+    :param gamma: recovery rate (float)
+    :param Ns: populations of the cities (numpy.array)
+    :param M_c: number of analysed cities (int)
+    :param travel_matrix: travelling rates (numpy.array)
+    :param sampling: sampling structure or its plan (dict/SamplingPlan)
+    :param y_sample: observed number of cases (numpy.array)
+    :param active_sampling: number of past days a single sampling includes (int)
+    :param weight: exponent of the data weighting the residuals, None for no weights (float)
+    :param tol: relative and absolute tolerance of the integrator (float)
+    :return: value of the objective (float)
+    """
+    y_opt = model_samples(pars, shift, gamma, Ns, M_c, travel_matrix, sampling, active_sampling, tol)
+
+    if weight is not None:
+        objs = ((y_opt - y_sample) / y_sample**weight) ** 2.0
+    else:
+        objs = (y_opt - y_sample)**2.0
+
+    return objs.sum() / objs.shape[0]
+
+
+def undercount_error(pars, shift, gamma, Ns, M_c, travel_matrix, sampling, y_sample, active_sampling, tol=1e-11):
+    """
+    Mean error between the model samples and the data, which heavily penalises the
+    model predicting fewer cases than observed (only undercounting is allowed).
+    :param pars: asym, beta_1, beta_2, t_0, init, phi (numpy.array)
+    :param shift: difference in days between first day and the first cases day (int)
+    :param gamma: recovery rate (float)
+    :param Ns: populations of the cities (numpy.array)
+    :param M_c: number of analysed cities (int)
+    :param travel_matrix: travelling rates (numpy.array)
+    :param sampling: sampling structure or its plan (dict/SamplingPlan)
+    :param y_sample: observed number of cases (numpy.array)
+    :param active_sampling: number of past days a single sampling includes (int)
+    :param tol: relative and absolute tolerance of the integrator (float)
+    :return: value of the objective (float)
+    """
+    y_opt = model_samples(pars, shift, gamma, Ns, M_c, travel_matrix, sampling, active_sampling, tol)
+
+    residuals = y_opt - y_sample
+    objs_pos = residuals[residuals >= 0.0]**2.0
+    objs_neg = residuals[residuals < 0.0]**20.0
+
+    return (objs_pos.sum() + objs_neg.sum()) / (objs_pos.shape[0] + objs_neg.shape[0])
+
+
+def repeated_squared_error(pars, shift, gamma, Ns, M_c, travel_matrix, sampling, y_sample, active_sampling,
+                           r, opt_ids, tol=1e-11):
+    """
+    Mean squared error between the model samples and r repeated (noisy) samples of the
+    data, restricted to the selected entries.
+    :param pars: asym, beta_1, beta_2, t_0, init, phi (numpy.array)
+    :param shift: difference in days between first day and the first cases day (int)
+    :param gamma: recovery rate (float)
+    :param Ns: populations of the cities (numpy.array)
+    :param M_c: number of analysed cities (int)
+    :param travel_matrix: travelling rates (numpy.array)
+    :param sampling: sampling structure or its plan (dict/SamplingPlan)
+    :param y_sample: observed number of cases, each sample repeated r times (numpy.array)
+    :param active_sampling: number of past days a single sampling includes (int)
+    :param r: number of sample repeats (int)
+    :param opt_ids: which entries of the samples enter the objective (numpy.array)
+    :param tol: relative and absolute tolerance of the integrator (float)
+    :return: value of the objective (float)
+    """
+    y_opt = model_samples(pars, shift, gamma, Ns, M_c, travel_matrix, sampling, active_sampling, tol)
+
+    if r > 1:
+        y_opt = np.repeat(y_opt, r)
+
+    objs = (y_opt - y_sample)[opt_ids] ** 2.0
+
+    return objs.sum() / objs.shape[0]
+
+
+def model_samples_gradient(pars, shift, gamma, Ns, M_c, travel_matrix, sampling, active_sampling, tol=1e-11):
+    """
+    Computes the samples for the fitted parameters, together with their derivatives
+    over the fitted parameters obtained from the sensitivity equations.
+    :param pars: asym, beta_1, beta_2, t_0, init, phi (numpy.array)
+    :param shift: difference in days between first day and the first cases day (int)
+    :param gamma: recovery rate (float)
+    :param Ns: populations of the cities (numpy.array)
+    :param M_c: number of analysed cities (int)
+    :param travel_matrix: travelling rates (numpy.array)
+    :param sampling: sampling structure or its plan (dict/SamplingPlan)
+    :param active_sampling: number of past days a single sampling includes (int)
+    :param tol: relative and absolute tolerance of the integrator (float)
+    :return: one dimensional array of all samples and their derivatives with one
+             fitted parameter per column (numpy.array, numpy.array)
+    """
+    # the sensitivities are integrated along the two transmission rates of the classes only
+    beta_map = beta_classes(Ns)
+    betas = beta_map.dot(pars[1:3])
+    y_opt, grad = meta_population_sample_gradient(sampling, pars[0], betas, gamma, pars[5], pars[3], pars[4], shift,
+                                                  Ns, M_c, travel_matrix, init_n=M_c,
+                                                  active_sampling=active_sampling, rtol=tol, atol=tol,
+                                                  beta_map=beta_map)
+    return y_opt, grad
+
+
+def squared_error_gradient(pars, shift, gamma, Ns, M_c, travel_matrix, sampling, y_sample, active_sampling,
+                           weight=None, tol=1e-11):
+    """
+    Value and exact gradient of squared_error.
+    :param pars: asym, beta_1, beta_2, t_0, init, phi (numpy.array)
+    :param shift: difference in days between first day and the first cases day (int)
+    :param gamma: recovery rate (float)
+    :param Ns: populations of the cities (numpy.array)
+    :param M_c: number of analysed cities (int)
+    :param travel_matrix: travelling rates (numpy.array)
+    :param sampling: sampling structure or its plan (dict/SamplingPlan)
+    :param y_sample: observed number of cases (numpy.array)
+    :param active_sampling: number of past days a single sampling includes (int)
+    :param weight: exponent of the data weighting the residuals, None for no weights (float)
+    :param tol: relative and absolute tolerance of the integrator (float)
+    :return: value of the objective and its gradient (float, numpy.array)
+    """
+    y_opt, grad = model_samples_gradient(pars, shift, gamma, Ns, M_c, travel_matrix, sampling, active_sampling, tol)
+
+    residuals = y_opt - y_sample
+    if weight is not None:
+        residuals = residuals / y_sample**(2.0 * weight)
+        objs = residuals * (y_opt - y_sample)
+    else:
+        objs = residuals**2.0
+
+    return objs.sum() / objs.shape[0], 2.0 * residuals.dot(grad) / objs.shape[0]
+
+
+def undercount_error_gradient(pars, shift, gamma, Ns, M_c, travel_matrix, sampling, y_sample, active_sampling,
+                              tol=1e-11):
+    """
+    Value and exact gradient of undercount_error.
+    :param pars: asym, beta_1, beta_2, t_0, init, phi (numpy.array)
+    :param shift: difference in days between first day and the first cases day (int)
+    :param gamma: recovery rate (float)
+    :param Ns: populations of the cities (numpy.array)
+    :param M_c: number of analysed cities (int)
+    :param travel_matrix: travelling rates (numpy.array)
+    :param sampling: sampling structure or its plan (dict/SamplingPlan)
+    :param y_sample: observed number of cases (numpy.array)
+    :param active_sampling: number of past days a single sampling includes (int)
+    :param tol: relative and absolute tolerance of the integrator (float)
+    :return: value of the objective and its gradient (float, numpy.array)
+    """
+    y_opt, grad = model_samples_gradient(pars, shift, gamma, Ns, M_c, travel_matrix, sampling, active_sampling, tol)
+
+    residuals = y_opt - y_sample
+    objs = np.where(residuals >= 0.0, residuals**2.0, residuals**20.0)
+    d_objs = np.where(residuals >= 0.0, 2.0 * residuals, 20.0 * residuals**19.0)
+
+    return objs.sum() / objs.shape[0], d_objs.dot(grad) / objs.shape[0]
+
+
+def repeated_squared_error_gradient(pars, shift, gamma, Ns, M_c, travel_matrix, sampling, y_sample,
+                                    active_sampling, r, opt_ids, tol=1e-11):
+    """
+    Value and exact gradient of repeated_squared_error.
+    :param pars: asym, beta_1, beta_2, t_0, init, phi (numpy.array)
+    :param shift: difference in days between first day and the first cases day (int)
+    :param gamma: recovery rate (float)
+    :param Ns: populations of the cities (numpy.array)
+    :param M_c: number of analysed cities (int)
+    :param travel_matrix: travelling rates (numpy.array)
+    :param sampling: sampling structure or its plan (dict/SamplingPlan)
+    :param y_sample: observed number of cases, each sample repeated r times (numpy.array)
+    :param active_sampling: number of past days a single sampling includes (int)
+    :param r: number of sample repeats (int)
+    :param opt_ids: which entries of the samples enter the objective (numpy.array)
+    :param tol: relative and absolute tolerance of the integrator (float)
+    :return: value of the objective and its gradient (float, numpy.array)
+    """
+    y_opt, grad = model_samples_gradient(pars, shift, gamma, Ns, M_c, travel_matrix, sampling, active_sampling, tol)
+
+    if r > 1:
+        y_opt = np.repeat(y_opt, r)
+        grad = np.repeat(grad, r, axis=0)
+
+    residuals = (y_opt - y_sample)[opt_ids]
+    objs = residuals ** 2.0
+
+    return objs.sum() / objs.shape[0], 2.0 * residuals.dot(grad[opt_ids]) / objs.shape[0]
+
+
+def aggregate_samples(sampling, y_sample, period, r=1):
+    """
+    Aggregates the samples of every city over consecutive periods of days. The cases
+    observed within a period are summed and assigned to the last sampling day in that
+    period, which keeps the meaning of the sampling windows.
+    :param sampling: sampling structure (dict)
+    :param y_sample: observed number of cases, each sample repeated r times (numpy.array)
+    :param period: length of the aggregation period in days (int)
+    :param r: number of sample repeats (int)
+    :return: aggregated sampling structure and number of cases (dict, numpy.array)
+    """
+    if period <= 1:
+        return sampling, y_sample
+
+    y_sample = y_sample.reshape(-1, r)
+    aggregated_sampling = dict()
+    aggregated_sample = []
+    first = 0
+    for city in sampling.keys():
+        days = sampling[city]
+        _, starts = np.unique(days // period, return_index=True)
+        ends = np.append(starts[1:], days.shape[0]) - 1
+        aggregated_sampling[city] = days[ends]
+        aggregated_sample.append(np.add.reduceat(y_sample[first:first + days.shape[0]], starts, axis=0))
+        first += days.shape[0]
+
+    return aggregated_sampling, np.concatenate(aggregated_sample).reshape(-1)
+
+
+def random_initial_point(rng):
+    """
+    Draws a random starting point for the minimisation.
+    :param rng: random number generator (numpy.random.Generator)
+    :return: asym, beta_1, beta_2, t_0, init, phi (numpy.array)
+    """
+    return np.array([rng.random(), rng.random() * 0.179 + 0.001,
+                     rng.random() * 0.179 + 0.001, rng.random() * 20.0,
+                     rng.random() * 20.0, rng.random() * 2.0 * np.pi])
+
+
+def local_start(x0, objective, arguments, limits, gradient=None, budget=None):
+    """
+    Runs a single minimisation from a given starting point.
+    :param x0: starting point (numpy.array)
+    :param objective: objective function (callable)
+    :param arguments: additional arguments of the objective (tuple)
+    :param limits: bounds of the parameters (list)
+    :param gradient: objective returning also its exact gradient, None for finite differences (callable)
+    :param budget: maximal number of iterations, 0 or None to run until convergence (int)
+    :return: optimal parameters followed by the objective value (list)
+    """
+    tic = time.perf_counter()
+    options = {'maxiter': int(budget)} if budget else dict()
+    if gradient is None:
+        res = minimize(objective, x0, args=arguments, bounds=limits, options=options)
+    else:
+        # with exact gradients the default relative reduction test stops too early along
+        # the flat directions (phi, t_0), while the line search handles the convergence
+        res = minimize(gradient, x0, args=arguments, bounds=limits, jac=True, options={'ftol': 1e-15, **options})
+    value = objective(res.x, *arguments)
+
+    solver_log.write('restart', wall_time=time.perf_counter() - tic, x0=np.asarray(x0), x=res.x,
+                     objective=value, iterations=res.nit, objective_calls=res.nfev, status=res.status,
+                     success=res.success, message=res.message)
+    return list(res.x) + [value]
+
+
+def sample_arguments(objective, arguments):
+    """
+    Picks the arguments of model_samples out of the additional arguments of an objective
+    by the names of its parameters, with the defaults of the ones not given.
+    :param objective: objective function (callable)
+    :param arguments: additional arguments of the objective (tuple)
+    :return: shift, gamma, Ns, M_c, travel_matrix, sampling, active_sampling and tol, None if
+             the objective does not take all of them (tuple)
+    """
+    try:
+        bound = inspect.signature(objective).bind(None, *arguments)
+    except (TypeError, ValueError):
+        return None
+    bound.apply_defaults()
+    if any(name not in bound.arguments for name in _sample_parameters):
+        return None
+    return tuple(bound.arguments[name] for name in _sample_parameters)
+
+
+def evaluate_points(points, objective, arguments):
+    """
+    Evaluates the objective at several points. The objectives built on model_samples get
+    the samples of all the points from a single ensemble solve, which for tens of points
+    costs a few single solves, while the other objectives solve point by point.
+    :param points: asym, beta_1, beta_2, t_0, init, phi of every point, one per row (numpy.array)
+    :param objective: objective function (callable)
+    :param arguments: additional arguments of the objective (tuple)
+    :return: objective values (numpy.array)
+    """
+    sample_args = sample_arguments(objective, arguments)
+    if sample_args is None:
+        return np.array([objective(point, *arguments) for point in points], dtype=float)
+
+    samples = model_samples_ensemble(points, *sample_args)
+    # the ensemble samples stand in for the solves only while the points are evaluated
+    solution_cache.provide(meta_population_sample, [_sample_call(point, *sample_args) + (sample,)
+                                                    for point, sample in zip(points, samples)])
+    try:
+        return np.array([objective(point, *arguments) for point in points], dtype=float)
+    finally:
+        solution_cache.withdraw()
+
+
+def screened_point(rng, screen, objective, arguments):
+    """
+    Draws several random starting points and picks the one with the lowest objective value,
+    evaluated at all the points at once (evaluate_points).
+    :param rng: random number generator (numpy.random.Generator)
+    :param screen: number of drawn points (int)
+    :param objective: objective function (callable)
+    :param arguments: additional arguments of the objective (tuple)
+    :return: asym, beta_1, beta_2, t_0, init, phi (numpy.array)
+    """
+    points = np.array([random_initial_point(rng) for _ in range(screen)])
+    values = evaluate_points(points, objective, arguments)
+    return points[np.argmin(np.where(np.isnan(values), np.inf, values))]
+
+
+def single_start(seed, objective, arguments, limits, gradient=None, budget=None, screen=1):
+    """
+    Runs a single minimisation from a random starting point.
+    :param seed: seed of the restart (numpy.random.SeedSequence)
+    :param objective: objective function (callable)
+    :param arguments: additional arguments of the objective (tuple)
+    :param limits: bounds of the parameters (list)
+    :param gradient: objective returning also its exact gradient, None for finite differences (callable)
+    :param budget: maximal number of iterations, 0 or None to run until convergence (int)
+    :param screen: number of random points the best starting point is screened from (int)
+    :return: optimal parameters followed by the objective value (list)
+    """
+    rng = np.random.default_rng(seed)
+    x0 = random_initial_point(rng) if screen <= 1 else screened_point(rng, screen, objective, arguments)
+    return local_start(x0, objective, arguments, limits, gradient, budget)
+
+
+def _init_worker(problems):
+    """
+    Stores the fitting problems in a pool worker, so that the data is sent only once per worker.
+    """
+    global _worker_problems
+    _worker_problems = problems
+
+
+def _run_worker(task):
+    """
+    Runs a single minimisation on one of the fitting problems stored in the pool worker,
+    and reports its wall time and the use of the worker's solution cache during it.
+    """
+    start, k, item, label = task
+    solver_log.context = label
+    before = solution_cache.info()
+    tic = time.perf_counter()
+    result = start(item, *_worker_problems[k])
+    elapsed = time.perf_counter() - tic
+    after = solution_cache.info()
+    return result, elapsed, after['hits'] - before['hits'], after['misses'] - before['misses']
+
+
+def run_problems(start, tasks, problems, workers=1, callback=None, labels=None):
+    """
+    Runs a minimisation for every task, i.e. a seed or a starting point of one of the
+    fitting problems, possibly spread over a pool of processes. The results are returned
+    in the order of the tasks.
+    :param start: single_start or local_start (callable)
+    :param tasks: index of the problem and seed or starting point of every minimisation (list)
+    :param problems: objective, its additional arguments, bounds of the parameters,
+                     objective with gradient (or None) and optionally the iteration budget
+                     of every problem (list)
+    :param workers: number of worker processes (int)
+    :param callback: called with the index of the task, its result and wall time as soon
+                     as a minimisation finishes (callable)
+    :param labels: context of every task added to the records of solver_log (list)
+    :return: optimal parameters followed by the objective value, one per task (list)
+    """
+    if labels is None:
+        labels = [{'problem': k, 'task': i} for i, (k, _) in enumerate(tasks)]
+    results = [None] * len(tasks)
+    if workers <= 1:
+        for i, (k, item) in enumerate(tasks):
+            solver_log.context = labels[i]
+            tic = time.perf_counter()
+            results[i] = start(item, *problems[k])
+            if callback is not None:
+                callback(i, results[i], time.perf_counter() - tic)
+        solver_log.context = dict()
+        return results
+
+    # fork lets the workers start without re-running the driver scripts
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context('fork' if 'fork' in methods else None)
+    hits, misses = 0, 0
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_worker,
+                             initargs=(problems,)) as pool:
+        futures = {pool.submit(_run_worker, (start, k, item, labels[i])): i for i, (k, item) in enumerate(tasks)}
+        for future in as_completed(futures):
+            i = futures[future]
+            results[i], elapsed, task_hits, task_misses = future.result()
+            hits, misses = hits + task_hits, misses + task_misses
+            if callback is not None:
+                callback(i, results[i], elapsed)
+
+    # the workers have their own caches, their counters are added to the main one
+    with solution_cache.lock:
+        solution_cache.hits += hits
+        solution_cache.misses += misses
+
+    return results
+
+
+def run_starts(start, items, objective, arguments, limits, gradient=None, workers=1):
+    """
+    Runs a minimisation for every item (seed or starting point), possibly spread over
+    a pool of processes. The results are returned in the order of the items.
+    :param start: single_start or local_start (callable)
+    :param items: seeds or starting points of the minimisations (list)
+    :param objective: objective function (callable)
+    :param arguments: additional arguments of the objective (tuple)
+    :param limits: bounds of the parameters (list)
+    :param gradient: objective returning also its exact gradient, None for finite differences (callable)
+    :param workers: number of worker processes (int)
+    :return: optimal parameters followed by the objective value, one minimisation per row (numpy.array)
+    """
+    tasks = [(0, item) for item in items]
+    return np.array(run_problems(start, tasks, [(objective, arguments, limits, gradient)], workers))
+
+
+def restart_seeds(seed, m):
+    """
+    Spawns the seeds of the restarts from the main seed.
+    :param seed: main seed, None for a fresh one (int/numpy.random.SeedSequence)
+    :param m: number of restarts (int)
+    :return: one seed per restart (list)
+    """
+    if not isinstance(seed, np.random.SeedSequence):
+        seed = np.random.SeedSequence(seed)
+    return seed.spawn(m)
+
+
+def multi_start(objective, arguments, limits, m, seed=None, gradient=None, workers=1):
+    """
+    Minimises the objective from m random starting points. Every restart draws its
+    starting point from its own seed spawned from the main one, so the results do not
+    depend on the number of workers the restarts are spread over.
+    :param objective: objective function (callable)
+    :param arguments: additional arguments of the objective (tuple)
+    :param limits: bounds of the parameters (list)
+    :param m: number of different initial conditions (int)
+    :param seed: main seed, None for a fresh one (int/numpy.random.SeedSequence)
+    :param gradient: objective returning also its exact gradient, None for finite differences (callable)
+    :param workers: number of worker processes (int)
+    :return: optimal parameters followed by the objective value, one restart per row (numpy.array)
+    """
+    return run_starts(single_start, restart_seeds(seed, m), objective, arguments, limits, gradient, workers)
+
+
+def fidelity_ladder(objective, stage_arguments, limits, m, keep=0.2, seed=None, gradient=None, workers=1,
+                    store=None, budgets=None, screen=1):
+    """
+    Minimises the objective from m random starting points in stages of increasing fidelity
+    (e.g. loose tolerance and aggregated data first). After every stage but the last one
+    only the best fraction of the candidates is kept, and the survivors are minimised
+    again in the next stage starting from their current optima. With a single stage this
+    is the same as multi_start.
+    :param objective: objective function (callable)
+    :param stage_arguments: additional arguments of the objective, one tuple per stage (list)
+    :param limits: bounds of the parameters (list)
+    :param m: number of different initial conditions (int)
+    :param keep: fraction of the candidates kept after every stage (float)
+    :param seed: main seed, None for a fresh one (int/numpy.random.SeedSequence)
+    :param gradient: objective returning also its exact gradient, None for finite differences (callable)
+    :param workers: number of worker processes (int)
+    :param store: store the results are written to and the finished ones read from (ResultStore)
+    :param budgets: maximal number of iterations of every stage, 0 or None to run until
+                    convergence, None for no limits (list)
+    :param screen: number of random points every restart screens its starting point from (int)
+    :return: final optimal parameters followed by the objective value for the candidates
+             surviving all the stages, in the order of the restarts, the number of
+             candidates and wall time of every stage, and the last stage of every restart
+             followed by its parameters and objective value there (numpy.array, list, numpy.array)
+    """
+    wss, stages, finals = fidelity_ladders([(objective, stage_arguments, limits, gradient)], m, keep=keep,
+                                           seeds=[seed], workers=workers, store=store, budgets=budgets,
+                                           screen=screen)
+    return wss[0], stages, finals[0]
+
+
+def fidelity_ladders(problems, m, keep=0.2, seeds=None, workers=1, store=None, budgets=None, screen=1):
+    """
+    Runs the fidelity ladder of several fitting problems at once, so that the restarts of
+    all the problems share the pool of processes in every stage. All the problems must
+    have the same number of stages. With a store every finished minimisation is written
+    to the disk immediately, and the ones already in the store are not run again.
+    With iteration budgets the ladder is a successive halving of the restarts: every
+    candidate gets a few iterations, only the best fraction continues with a larger
+    budget from where it stopped, and so on until the last stage, which can run until
+    convergence. The stages can repeat the same fidelity, so that only the budget grows.
+    With screening every restart draws several random points and starts from the best one
+    of them in the first stage, evaluated with a single ensemble solve (screened_point).
+    :param problems: objective, its additional arguments for every stage, bounds of the
+                     parameters and objective with gradient (or None) of every problem (list)
+    :param m: number of different initial conditions of every problem (int)
+    :param keep: fraction of the candidates of every problem kept after every stage (float)
+    :param seeds: main seed of every problem, None for fresh ones (list)
+    :param workers: number of worker processes (int)
+    :param store: store the results are written to and the finished ones read from (ResultStore)
+    :param budgets: maximal number of iterations of every stage, 0 or None to run until
+                    convergence, None for no limits (list)
+    :param screen: number of random points every restart screens its starting point from (int)
+    :return: final optimal parameters followed by the objective value for the candidates
+             surviving all the stages, one array per problem, the total number of
+             candidates, number of resumed candidates and wall time of every stage, and the
+             last stage reached by every restart followed by its parameters and objective
+             value there, one array per problem with a row per restart (list, list, list)
+    """
+    if seeds is None:
+        seeds = [None] * len(problems)
+    n_stages = len(problems[0][1])
+    if any(len(stage_arguments) != n_stages for _, stage_arguments, _, _ in problems):
+        raise ValueError('all the problems must have the same number of stages')
+    if budgets is None:
+        budgets = [None] * n_stages
+    if len(budgets) != n_stages:
+        raise ValueError('the budgets must have one value per stage')
+
+    stages = []
+    # candidates are identified by the problem and the restart they come from
+    candidates = [(i, restart) for i in range(len(problems)) for restart in range(m)]
+    # the last stage every candidate reached, with its result there
+    last = dict()
+    for k in range(n_stages):
+        tic = time.perf_counter()
+        stage_problems = [(objective, stage_arguments[k], limits, gradient, budgets[k])
+                          for objective, stage_arguments, limits, gradient in problems]
+        if k == 0:
+            start = single_start if screen <= 1 else partial(single_start, screen=screen)
+            spawned = [restart_seeds(seed, m) for seed in seeds]
+            items = [spawned[i][restart] for i, restart in candidates]
+        else:
+            start = local_start
+            survivors = []
+            for i in range(len(problems)):
+                ids = [candidate for candidate in candidates if candidate[0] == i]
+                values = np.array([optima[candidate][-1] for candidate in ids])
+                n = max(1, int(np.ceil(keep * len(ids))))
+                survivors.extend(ids[j] for j in np.sort(np.argsort(values, kind='stable')[:n]))
+            candidates = survivors
+            # the survivors continue from where they stopped
+            items = [np.asarray(optima[candidate][:-1]) for candidate in candidates]
+
+        results = [store.get(i, k, restart) if store is not None else None for i, restart in candidates]
+        todo = [j for j, result in enumerate(results) if result is None]
+
+        def finished(j, result, elapsed):
+            if store is not None:
+                problem, restart = candidates[todo[j]]
+                store.append(problem, k, restart, result, elapsed)
+
+        labels = [{'problem': candidates[j][0], 'stage': k, 'restart': candidates[j][1]} for j in todo]
+        computed = run_problems(start, [(candidates[j][0], items[j]) for j in todo], stage_problems, workers,
+                                callback=finished, labels=labels)
+        for j, result in zip(todo, computed):
+            results[j] = result
+
+        optima = dict(zip(candidates, results))
+        last.update({candidate: [k] + list(result) for candidate, result in optima.items()})
+        stages.append({'candidates': len(candidates), 'resumed': len(candidates) - len(todo),
+                       'time': time.perf_counter() - tic})
+
+    wss = [np.array([list(optima[candidate]) for candidate in candidates if candidate[0] == i])
+           for i in range(len(problems))]
+    finals = [np.array([last[(i, restart)] for restart in range(m)]) for i in range(len(problems))]
+    return wss, stages, finals
+
+
+def fidelity_schedule(tols, periods, budgets=(0,)):
+    """
+    Pairs the integration tolerances with the data aggregation periods and the iteration
+    budgets of the fitting stages, where a single value is used in all the stages.
+    :param tols: tolerances of the integrator (list)
+    :param periods: aggregation periods of the data in days (list)
+    :param budgets: maximal numbers of iterations, 0 to run until convergence (list)
+    :return: tolerance, aggregation period and iteration budget of every stage (list)
+    """
+    n = max(len(tols), len(periods), len(budgets))
+    if any(len(values) not in (1, n) for values in (tols, periods, budgets)):
+        raise ValueError('tolerances, periods and budgets must have the same number of stages')
+
+    return list(zip(np.broadcast_to(tols, n), np.broadcast_to(periods, n), np.broadcast_to(budgets, n)))
+
+
+def format_stages(stages, schedule):
+    """
+    Summarises the stages of the fidelity ladder.
+    :param stages: number of candidates and wall time of every stage (list)
+    :param schedule: tolerance, aggregation period and iteration budget of every stage (list)
+    :return: one line per stage (str)
+    """
+    return '\n'.join(['stage {}: {} candidates ({} resumed), tolerance {:.0e}, period {} days, {}, {:.1f} s'.format(
+        k, stage['candidates'], stage.get('resumed', 0), tol, period,
+        'at most {} iterations'.format(budget) if budget else 'until convergence', stage['time'])
+        for k, (stage, (tol, period, budget)) in enumerate(zip(stages, schedule))])
+
+
+def format_cache(info):
+    """
+    Summarises the use of the solution cache.
+    :param info: usage of the cache, as given by SolutionCache.info (dict)
+    :return: one line summary (str)
+    """
+    calls = info['hits'] + info['misses']
+    return 'solution cache: {} hits, {} misses ({:.1f}% hit rate), {} of {} entries used'.format(
+        info['hits'], info['misses'], 100.0 * info['hits'] / max(calls, 1), info['size'], info['maxsize'])
@@ -0,0 +1,272 @@
+import json
+import os
+import time
+
+import numpy as np
+
+from scipy.linalg import solve_triangular
+from scipy.special import logsumexp
+
+from tools.fitting_tools import evaluate_points, run_problems
+
+# ranges the random restarts draw their starting points from (asym, beta_1, beta_2, t_0, init, phi),
+# used as the uniform prior within the bounds of the parameters
+prior_box = np.array([[0.0, 1.0], [0.001, 0.18], [0.001, 0.18], [0.0, 20.0], [0.0, 20.0], [0.0, 2.0 * np.pi]])
+
+
+def prior_bounds(limits):
+    """
+    Intersects the bounds of the fitted parameters with prior_box.
+    :param limits: bounds of the parameters, None for no bound (list)
+    :return: lower and upper bound of the uniform prior of every parameter (numpy.array)
+    """
+    bounds = prior_box.copy()
+    for k, (lower, upper) in enumerate(limits):
+        if lower is not None:
+            bounds[k, 0] = max(bounds[k, 0], lower)
+        if upper is not None:
+            bounds[k, 1] = min(bounds[k, 1], upper)
+    return bounds
+
+
+def evaluate_chunk(points, objective, arguments, limits, gradient=None):
+    """
+    Evaluates the objective at a chunk of points with a single ensemble solve
+    (evaluate_points), with the signature of local_start so that the chunks can be spread
+    over the pool of run_problems.
+    :param points: parameters, one point per row (numpy.array)
+    :param objective: objective function (callable)
+    :param arguments: additional arguments of the objective (tuple)
+    :param limits: bounds of the parameters, unused (list)
+    :param gradient: objective with gradient, unused (callable)
+    :return: objective values (list)
+    """
+    return list(evaluate_points(points, objective, arguments))
+
+
+def weighted_quantiles(values, weights, levels):
+    """
+    :param values: values of the particles, one particle per row (numpy.array)
+    :param weights: normalised weights of the particles (numpy.array)
+    :param levels: probabilities of the quantiles (list)
+    :return: quantiles of every column, one level per row (numpy.array)
+    """
+    quantiles = []
+    for column in values.T:
+        order = np.argsort(column)
+        cumulative = np.cumsum(weights[order]) - 0.5 * weights[order]
+        quantiles.append(np.interp(levels, cumulative, column[order]))
+    return np.array(quantiles).T
+
+
+class ABCSMC:
+    """
+    Approximate Bayesian computation by sequential Monte Carlo (population Monte Carlo of
+    Beaumont et al., 2009) with the objective of a fitting problem as the distance between
+    the model and the data, and a uniform prior. Every generation lowers the tolerance to
+    a quantile of the distances of the previous population, perturbs particles drawn from
+    it with a Gaussian kernel of twice their covariance and keeps the proposals within the
+    tolerance. The population grows when the weights degenerate, so that the effective
+    sample size stays near the requested number of particles. The proposals of a batch are
+    split into chunks, every chunk is evaluated with a single ensemble solve and the chunks
+    are spread over a pool of processes. The state is written to the disk after every
+    generation, so that an interrupted run resumes from the last one.
+    """
+
+    def __init__(self, path=None, particles=500, quantile=0.5, max_particles=None, seed=None, ensemble=50):
+        """
+        :param path: file the state is written to and resumed from, None for no file (str)
+        :param particles: effective number of particles of every generation (int)
+        :param quantile: quantile of the distances giving the next tolerance (float)
+        :param max_particles: maximal number of particles of a generation, None for 4 * particles (int)
+        :param seed: main seed, None for a fresh one (int)
+        :param ensemble: maximal number of proposals evaluated with one ensemble solve (int)
+        """
+        self.path = path
+        self.ensemble = ensemble
+        self.settings = {'particles': particles, 'quantile': quantile,
+                         'max_particles': max_particles if max_particles is not None else 4 * particles}
+        self.generation = -1
+        self.theta = None
+        self.weights = None
+        self.distances = None
+        self.bounds = None
+        self.history = []
+
+        if path is not None and os.path.exists(path):
+            self.load()
+        else:
+            self.seed = int(np.random.SeedSequence(seed).entropy)
+            self.rng = np.random.default_rng(self.seed)
+
+    def load(self):
+        """
+        Restores the state written by save.
+        """
+        with np.load(self.path) as state:
+            settings = json.loads(str(state['settings']))
+            if settings != self.settings:
+                raise ValueError('sampler {} was created with different settings, use another name'.format(
+                    self.path))
+            self.seed = int(state['seed'])
+            self.generation = int(state['generation'])
+            self.theta = state['theta']
+            self.weights = state['weights']
+            self.distances = state['distances']
+            self.bounds = state['bounds']
+            self.history = json.loads(str(state['history']))
+            self.rng = np.random.default_rng()
+            self.rng.bit_generator.state = json.loads(str(state['rng']))
+
+    def save(self):
+        """
+        Writes the state to the disk, replacing the previous one at once.
+        """
+        if self.path is None:
+            return
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        temporary = self.path + '.tmp.npz'
+        np.savez(temporary, settings=json.dumps(self.settings), seed=self.seed, generation=self.generation,
+                 theta=self.theta, weights=self.weights, distances=self.distances, bounds=self.bounds,
+                 history=json.dumps(self.history), rng=json.dumps(self.rng.bit_generator.state))
+        os.replace(temporary, self.path)
+
+    def evaluate(self, points, problem, workers):
+        """
+        :param points: parameters, one point per row (numpy.array)
+        :param problem: objective, its additional arguments, bounds of the parameters and
+                        objective with gradient (or None) (tuple)
+        :param workers: number of worker processes (int)
+        :return: distances of the points, infinite where the objective fails (numpy.array)
+        """
+        # one chunk per worker, unless the chunks would exceed the ensemble size
+        n = points.shape[0]
+        chunks = np.array_split(points, max(workers, int(np.ceil(n / self.ensemble)), 1)) if n else []
+        chunks = [chunk for chunk in chunks if chunk.shape[0] > 0]
+        labels = [{'generation': self.generation + 1, 'chunk': i} for i in range(len(chunks))]
+        values = run_problems(evaluate_chunk, [(0, chunk) for chunk in chunks], [problem], workers, labels=labels)
+        distances = np.array([value for chunk in values for value in chunk], dtype=float).reshape(-1)
+        distances[~np.isfinite(distances)] = np.inf
+        return distances
+
+    def run(self, problem, generations, bounds=None, workers=1, min_acceptance=0.01):
+        """
+        Runs the sampler until the given number of generations (including the resumed ones)
+        or until the acceptance rate (accepted particles per model evaluation) falls below
+        min_acceptance.
+        :param problem: objective, its additional arguments, bounds of the parameters and
+                        objective with gradient (or None) (tuple)
+        :param generations: number of generations (int)
+        :param bounds: lower and upper bound of the uniform prior of every parameter, None for
+                       prior_bounds of the problem (numpy.array)
+        :param workers: number of worker processes (int)
+        :param min_acceptance: acceptance rate below which the sampler stops (float)
+        :return: the sampler (ABCSMC)
+        """
+        bounds = prior_bounds(problem[2]) if bounds is None else np.asarray(bounds, dtype=float)
+        if self.bounds is not None and not np.array_equal(self.bounds, bounds):
+            raise ValueError('sampler {} was created with a different prior'.format(self.path))
+        self.bounds = bounds
+
+        while self.generation + 1 < generations:
+            if self.history and self.history[-1]['acceptance'] < min_acceptance:
+                break
+            tic = time.perf_counter()
+            if self.generation < 0:
+                record = self.first_generation(problem, workers)
+            else:
+                record = self.next_generation(problem, workers)
+            self.generation += 1
+            record['time'] = time.perf_counter() - tic
+            self.history.append(record)
+            self.save()
+        return self
+
+    def first_generation(self, problem, workers):
+        """
+        Draws the first population from the prior, accepting all the particles.
+        :return: summary of the generation (dict)
+        """
+        n = self.settings['particles']
+        lower, upper = self.bounds.T
+        self.theta = lower + self.rng.random((n, lower.shape[0])) * (upper - lower)
+        self.distances = self.evaluate(self.theta, problem, workers)
+        self.weights = np.full(n, 1.0 / n)
+        return {'epsilon': float('inf'), 'particles': n, 'proposals': n, 'evaluations': n, 'acceptance': 1.0,
+                'ess': float(n)}
+
+    def next_generation(self, problem, workers):
+        """
+        Draws the next population within the tolerance given by the current one.
+        :return: summary of the generation (dict)
+        """
+        settings = self.settings
+        epsilon = np.quantile(self.distances[np.isfinite(self.distances)], settings['quantile'])
+
+        # the population grows as much as the effective sample size fell in the last generation
+        ess = self.history[-1]['ess']
+        n = int(min(settings['max_particles'],
+                    max(settings['particles'], np.ceil(settings['particles'] * self.theta.shape[0] / ess))))
+
+        covariance = 2.0 * np.atleast_2d(np.cov(self.theta.T, aweights=self.weights))
+        covariance += 1e-12 * np.diag((self.bounds[:, 1] - self.bounds[:, 0])**2)
+        cholesky = np.linalg.cholesky(covariance)
+
+        accepted_theta, accepted_distances = [], []
+        proposals, evaluations = 0, 0
+        # the batches are sized by the expected share of accepted proposals
+        rate = max(self.history[-1]['particles'] / self.history[-1]['proposals'] * settings['quantile'], 1e-3)
+        while sum(d.shape[0] for d in accepted_distances) < n:
+            missing = n - sum(d.shape[0] for d in accepted_distances)
+            batch = int(min(np.ceil(1.2 * missing / rate), 10 * n))
+            ancestors = self.rng.choice(self.theta.shape[0], size=batch, p=self.weights)
+            points = self.theta[ancestors] + self.rng.standard_normal((batch, self.theta.shape[1])).dot(cholesky.T)
+
+            # the proposals outside the prior are rejected without solving the model
+            inside = np.all((points >= self.bounds[:, 0]) & (points <= self.bounds[:, 1]), axis=1)
+            distances = np.full(batch, np.inf)
+            distances[inside] = self.evaluate(points[inside], problem, workers)
+            accepted = distances <= epsilon
+            accepted_theta.append(points[accepted])
+            accepted_distances.append(distances[accepted])
+
+            proposals += batch
+            evaluations += int(inside.sum())
+            rate = max(sum(d.shape[0] for d in accepted_distances) / proposals, 1e-3)
+
+        theta = np.concatenate(accepted_theta)[:n]
+        distances = np.concatenate(accepted_distances)[:n]
+
+        # importance weights of the uniform prior against the mixture of perturbation kernels
+        differences = (theta[:, None, :] - self.theta[None, :, :]).reshape(-1, theta.shape[1])
+        residuals = solve_triangular(cholesky, differences.T, lower=True)
+        log_kernels = -0.5 * (residuals**2).sum(0).reshape(theta.shape[0], self.theta.shape[0])
+        log_weights = -logsumexp(log_kernels, axis=1, b=self.weights[None, :])
+        weights = np.exp(log_weights - log_weights.max())
+        weights /= weights.sum()
+
+        self.theta, self.distances, self.weights = theta, distances, weights
+        return {'epsilon': float(epsilon), 'particles': n, 'proposals': proposals, 'evaluations': evaluations,
+                'acceptance': float(n / evaluations), 'ess': float(1.0 / (weights**2).sum())}
+
+    def summary(self, levels=(0.025, 0.5, 0.975)):
+        """
+        :param levels: probabilities of the reported quantiles (tuple)
+        :return: weighted mean and quantiles of every parameter of the last population
+                 (numpy.array, numpy.array)
+        """
+        return self.weights.dot(self.theta), weighted_quantiles(self.theta, self.weights, list(levels))
+
+
+def format_history(history):
+    """
+    :param history: summary of every generation (list)
+    :return: tolerance, number of particles, evaluations, acceptance rate, effective
+             sample size and wall time of every generation (str)
+    """
+    lines = []
+    for k, record in enumerate(history):
+        lines.append('generation {}: epsilon {:.4g}, {} particles, {} evaluations, acceptance {:.3f}, '
+                     'ess {:.0f}, {:.1f} s'.format(k, record['epsilon'], record['particles'], record['evaluations'],
+                                                  record['acceptance'], record['ess'], record['time']))
+    return '\n'.join(lines)
@@ -1,16 +1,144 @@
 
+import hashlib
+import json
+import os
+import threading
+import time
+
+from collections import OrderedDict
+
 import numpy as np
 
-from scipy.integrate import odeint
+from scipy import sparse
+from scipy.sparse.csgraph import reverse_cuthill_mckee
 
-from tools import meta_population_siarw
+from tools import MetaPopulationModel, MetaPopulationEnsemble, MetaPopulationSensitivity, MetaPopulationTauLeaping
+from tools.solver_tools import integrator
 
 t_max = 2300
 
 
-def meta_population_solution(t, asym, beta, gamma, phi, t_0, init, Ns, M_c, travel_matrix, init_n=4):
+class SolverLog:
+    """
+    Opt-in log of the integrator and optimiser statistics, written as JSON lines to a file
+    while a fit runs. Every record is written with a single call on a file opened for
+    appending, so the pool workers (forked with the log open) can share the file. The
+    context (e.g. problem, stage and restart of the running minimisation) is added to
+    every record.
+    """
+
+    def __init__(self):
+        self.fd = None
+        self.context = dict()
+        self.lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        """
+        :return: whether the log is open (bool)
+        """
+        return self.fd is not None
+
+    def open(self, path):
+        """
+        Starts logging, appending to a file.
+        :param path: path of the log file (str)
+        """
+        self.close()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+
+    def close(self):
+        """
+        Stops logging.
+        """
+        with self.lock:
+            if self.fd is not None:
+                os.close(self.fd)
+                self.fd = None
+
+    def write(self, event, **fields):
+        """
+        Writes a record if the log is open.
+        :param event: kind of the record, e.g. 'solve' or 'restart' (str)
+        :param fields: values of the record, convertible to JSON (dict)
+        """
+        if self.fd is None:
+            return
+        record = {'event': event, 'time': time.time(), 'pid': os.getpid()}
+        record.update(self.context)
+        record.update(fields)
+        line = (json.dumps(record, default=_to_json) + '\n').encode()
+        with self.lock:
+            os.write(self.fd, line)
+
+
+def _to_json(value):
+    """
+    Converts the numpy values in a log record to JSON.
+    """
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    return str(value)
+
+
+solver_log = SolverLog()
+
+
+def integrate(rhs, y0, t, parameters, **kwargs):
+    """
+    Solves the ODEs with the solver selected in integrator (odeint by default), and when
+    solver_log is open also records the solver and the statistics of the solve: wall
+    time and the steps, right hand side and Jacobian evaluations reported by the solver,
+    and for odeint the switches between the non-stiff (Adams) and stiff (BDF) methods of
+    LSODA, the method and step size at the end and the share of the output intervals
+    finished with BDF.
+    :param rhs: right hand side of the ODEs (callable)
+    :param y0: initial values (numpy.array)
+    :param t: times at which to find the ODE solution (numpy.array)
+    :param parameters: model parameters written to the record (dict)
+    :param kwargs: other arguments of the solver, as named by odeint (dict)
+    :return: solution of the ODEs (numpy.array)
+    """
+    if not solver_log.enabled:
+        return integrator.solve(rhs, y0, t, **kwargs)[0]
+
+    tic = time.perf_counter()
+    output, statistics = integrator.solve(rhs, y0, t, statistics=True, **kwargs)
+    elapsed = time.perf_counter() - tic
+    solver_log.write('solve', solver=integrator.name, wall_time=elapsed, n_variables=y0.shape[0],
+                     n_times=t.shape[0], rtol=kwargs.get('rtol'), atol=kwargs.get('atol'), **statistics,
+                     **parameters)
+    return output
+
+
+def initial_conditions(init, Ns, M_c, init_n=4):
+    """
+    Builds the initial state of the meta-population ODEs, with the initial
+    cases placed among the asymptomatic of the first init_n cities.
+    :param init: number of initial cases (float/numpy.array)
+    :param Ns: populations of the cities (numpy.array)
+    :param M_c: number of analysed cities (int)
+    :param init_n: number of cities with initial cases (int)
+    :return: initial values of the meta-population ODEs variables (numpy.array)
+    """
+    y0 = np.zeros(M_c * 5)
+    y0[np.arange(0, M_c * 5, 5)] = Ns
+    y0[0 + 5 * np.arange(init_n)] = y0[0 + 5 * np.arange(init_n)] - init
+    y0[2 + 5 * np.arange(init_n)] = init
+    return y0
+
+
+def meta_population_solution(t, asym, beta, gamma, phi, t_0, init, Ns, M_c, travel_matrix, init_n=4,
+                             rtol=1e-11, atol=1e-11):
     """
-    Solves the meta-population ODEs and returns the values for specified times.
+    Solves the meta-population ODEs and returns the values for specified times. When
+    solution_checkpoints holds a solution with the same parameters, the times it covers
+    are read from it and only the new ones are integrated, from its nearest state.
     :param t: times at which to find the ODE solution (numpy.array)
     :param asym: fraction of asymptomatic cases (float)
     :param beta: transmission rate/s (float/numpy.array)
@@ -20,23 +148,67 @@ def meta_population_solution(t, asym, beta, gamma, phi, t_0, init, Ns, M_c, trav
     :param init: number of initial cases (float/numpy.array)
     :param Ns: populations of the cities (numpy.array)
     :param M_c: number of analysed cities (int)
-    :param travel_matrix: travelling rates (numpy.array)
+    :param travel_matrix: travelling rates (numpy.array/scipy.sparse matrix)
     :param init_n: number of cities with initial cases (int)
+    :param rtol: relative tolerance of the integrator (float)
+    :param atol: absolute tolerance of the integrator (float)
     :return: solution of the ODE equations for the meta-population model (numpy.array)
     """
-    y0 = np.zeros(M_c * 5)
-    y0[np.arange(0, M_c * 5, 5)] = Ns
-    y0[0 + 5 * np.arange(init_n)] = y0[0 + 5 * np.arange(init_n)] - init
-    y0[2 + 5 * np.arange(init_n)] = init
+    parameters = {'asym': asym, 'beta': beta, 'phi': phi, 't_0': t_0, 'init': init, 'M_c': M_c}
+    if len(solution_checkpoints) > 0:
+        output = solution_checkpoints.extend(
+            SolutionCheckpoints.key(asym, beta, gamma, phi, t_0, init, Ns, M_c, travel_matrix, init_n, rtol, atol), t,
+            lambda y0, tail: _solve_from(y0, tail, asym, beta, gamma, phi, t_0, Ns, M_c, travel_matrix, parameters,
+                                         rtol, atol))
+        if output is not None:
+            return output
+
+    y0 = initial_conditions(init, Ns, M_c, init_n)
+    return _solve_from(y0, t, asym, beta, gamma, phi, t_0, Ns, M_c, travel_matrix, parameters, rtol, atol)
 
-    p = {'asym': asym, 'beta': beta, 'gamma': gamma, 'phi': phi,
-         't_0': t_0, 'Ns': Ns, 'M_c': M_c, 'travel_matrix': travel_matrix}
 
-    return odeint(meta_population_siarw, y0, t, args=(p,), mxstep=10000, rtol=1e-11, atol=1e-11)
+def _solve_from(y0, t, asym, beta, gamma, phi, t_0, Ns, M_c, travel_matrix, parameters, rtol, atol):
+    """
+    Integrates the meta-population ODEs from the given state at the first time.
+    """
+    if not sparse.issparse(travel_matrix):
+        model = MetaPopulationModel(asym, beta, gamma, phi, t_0, Ns, M_c, travel_matrix)
+        return integrate(model.rhs, y0, t, parameters, Dfun=model.jac, mxstep=10000, rtol=rtol, atol=atol)
+
+    # with a sparse travel network the cities are reordered to narrow the banded Jacobian,
+    # and the solution is returned in the original order
+    order = travel_ordering(travel_matrix)
+    beta = np.broadcast_to(np.asarray(beta, dtype=float), (M_c,))[order]
+    travel_matrix = sparse.csr_matrix(travel_matrix)[order][:, order]
+    model = MetaPopulationModel(asym, beta, gamma, phi, t_0, Ns[order], M_c, travel_matrix)
+
+    output = integrate(model.rhs, y0.reshape(M_c, 5)[order].reshape(-1), t, parameters, Dfun=model.jac_banded,
+                       ml=model.ml, mu=model.mu, mxstep=10000, rtol=rtol, atol=atol)
+    return output.reshape(-1, M_c, 5)[:, np.argsort(order)].reshape(output.shape)
+
+
+def travel_ordering(travel_matrix):
+    """
+    Orders the cities so that the cities connected by travel are close to each other
+    (reverse Cuthill-McKee ordering of the travel network), which narrows the band of
+    the Jacobian. The original order is kept if it is already narrower.
+    :param travel_matrix: travelling rates (scipy.sparse matrix)
+    :return: permutation of the cities (numpy.array)
+    """
+    pattern = sparse.csr_matrix(travel_matrix)
+    pattern = (pattern + pattern.T).tocsr()
+    identity = np.arange(pattern.shape[0])
+    order = reverse_cuthill_mckee(pattern, symmetric_mode=True).astype(int)
+
+    def bandwidth(permutation):
+        routes = pattern[permutation][:, permutation].tocoo()
+        return np.abs(routes.row - routes.col).max(initial=0)
+
+    return order if bandwidth(order) < bandwidth(identity) else identity
 
 
 def meta_population_cumulative(t, asym, beta, gamma, phi, t_0, init, shift, Ns, M_c, travel_matrix,
-                               init_n=4, active_sampling=14):
+                               init_n=4, active_sampling=14, rtol=1e-11, atol=1e-11):
     """
     Computes the cumulative (over last 14 days or until previous observation) values of all
     meta-population ODEs variables and for all cities at the specified days. First axis of
@@ -52,37 +224,25 @@ def meta_population_cumulative(t, asym, beta, gamma, phi, t_0, init, shift, Ns,
     :param shift: difference in days between first day and the first cases day (int)
     :param Ns: populations of the cities (numpy.array)
     :param M_c: number of analysed cities (int)
-    :param travel_matrix: travelling rates (numpy.array)
+    :param travel_matrix: travelling rates (numpy.array/scipy.sparse matrix)
     :param init_n: number of cities with initial cases (int)
     :param active_sampling: number of past days a single sampling includes (int)
+    :param rtol: relative tolerance of the integrator (float)
+    :param atol: absolute tolerance of the integrator (float)
     :return: cumulative values for different variables at different times (numpy.array)
     """
-    y0 = np.zeros(M_c * 5)
-    y0[np.arange(0, M_c * 5, 5)] = Ns
-    y0[0 + 5 * np.arange(init_n)] = y0[0 + 5 * np.arange(init_n)] - init
-    y0[2 + 5 * np.arange(init_n)] = init
-
-    p = {'asym': asym, 'beta': beta, 'gamma': gamma, 'phi': phi,
-         't_0': t_0, 'Ns': Ns, 'M_c': M_c, 'travel_matrix': travel_matrix}
-
-    tau = np.concatenate(([shift], t))
-    tau[tau <= shift] = shift
-    tau = np.concatenate(([shift], np.max([t - active_sampling, tau[:-1]], axis=0), t))
-    order = np.argsort(tau)
-
-    output = odeint(meta_population_siarw, y0, tau[order], args=(p,), mxstep=10000, rtol=1e-11, atol=1e-11)
-
-    reverse = np.argsort(order)
-    return (output[reverse[int(1 + tau.shape[0] / 2):], :] -
-            output[reverse[1:int(1 + tau.shape[0] / 2)], :])
+    plan = SamplingPlan.cumulative(t, shift, active_sampling)
+    output = meta_population_solution(plan.times, asym, beta, gamma, phi, t_0, init, Ns, M_c, travel_matrix,
+                                      init_n, rtol, atol)
+    return plan.observe(output)
 
 
 def meta_population_sample(sampling, asym, beta, gamma, phi, t_0, init, shift, Ns, M_c, travel_matrix,
-                           init_n=4, active_sampling=14):
+                           init_n=4, active_sampling=14, rtol=1e-11, atol=1e-11):
     """
     Computes all the samples according to the sampling structure, which specifies times for different
     cities. The result is a single vector of number of cases.
-    :param sampling: sampling structure (dict)
+    :param sampling: sampling structure or its plan (dict/SamplingPlan)
     :param asym: fraction of asymptomatic cases (float)
     :param beta: transmission rate/s (float/numpy.array)
     :param gamma: recovery rate (float)
@@ -92,20 +252,617 @@ def meta_population_sample(sampling, asym, beta, gamma, phi, t_0, init, shift, N
     :param shift: difference in days between first day and the first cases day (int)
     :param Ns: populations of the cities (numpy.array)
     :param M_c: number of analysed cities (int)
-    :param travel_matrix: travelling rates (numpy.array)
+    :param travel_matrix: travelling rates (numpy.array/scipy.sparse matrix)
     :param init_n: number of cities with initial cases (int)
     :param active_sampling: number of past days a single sampling includes (int)
+    :param rtol: relative tolerance of the integrator (float)
+    :param atol: absolute tolerance of the integrator (float)
     :return: one dimensional array of all samples (numpy.array)
     """
-    t = np.arange(shift, t_max)
-    output = meta_population_solution(t, asym, beta, gamma, phi, t_0, init, Ns, M_c, travel_matrix, init_n)
+    plan = sampling_plan(sampling, shift, active_sampling)
+    output = meta_population_solution(plan.times, asym, beta, gamma, phi, t_0, init, Ns, M_c, travel_matrix,
+                                      init_n, rtol, atol)
+    return plan.observe(output)
+
 
-    res = []
-    for j, city in enumerate(sampling.keys()):
+def sampling_windows(sampling, shift, active_sampling=14):
+    """
+    Finds, for every city in the sampling structure, the days at which the samples are
+    taken and the days at which the corresponding sampling windows open (14 days before
+    or at the previous observation, but never before the shift).
+    :param sampling: sampling structure or its plan (dict/SamplingPlan)
+    :param shift: difference in days between first day and the first cases day (int)
+    :param active_sampling: number of past days a single sampling includes (int)
+    :return: pairs of sampling days and window opening days for all cities (list)
+    """
+    windows = []
+    for city in sampling.keys():
         pre_sampling = sampling[city][:-1]
         pre_sampling = np.insert(pre_sampling, 0, shift)
         pre_sampling[pre_sampling < shift] = shift
         pre_sampling = np.max([sampling[city] - active_sampling, pre_sampling], axis=0)
-        res.append(output[sampling[city], 4 + 5 * j] - output[pre_sampling, 4 + 5 * j])
+        windows.append((sampling[city], pre_sampling))
+
+    return windows
+
+
+def sampling_times(windows, shift, relative=True):
+    """
+    Collects all the days used by the sampling windows into the times at which the ODEs
+    have to be solved, so that the integration stops at the last observation instead of
+    running over a dense daily grid. The days count from the start of the solve at the
+    shift, i.e. the day d is the row d of the daily grid np.arange(shift, t_max) that
+    meta_population_sample used to solve on, unless they are times themselves (as the
+    observation days of meta_population_cumulative).
+    :param windows: pairs of sampling days and window opening days for all cities (list)
+    :param shift: difference in days between first day and the first cases day (int)
+    :param relative: whether the days count from the shift (bool)
+    :return: sorted times starting at the shift and the pairs of rows corresponding to
+             the windows of every city (numpy.array, list)
+    """
+    origin = shift if relative else 0
+    days = np.concatenate([np.concatenate(window) for window in windows])
+    days = np.unique(np.concatenate(([shift - origin], days)))
+    rows = [(np.searchsorted(days, post_sampling), np.searchsorted(days, pre_sampling))
+            for post_sampling, pre_sampling in windows]
+    times = (days + origin).astype(float)
+
+    return times, rows
+
+
+class SamplingPlan:
+    """
+    Observation operator of a sampling structure: the times at which the ODEs have to be
+    solved and a flat gather of the rows and columns of the solution at both ends of every
+    sampling window, so that the samples are read from a solution in one vectorised step.
+    A plan is built once per sampling structure and can be passed instead of it to all
+    the sample functions. The sampling days count from the shift (see sampling_times).
+    """
+
+    def __init__(self, sampling, shift, active_sampling=14, relative=True):
+        """
+        :param sampling: sampling structure or its plan (dict/SamplingPlan)
+        :param shift: difference in days between first day and the first cases day (int)
+        :param active_sampling: number of past days a single sampling includes (int)
+        :param relative: whether the sampling days count from the shift (bool)
+        """
+        self.sampling = sampling
+        self.shift = shift
+        self.active_sampling = active_sampling
+        self.relative = relative
+
+        windows = sampling_windows(sampling, shift, active_sampling)
+        self.times, rows = sampling_times(windows, shift, relative)
+        self.post = np.concatenate([post_rows for post_rows, _ in rows])
+        self.pre = np.concatenate([pre_rows for _, pre_rows in rows])
+        # the new cases (G) of the j-th city of the sampling structure are in the column 5 * j + 4
+        self.columns = np.concatenate([np.full(post_rows.shape[0], 5 * j + 4)
+                                       for j, (post_rows, _) in enumerate(rows)])
+
+        digest = hashlib.blake2b(b'plan', digest_size=20)
+        _update_digest(digest, (shift, active_sampling, relative, self.times, self.post, self.pre, self.columns))
+        self.digest = digest.digest()
+
+    @classmethod
+    def cumulative(cls, t, shift, active_sampling=14):
+        """
+        Plan of the windows of all the variables at common observation days, which are
+        times rather than days from the shift, as used by meta_population_cumulative.
+        :param t: observation days (numpy.array)
+        :param shift: difference in days between first day and the first cases day (int)
+        :param active_sampling: number of past days a single sampling includes (int)
+        :return: plan observing every variable (SamplingPlan)
+        """
+        plan = cls({'all': np.asarray(t)}, shift, active_sampling, relative=False)
+        plan.columns = None
+        return plan
+
+    def __len__(self):
+        return self.post.shape[0]
+
+    def observe(self, output):
+        """
+        :param output: solution at the times of the plan, with time along the first axis and
+                       variable along the last one (numpy.array)
+        :return: samples along the first axis, followed by the axes between time and variable
+                 of the solution (numpy.array)
+        """
+        if self.columns is None:
+            return output[self.post] - output[self.pre]
+        return output[self.post, ..., self.columns] - output[self.pre, ..., self.columns]
+
+
+def sampling_plan(sampling, shift, active_sampling=14):
+    """
+    :param sampling: sampling structure or its plan (dict/SamplingPlan)
+    :param shift: difference in days between first day and the first cases day (int)
+    :param active_sampling: number of past days a single sampling includes (int)
+    :return: plan of the sampling structure (SamplingPlan)
+    """
+    if isinstance(sampling, SamplingPlan):
+        if sampling.shift != shift or sampling.active_sampling != active_sampling:
+            raise ValueError('sampling plan was built for shift {} and active sampling {}'.format(
+                sampling.shift, sampling.active_sampling))
+        return sampling
+    return SamplingPlan(sampling, shift, active_sampling)
 
-    return np.concatenate(res)
+
+def meta_population_ensemble_solution(t, asym, beta, gamma, phi, t_0, init, Ns, M_c, travel_matrix, init_n=4,
+                                      rtol=1e-11, atol=1e-11):
+    """
+    Solves the meta-population ODEs for K parameter sets at once and returns the values
+    for specified times. All the parameters apart from gamma carry the ensemble along
+    their first axis.
+    :param t: times at which to find the ODE solution (numpy.array)
+    :param asym: fractions of asymptomatic cases (numpy.array of shape (K,))
+    :param beta: transmission rates (numpy.array of shape (K,) or (K, M_c))
+    :param gamma: recovery rate (float)
+    :param phi: seasonality phases (numpy.array of shape (K,))
+    :param t_0: seasonality parameters (numpy.array of shape (K,))
+    :param init: numbers of initial cases (numpy.array of shape (K,) or (K, init_n))
+    :param Ns: populations of the cities (numpy.array)
+    :param M_c: number of analysed cities (int)
+    :param travel_matrix: travelling rates (numpy.array)
+    :param init_n: number of cities with initial cases (int)
+    :param rtol: relative tolerance of the integrator (float)
+    :param atol: absolute tolerance of the integrator (float)
+    :return: solutions of the ODE equations, with axes time, member and variable (numpy.array)
+    """
+    model = MetaPopulationEnsemble(asym, beta, gamma, phi, t_0, Ns, M_c, travel_matrix)
+    y0 = np.concatenate([initial_conditions(init_k, Ns, M_c, init_n) for init_k in init])
+
+    parameters = {'asym': asym, 'beta': beta, 'phi': phi, 't_0': t_0, 'init': init, 'M_c': M_c, 'K': model.K}
+    output = integrate(model.rhs, y0, t, parameters, Dfun=model.jac, ml=model.mu, mu=model.mu,
+                       mxstep=10000, rtol=rtol, atol=atol)
+    return output.reshape(t.shape[0], model.K, model.n)
+
+
+def meta_population_ensemble_sample(sampling, asym, beta, gamma, phi, t_0, init, shift, Ns, M_c, travel_matrix,
+                                    init_n=4, active_sampling=14, rtol=1e-11, atol=1e-11):
+    """
+    Computes the samples of meta_population_sample for K parameter sets within a single
+    ODE solve. All the parameters apart from gamma carry the ensemble along their first axis.
+    :param sampling: sampling structure or its plan (dict/SamplingPlan)
+    :param asym: fractions of asymptomatic cases (numpy.array of shape (K,))
+    :param beta: transmission rates (numpy.array of shape (K,) or (K, M_c))
+    :param gamma: recovery rate (float)
+    :param phi: seasonality phases (numpy.array of shape (K,))
+    :param t_0: seasonality parameters (numpy.array of shape (K,))
+    :param init: numbers of initial cases (numpy.array of shape (K,) or (K, init_n))
+    :param shift: difference in days between first day and the first cases day (int)
+    :param Ns: populations of the cities (numpy.array)
+    :param M_c: number of analysed cities (int)
+    :param travel_matrix: travelling rates (numpy.array)
+    :param init_n: number of cities with initial cases (int)
+    :param active_sampling: number of past days a single sampling includes (int)
+    :param rtol: relative tolerance of the integrator (float)
+    :param atol: absolute tolerance of the integrator (float)
+    :return: samples of all the parameter sets, one per row (numpy.array of shape (K, n_samples))
+    """
+    plan = sampling_plan(sampling, shift, active_sampling)
+    output = meta_population_ensemble_solution(plan.times, asym, beta, gamma, phi, t_0, init, Ns, M_c, travel_matrix,
+                                               init_n, rtol, atol)
+    return plan.observe(output).T
+
+
+def meta_population_sensitivity(t, asym, beta, gamma, phi, t_0, init, Ns, M_c, travel_matrix, init_n=4,
+                                rtol=1e-11, atol=1e-11, beta_map=None):
+    """
+    Solves the meta-population ODEs together with the forward sensitivity equations and
+    returns both for specified times. The sensitivities are the derivatives of the variables
+    over asym, the transmission rate of every city (or class, with beta_map), t_0, init and
+    phi (in this order). The steps are controlled by the error of the model variables and
+    of the sensitivities scaled by their parameters (MetaPopulationSensitivity.tolerances).
+    :param t: times at which to find the ODE solution (numpy.array)
+    :param asym: fraction of asymptomatic cases (float)
+    :param beta: transmission rate/s (float/numpy.array)
+    :param gamma: recovery rate (float)
+    :param phi: seasonality phase (float)
+    :param t_0: seasonality parameter (float)
+    :param init: number of initial cases (float)
+    :param Ns: populations of the cities (numpy.array)
+    :param M_c: number of analysed cities (int)
+    :param travel_matrix: travelling rates (numpy.array)
+    :param init_n: number of cities with initial cases (int)
+    :param rtol: relative tolerance of the integrator (float)
+    :param atol: absolute tolerance of the integrator (float)
+    :param beta_map: transmission rates of the cities per unit of the rate of every class,
+                     None for the rates of the cities (numpy.array)
+    :return: solution with axes time and variable, and sensitivities with axes time,
+             parameter and variable (numpy.array, numpy.array)
+    """
+    model = MetaPopulationSensitivity(asym, beta, gamma, phi, t_0, Ns, M_c, travel_matrix, beta_map)
+    z0 = model.initial_conditions(initial_conditions(init, Ns, M_c, init_n), init_n)
+
+    parameters = {'asym': asym, 'beta': beta, 'phi': phi, 't_0': t_0, 'init': init, 'M_c': M_c,
+                  'sensitivity': True}
+    output = integrate(model.rhs, z0, t, parameters, Dfun=model.jac, ml=model.mu, mu=model.mu,
+                       mxstep=10000, rtol=rtol, atol=model.tolerances(atol, init))
+    return output[:, :model.n], output[:, model.n:].reshape(t.shape[0], model.P, model.n)
+
+
+def meta_population_sample_gradient(sampling, asym, beta, gamma, phi, t_0, init, shift, Ns, M_c, travel_matrix,
+                                    init_n=4, active_sampling=14, rtol=1e-11, atol=1e-11, beta_map=None):
+    """
+    Computes the samples of meta_population_sample together with their exact derivatives
+    over asym, the transmission rate of every city (or class, with beta_map), t_0, init and
+    phi (in this order).
+    :param sampling: sampling structure or its plan (dict/SamplingPlan)
+    :param asym: fraction of asymptomatic cases (float)
+    :param beta: transmission rate/s (float/numpy.array)
+    :param gamma: recovery rate (float)
+    :param phi: seasonality phase (float)
+    :param t_0: seasonality parameter (float)
+    :param init: number of initial cases (float)
+    :param shift: difference in days between first day and the first cases day (int)
+    :param Ns: populations of the cities (numpy.array)
+    :param M_c: number of analysed cities (int)
+    :param travel_matrix: travelling rates (numpy.array)
+    :param init_n: number of cities with initial cases (int)
+    :param active_sampling: number of past days a single sampling includes (int)
+    :param rtol: relative tolerance of the integrator (float)
+    :param atol: absolute tolerance of the integrator (float)
+    :param beta_map: transmission rates of the cities per unit of the rate of every class,
+                     None for the rates of the cities (numpy.array)
+    :return: one dimensional array of all samples and their derivatives with one
+             parameter per column (numpy.array, numpy.array)
+    """
+    plan = sampling_plan(sampling, shift, active_sampling)
+    output, sensitivities = meta_population_sensitivity(plan.times, asym, beta, gamma, phi, t_0, init, Ns, M_c,
+                                                        travel_matrix, init_n, rtol, atol, beta_map)
+    return plan.observe(output), plan.observe(sensitivities)
+
+
+def meta_population_tau_leaping(t, asym, beta, gamma, phi, t_0, init, Ns, M_c, travel_matrix, r, rng, init_n=4,
+                                dt=0.25):
+    """
+    Simulates r replicates of the stochastic meta-population model (MetaPopulationTauLeaping)
+    with fixed steps and returns their states at specified times. The replicates start at the
+    first time from initial_conditions rounded to whole individuals, and every time is
+    reported after the first step reaching it.
+    :param t: sorted times at which to report the states (numpy.array)
+    :param asym: fraction of asymptomatic cases (float)
+    :param beta: transmission rate/s (float/numpy.array)
+    :param gamma: recovery rate (float)
+    :param phi: seasonality phase (float)
+    :param t_0: seasonality parameter (float)
+    :param init: number of initial cases (float/numpy.array)
+    :param Ns: populations of the cities (numpy.array)
+    :param M_c: number of analysed cities (int)
+    :param travel_matrix: travelling rates (numpy.array/scipy.sparse matrix)
+    :param r: number of replicates (int)
+    :param rng: random number generator (numpy.random.Generator)
+    :param init_n: number of cities with initial cases (int)
+    :param dt: length of a step in days (float)
+    :return: states of the replicates, with axes time, replicate and variable (numpy.array)
+    """
+    model = MetaPopulationTauLeaping(asym, beta, gamma, phi, t_0, Ns, M_c, travel_matrix)
+    y0 = np.round(initial_conditions(init, np.round(Ns), M_c, init_n)).astype(np.int64)
+    y = np.tile(y0.reshape(1, M_c, 5), (r, 1, 1))
+
+    t = np.asarray(t, dtype=float)
+    steps = np.ceil((t - t[0]) / dt - 1e-9).astype(int)
+    output = np.empty((t.shape[0], r, 5 * M_c))
+    k = 0
+    for step in range(steps[-1] + 1):
+        while k < t.shape[0] and steps[k] == step:
+            output[k] = y.reshape(r, -1)
+            k += 1
+        if step < steps[-1]:
+            model.step(y, t[0] + step * dt, dt, rng)
+    return output
+
+
+def meta_population_stochastic_cumulative(t, asym, beta, gamma, phi, t_0, init, shift, Ns, M_c, travel_matrix, r,
+                                          rng, init_n=4, active_sampling=14, dt=0.25):
+    """
+    Computes the cumulative values of meta_population_cumulative for r replicates of the
+    stochastic model (meta_population_tau_leaping).
+    :param t: times at which to find the values (numpy.array)
+    :param asym: fraction of asymptomatic cases (float)
+    :param beta: transmission rate/s (float/numpy.array)
+    :param gamma: recovery rate (float)
+    :param phi: seasonality phase (float)
+    :param t_0: seasonality parameter (float)
+    :param init: number of initial cases (float/numpy.array)
+    :param shift: difference in days between first day and the first cases day (int)
+    :param Ns: populations of the cities (numpy.array)
+    :param M_c: number of analysed cities (int)
+    :param travel_matrix: travelling rates (numpy.array/scipy.sparse matrix)
+    :param r: number of replicates (int)
+    :param rng: random number generator (numpy.random.Generator)
+    :param init_n: number of cities with initial cases (int)
+    :param active_sampling: number of past days a single sampling includes (int)
+    :param dt: length of a step in days (float)
+    :return: cumulative values, with axes time, replicate and variable (numpy.array)
+    """
+    plan = SamplingPlan.cumulative(t, shift, active_sampling)
+    output = meta_population_tau_leaping(plan.times, asym, beta, gamma, phi, t_0, init, Ns, M_c, travel_matrix, r,
+                                         rng, init_n, dt)
+    return plan.observe(output)
+
+
+def meta_population_stochastic_sample(sampling, asym, beta, gamma, phi, t_0, init, shift, Ns, M_c, travel_matrix,
+                                      r, rng, init_n=4, active_sampling=14, dt=0.25):
+    """
+    Computes the samples of meta_population_sample for r replicates of the stochastic
+    model (meta_population_tau_leaping).
+    :param sampling: sampling structure or its plan (dict/SamplingPlan)
+    :param asym: fraction of asymptomatic cases (float)
+    :param beta: transmission rate/s (float/numpy.array)
+    :param gamma: recovery rate (float)
+    :param phi: seasonality phase (float)
+    :param t_0: seasonality parameter (float)
+    :param init: number of initial cases (float/numpy.array)
+    :param shift: difference in days between first day and the first cases day (int)
+    :param Ns: populations of the cities (numpy.array)
+    :param M_c: number of analysed cities (int)
+    :param travel_matrix: travelling rates (numpy.array/scipy.sparse matrix)
+    :param r: number of replicates (int)
+    :param rng: random number generator (numpy.random.Generator)
+    :param init_n: number of cities with initial cases (int)
+    :param active_sampling: number of past days a single sampling includes (int)
+    :param dt: length of a step in days (float)
+    :return: samples of all the replicates, one per row (numpy.array of shape (r, n_samples))
+    """
+    plan = sampling_plan(sampling, shift, active_sampling)
+    output = meta_population_tau_leaping(plan.times, asym, beta, gamma, phi, t_0, init, Ns, M_c, travel_matrix, r,
+                                         rng, init_n, dt)
+    return plan.observe(output).T
+
+
+class SolutionCache:
+    """
+    Bounded least recently used cache for the results of the ODE based functions, keyed
+    on a hash of the function and all its arguments (parameters and sampling structure).
+    Each process holds its own cache, so it can be used inside the pool workers, and the
+    bookkeeping is guarded by a lock for the use from several threads.
+    """
+
+    def __init__(self, maxsize=128):
+        """
+        :param maxsize: maximal number of stored results, 0 disables the cache (int)
+        """
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.provided = dict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def resize(self, maxsize):
+        """
+        Changes the maximal number of stored results, evicting the oldest ones if needed.
+        :param maxsize: maximal number of stored results, 0 disables the cache (int)
+        """
+        with self.lock:
+            self.maxsize = maxsize
+            while len(self.entries) > max(maxsize, 0):
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        """
+        Removes all the stored results and resets the counters.
+        """
+        with self.lock:
+            self.entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def info(self):
+        """
+        Reports the usage of the cache.
+        :return: number of hits, misses, stored results and the maximal size (dict)
+        """
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self.entries), 'maxsize': self.maxsize}
+
+    def provide(self, function, calls):
+        """
+        Makes results computed elsewhere (e.g. by an ensemble solve) the results of calls of
+        the function until withdraw, also with the cache disabled. They are neither stored
+        nor counted.
+        :param function: function the results belong to (callable)
+        :param calls: positional arguments, keyword arguments and result of every call (list)
+        """
+        provided = {self.key(function, args, kwargs): result for args, kwargs, result in calls}
+        with self.lock:
+            self.provided.update(provided)
+
+    def withdraw(self):
+        """
+        Removes all the results given by provide.
+        """
+        with self.lock:
+            self.provided.clear()
+
+    @staticmethod
+    def key(function, args, kwargs):
+        """
+        Hashes a function call with the selected solver.
+        :param function: called function (callable)
+        :param args: positional arguments (tuple)
+        :param kwargs: keyword arguments (dict)
+        :return: digest of the call (bytes)
+        """
+        # results of different solvers are stored apart
+        digest = hashlib.blake2b((function.__name__ + ':' + integrator.name).encode(), digest_size=20)
+        _update_digest(digest, args)
+        _update_digest(digest, sorted(kwargs.items()))
+        return digest.digest()
+
+    def __call__(self, function, *args, **kwargs):
+        """
+        Returns the provided or stored result of the call if present, otherwise calls the
+        function and stores its result.
+        :param function: called function (callable)
+        :return: result of the function, a copy of the stored array (numpy.array)
+        """
+        if self.maxsize <= 0 and not self.provided:
+            return function(*args, **kwargs)
+
+        key = self.key(function, args, kwargs)
+        with self.lock:
+            if key in self.provided:
+                return self.provided[key].copy()
+            if self.maxsize > 0 and key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key].copy()
+
+        result = function(*args, **kwargs)
+        if self.maxsize <= 0:
+            return result
+
+        with self.lock:
+            self.misses += 1
+            self.entries[key] = result.copy()
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+        return result
+
+
+class SolutionCheckpoints:
+    """
+    Solutions of the ODEs kept for a few parameter sets, e.g. the optima of the last fit,
+    keyed like the solution cache on a hash of the parameters. A later solve with the same
+    parameters reads the times covered by a checkpoint from it and only integrates the
+    new times, starting from its last state before them, so that extending the data by a
+    few days costs a short integration instead of a solve from the shift. The checkpoints can
+    be saved to and loaded from a .npz file.
+    """
+
+    def __init__(self):
+        self.entries = dict()
+        self.hits = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    @staticmethod
+    def key(asym, beta, gamma, phi, t_0, init, Ns, M_c, travel_matrix, init_n=4, rtol=1e-11, atol=1e-11):
+        """
+        Hashes the parameters of a solve, the arguments of meta_population_solution but the
+        times, with the selected solver.
+        :return: digest of the parameters (bytes)
+        """
+        # solutions of different solvers are kept apart
+        digest = hashlib.blake2b(('checkpoint:' + integrator.name).encode(), digest_size=20)
+        _update_digest(digest, (asym, beta, gamma, phi, t_0, init, Ns, M_c, travel_matrix, init_n, rtol, atol))
+        return digest.digest()
+
+    def add(self, key, t, output):
+        """
+        :param key: digest of the parameters, from key (bytes)
+        :param t: increasing times of the solution (numpy.array)
+        :param output: solution at the times (numpy.array)
+        """
+        self.entries[key] = (np.asarray(t, dtype=float), np.asarray(output))
+
+    def clear(self):
+        """
+        Removes all the checkpoints and resets the counter.
+        """
+        self.entries.clear()
+        self.hits = 0
+
+    def extend(self, key, t, solve):
+        """
+        Solution at the given times from the checkpoint of the parameters: the times up to
+        the first one the checkpoint does not have are read from it, and the later ones are
+        integrated from its last state before that time.
+        :param key: digest of the parameters, from key (bytes)
+        :param t: increasing times at which to find the ODE solution (numpy.array)
+        :param solve: integrates the ODEs from a state at the first of the given times (callable)
+        :return: solution at the times, None without a checkpoint starting at the first time (numpy.array)
+        """
+        if key not in self.entries:
+            return None
+        known_t, known_output = self.entries[key]
+        t = np.asarray(t, dtype=float)
+        rows = np.searchsorted(known_t, t)
+        known = known_t[np.minimum(rows, known_t.shape[0] - 1)] == t
+        first = np.argmin(known) if not known.all() else t.shape[0]
+        if first == 0:
+            return None
+
+        output = np.empty((t.shape[0],) + known_output.shape[1:])
+        output[:first] = known_output[rows[:first]]
+        if first < t.shape[0]:
+            last = rows[first] - 1
+            output[first:] = solve(known_output[last], np.concatenate(([known_t[last]], t[first:])))[1:]
+        self.hits += 1
+        return output
+
+    def save(self, path):
+        """
+        :param path: path of the .npz file (str)
+        """
+        arrays = {'keys': np.array([np.frombuffer(key, dtype=np.uint8) for key in self.entries]).reshape(-1, 20)}
+        for i, (t, output) in enumerate(self.entries.values()):
+            arrays['t_{}'.format(i)] = t
+            arrays['output_{}'.format(i)] = output
+        np.savez(path, **arrays)
+
+    def load(self, path):
+        """
+        Replaces the checkpoints by the ones of a file written by save.
+        :param path: path of the .npz file (str)
+        """
+        self.clear()
+        with np.load(path) as arrays:
+            for i, key in enumerate(arrays['keys']):
+                self.add(key.tobytes(), arrays['t_{}'.format(i)], arrays['output_{}'.format(i)])
+
+
+solution_checkpoints = SolutionCheckpoints()
+
+
+def _update_digest(digest, value):
+    """
+    Feeds a (possibly nested) argument into a hash.
+    """
+    if isinstance(value, dict):
+        digest.update(b'{')
+        for item in value.items():
+            _update_digest(digest, item)
+        digest.update(b'}')
+    elif isinstance(value, (list, tuple)):
+        digest.update(b'(')
+        for item in value:
+            _update_digest(digest, item)
+        digest.update(b')')
+    elif isinstance(value, str):
+        digest.update(b's' + value.encode())
+    elif value is None:
+        digest.update(b'n')
+    elif isinstance(value, SamplingPlan):
+        digest.update(b'p' + value.digest)
+    elif sparse.issparse(value):
+        value = sparse.csr_matrix(value)
+        digest.update(b'c')
+        _update_digest(digest, (value.shape, value.data, value.indices, value.indptr))
+    else:
+        value = np.ascontiguousarray(value)
+        digest.update(value.dtype.str.encode() + str(value.shape).encode())
+        digest.update(value.tobytes())
+
+
+solution_cache = SolutionCache()
+
+
+def meta_population_sample_cached(*args, **kwargs):
+    """
+    Memoised meta_population_sample (same arguments), stored in solution_cache.
+    :return: one dimensional array of all samples (numpy.array)
+    """
+    return solution_cache(meta_population_sample, *args, **kwargs)
+
+
+def meta_population_cumulative_cached(*args, **kwargs):
+    """
+    Memoised meta_population_cumulative (same arguments), stored in solution_cache.
+    :return: cumulative values for different variables at different times (numpy.array)
+    """
+    return solution_cache(meta_population_cumulative, *args, **kwargs)
@@ -1,6 +1,11 @@
 
 import numpy as np
 
+from scipy import sparse
+
+# cities below this population share beta_1, the larger ones beta_2
+small_city = 1e5
+
 
 def seasonal_function(t, phi, t_0):
     """
@@ -14,6 +19,19 @@ def seasonal_function(t, phi, t_0):
     return (np.sin(2.0 * np.pi * t / year_days_number + np.pi + phi) + 1.0 + t_0) / (2.0 + t_0)
 
 
+def seasonal_derivatives(t, phi, t_0):
+    """
+    Evaluates the derivatives of the seasonality function over its parameters.
+    :param t: times at which to evaluate the derivatives (numpy.array)
+    :param phi: seasonality phase (float)
+    :param t_0: seasonality parameter changing the minimum value (float)
+    :return: derivatives over phi and t_0 (numpy.array, numpy.array)
+    """
+    year_days_number = 365.0
+    angle = 2.0 * np.pi * t / year_days_number + np.pi + phi
+    return np.cos(angle) / (2.0 + t_0), (1.0 - np.sin(angle)) / (2.0 + t_0)**2
+
+
 def dS(S, I, A, beta):
     """
     Computes the susceptible differential.
@@ -112,3 +130,584 @@ def meta_population_siarw(y, t, p):
                    p['asym'], beta)
 
     return dy
+
+
+def dense_travel(travel_matrix):
+    """
+    Converts the travelling rates to a dense matrix, for the models which do not
+    exploit the sparsity of the travel network.
+    :param travel_matrix: travelling rates (numpy.array/scipy.sparse matrix)
+    :return: travelling rates (numpy.array)
+    """
+    if sparse.issparse(travel_matrix):
+        return travel_matrix.toarray()
+    return travel_matrix
+
+
+def beta_classes(Ns):
+    """
+    Maps the two fitted transmission rates to the cities by their size.
+    :param Ns: populations of the cities (numpy.array)
+    :return: matrix with a row per city and a column per fitted transmission rate (numpy.array)
+    """
+    small = Ns < small_city
+    return np.stack([small, ~small], axis=1).astype(float)
+
+
+class MetaPopulationModel:
+    """
+    Meta-population SIARW model with all the parameter dependent quantities
+    (index layout, scaled transmission rates, travel row sums and output
+    buffers) computed once, so that the right hand side and its Jacobian
+    can be evaluated repeatedly by the integrator at a small cost.
+    With a sparse travel matrix only the travel routes present in it enter the
+    Jacobian, which is then provided in the banded storage expected by odeint
+    (see jac_banded), narrow when the cities are ordered along the travel network.
+    """
+
+    def __init__(self, asym, beta, gamma, phi, t_0, Ns, M_c, travel_matrix):
+        """
+        :param asym: fraction of asymptomatic cases (float)
+        :param beta: transmission rate/s (float/numpy.array)
+        :param gamma: recovery rate (float)
+        :param phi: seasonality phase (float)
+        :param t_0: seasonality parameter (float)
+        :param Ns: populations of the cities (numpy.array)
+        :param M_c: number of analysed cities (int)
+        :param travel_matrix: travelling rates (numpy.array/scipy.sparse matrix)
+        """
+        self.asym = asym
+        self.gamma = gamma
+        self.phi = phi
+        self.t_0 = t_0
+        self.M_c = M_c
+
+        self.beta = np.broadcast_to(np.asarray(beta, dtype=float), (M_c,)).copy()
+        self.Ns = Ns
+        self.beta_scaled = self.beta / Ns
+
+        self.S_ids = np.arange(0, M_c * 5, 5)
+        self.I_ids = np.arange(1, M_c * 5, 5)
+        self.A_ids = np.arange(2, M_c * 5, 5)
+        self.R_ids = np.arange(3, M_c * 5, 5)
+        self.G_ids = np.arange(4, M_c * 5, 5)
+
+        # non-zero pattern of the Jacobian: travel couples the S and A equations
+        # of every city with the S, A and R variables of every other city, while
+        # the epidemic terms only couple the variables within a single city
+        variables = np.stack([self.S_ids, self.A_ids, self.R_ids], axis=1)
+        self.banded = sparse.issparse(travel_matrix)
+        if self.banded:
+            self.travel_matrix = sparse.csr_matrix(travel_matrix)
+            self.travel_sums = np.asarray(self.travel_matrix.sum(1)).ravel()
+
+            # only the routes in the travel matrix (and the city itself) are coupled
+            routes = (self.travel_matrix + sparse.identity(M_c, format='csr')).tocoo()
+            coupling = (self.travel_matrix - sparse.diags(self.travel_sums)).tocsr()
+            self.travel_coupling = np.asarray(coupling[routes.row, routes.col]).ravel()[:, None]
+            self.route_cols = routes.col
+            self.travel_rows = np.stack([np.broadcast_to(self.S_ids[routes.row, None], (routes.nnz, 3)),
+                                         np.broadcast_to(self.A_ids[routes.row, None], (routes.nnz, 3))])
+            self.travel_cols = np.broadcast_to(variables[routes.col], (2, routes.nnz, 3))
+        else:
+            self.travel_matrix = travel_matrix
+            self.travel_sums = travel_matrix.sum(1)
+            self.travel_coupling = travel_matrix - np.diag(self.travel_sums)
+            self.travel_rows = np.broadcast_to(np.stack([self.S_ids, self.A_ids])[:, :, None, None],
+                                               (2, M_c, M_c, 3))
+            self.travel_cols = np.broadcast_to(variables[None, None, :, :], (2, M_c, M_c, 3))
+
+        local_pattern = [(0, 0), (0, 1), (0, 2), (1, 0), (1, 1), (1, 2), (2, 0), (2, 1), (2, 2),
+                         (3, 1), (3, 2), (4, 0), (4, 1), (4, 2)]
+        self.local_rows = np.array([[5 * j + row for j in range(M_c)] for row, _ in local_pattern])
+        self.local_cols = np.array([[5 * j + col for j in range(M_c)] for _, col in local_pattern])
+        self.local_values = np.zeros(self.local_rows.shape)
+
+        self.dy = np.zeros(M_c * 5)
+        if self.banded:
+            # the epidemic terms reach 4 rows below and 2 columns above the diagonal
+            self.ml = max(int((self.travel_rows - self.travel_cols).max()), 4)
+            self.mu = max(int((self.travel_cols - self.travel_rows).max()), 2)
+            self.travel_band_rows = self.travel_rows - self.travel_cols + self.mu
+            self.local_band_rows = self.local_rows - self.local_cols + self.mu
+            self.band = np.zeros((self.ml + self.mu + 1, M_c * 5))
+        else:
+            self.dfdy = np.zeros((M_c * 5, M_c * 5))
+
+        self.rhs_calls = 0
+        self.jac_calls = 0
+
+    def rhs(self, y, t):
+        """
+        Computes the meta-population ODEs variables differentials for
+        the current state and time. The returned array is a buffer owned
+        by the model and is overwritten by the next call.
+        :param y: current values of the meta-population ODEs variables (numpy.array)
+        :param t: current time (float)
+        :return: variables differentials (numpy.array)
+        """
+        self.rhs_calls += 1
+
+        S, I, A, R = y[self.S_ids], y[self.I_ids], y[self.A_ids], y[self.R_ids]
+        beta = self.beta_scaled * seasonal_function(t, self.phi, self.t_0)
+
+        travel_ratios = A / (S + A + R)
+        travel_component = self.travel_matrix.dot(travel_ratios) - self.travel_sums * travel_ratios
+
+        infections = beta * (I + A) * S
+        symptomatic = (1.0 - self.asym) * infections
+
+        dy = self.dy
+        dy[self.S_ids] = -infections - travel_component
+        dy[self.I_ids] = symptomatic - self.gamma * I
+        dy[self.A_ids] = self.asym * infections - self.gamma * A + travel_component
+        dy[self.R_ids] = self.gamma * (I + A)
+        dy[self.G_ids] = symptomatic
+
+        return dy
+
+    def jac(self, y, t):
+        """
+        Computes the exact Jacobian of the meta-population ODEs, with
+        the derivative of the i-th equation with respect to the j-th
+        variable stored at [i, j]. The returned array is a buffer owned
+        by the model and is overwritten by the next call.
+        :param y: current values of the meta-population ODEs variables (numpy.array)
+        :param t: current time (float)
+        :return: Jacobian of the variables differentials (numpy.array)
+        """
+        self.jac_calls += 1
+        d_travel, local = self.jacobian_values(y, t)
+
+        dfdy = self.dfdy
+        dfdy.fill(0.0)
+        dfdy[self.travel_rows[0], self.travel_cols[0]] = -d_travel
+        dfdy[self.travel_rows[1], self.travel_cols[1]] = d_travel
+        dfdy[self.local_rows, self.local_cols] += local
+
+        return dfdy
+
+    def jac_banded(self, y, t):
+        """
+        Computes the exact Jacobian of the meta-population ODEs with a sparse travel
+        matrix, in the banded storage expected by odeint (with the bandwidths ml and mu),
+        where the derivative of the i-th equation with respect to the j-th variable is
+        stored at [i - j + mu, j]. The returned array is a buffer owned by the model and
+        is overwritten by the next call.
+        :param y: current values of the meta-population ODEs variables (numpy.array)
+        :param t: current time (float)
+        :return: banded Jacobian of the variables differentials (numpy.array)
+        """
+        self.jac_calls += 1
+        d_travel, local = self.jacobian_values(y, t)
+
+        band = self.band
+        band.fill(0.0)
+        band[self.travel_band_rows[0], self.travel_cols[0]] = -d_travel
+        band[self.travel_band_rows[1], self.travel_cols[1]] = d_travel
+        band[self.local_band_rows, self.local_cols] += local
+
+        return band
+
+    def jacobian_values(self, y, t):
+        """
+        Computes the non-zero entries of the Jacobian: the travel derivatives of the
+        S and A equations over the S, A and R variables, and the epidemic derivatives
+        within every city (following local_pattern).
+        :param y: current values of the meta-population ODEs variables (numpy.array)
+        :param t: current time (float)
+        :return: travel and local derivatives (numpy.array, numpy.array)
+        """
+        S, I, A, R = y[self.S_ids], y[self.I_ids], y[self.A_ids], y[self.R_ids]
+        beta = self.beta_scaled * seasonal_function(t, self.phi, self.t_0)
+
+        d_force = beta * S  # derivative of the infections over I and A
+        d_susceptible = beta * (I + A)  # derivative of the infections over S
+
+        # travel ratios A / (S + A + R) differentiated over S, A and R
+        total = S + A + R
+        d_ratio = np.stack([-A, S + R, -A], axis=1) / total[:, None]**2
+        if self.banded:
+            d_travel = self.travel_coupling * d_ratio[self.route_cols]
+        else:
+            d_travel = self.travel_coupling[:, :, None] * d_ratio[None, :, :]
+
+        local = self.local_values
+        local[0] = -d_susceptible
+        local[1:3] = -d_force
+        for k, frac in ((3, 1.0 - self.asym), (6, self.asym), (11, 1.0 - self.asym)):
+            local[k] = frac * d_susceptible
+            local[k + 1:k + 3] = frac * d_force
+        local[4] -= self.gamma
+        local[8] -= self.gamma
+        local[9:11] = self.gamma
+
+        return d_travel, local
+
+
+class MetaPopulationEnsemble:
+    """
+    K independent copies of the meta-population SIARW model, each with its own
+    parameters, stacked into a single state of shape (K, 5 * M_c) so that all the
+    copies are integrated within one ODE solve. The state is passed to the
+    integrator flattened, member after member, which makes the Jacobian block
+    diagonal; it is returned in the banded storage expected by odeint.
+    """
+
+    def __init__(self, asym, beta, gamma, phi, t_0, Ns, M_c, travel_matrix):
+        """
+        :param asym: fractions of asymptomatic cases (numpy.array of shape (K,))
+        :param beta: transmission rates (numpy.array of shape (K,) or (K, M_c))
+        :param gamma: recovery rate (float)
+        :param phi: seasonality phases (numpy.array of shape (K,))
+        :param t_0: seasonality parameters (numpy.array of shape (K,))
+        :param Ns: populations of the cities (numpy.array)
+        :param M_c: number of analysed cities (int)
+        :param travel_matrix: travelling rates, used as a dense matrix (numpy.array/scipy.sparse matrix)
+        """
+        travel_matrix = dense_travel(travel_matrix)
+        self.asym = np.asarray(asym, dtype=float)[:, None]
+        self.phi = np.asarray(phi, dtype=float)[:, None]
+        self.t_0 = np.asarray(t_0, dtype=float)[:, None]
+        self.gamma = gamma
+        self.M_c = M_c
+        self.K = self.asym.shape[0]
+        self.n = 5 * M_c
+
+        beta = np.asarray(beta, dtype=float)
+        if beta.ndim == 1:
+            beta = beta[:, None]
+        self.beta_scaled = np.broadcast_to(beta / Ns, (self.K, M_c)).copy()
+
+        self.S_ids = np.arange(0, M_c * 5, 5)
+        self.I_ids = np.arange(1, M_c * 5, 5)
+        self.A_ids = np.arange(2, M_c * 5, 5)
+        self.R_ids = np.arange(3, M_c * 5, 5)
+        self.G_ids = np.arange(4, M_c * 5, 5)
+
+        self.travel_matrix = travel_matrix
+        self.travel_sums = travel_matrix.sum(1)
+        self.travel_coupling = travel_matrix - np.diag(self.travel_sums)
+
+        # the non-zero pattern of a single member (as in MetaPopulationModel),
+        # mapped to the banded storage: [i - j + mu, j] holds d f_i / d y_j
+        self.mu = self.n - 1
+        offsets = self.n * np.arange(self.K)
+
+        variables = np.stack([self.S_ids, self.A_ids, self.R_ids], axis=1)
+        travel_rows = np.broadcast_to(np.stack([self.S_ids, self.A_ids])[:, :, None, None], (2, M_c, M_c, 3))
+        travel_cols = np.broadcast_to(variables[None, None, :, :], (2, M_c, M_c, 3))
+        self.travel_band_rows = (travel_rows - travel_cols + self.mu)[None]
+        self.travel_band_cols = offsets[:, None, None, None, None] + travel_cols[None]
+
+        local_pattern = [(0, 0), (0, 1), (0, 2), (1, 0), (1, 1), (1, 2), (2, 0), (2, 1), (2, 2),
+                         (3, 1), (3, 2), (4, 0), (4, 1), (4, 2)]
+        local_rows = np.array([[5 * j + row for j in range(M_c)] for row, _ in local_pattern])
+        local_cols = np.array([[5 * j + col for j in range(M_c)] for _, col in local_pattern])
+        self.local_band_rows = (local_rows - local_cols + self.mu)[None]
+        self.local_band_cols = offsets[:, None, None] + local_cols[None]
+        self.local_values = np.zeros((self.K,) + local_rows.shape)
+
+        self.dy = np.zeros((self.K, self.n))
+        self.band = np.zeros((2 * self.n - 1, self.K * self.n))
+
+        self.rhs_calls = 0
+        self.jac_calls = 0
+
+    def rhs(self, y, t):
+        """
+        Computes the differentials of all the ensemble members for the current
+        state and time. The returned array is a buffer owned by the model and
+        is overwritten by the next call.
+        :param y: flattened values of the ensemble variables (numpy.array)
+        :param t: current time (float)
+        :return: flattened variables differentials (numpy.array)
+        """
+        self.rhs_calls += 1
+
+        y = y.reshape(self.K, self.n)
+        S, I, A, R = y[:, self.S_ids], y[:, self.I_ids], y[:, self.A_ids], y[:, self.R_ids]
+        beta = self.beta_scaled * seasonal_function(t, self.phi, self.t_0)
+
+        travel_ratios = A / (S + A + R)
+        travel_component = travel_ratios.dot(self.travel_matrix.T) - self.travel_sums * travel_ratios
+
+        infections = beta * (I + A) * S
+        symptomatic = (1.0 - self.asym) * infections
+
+        dy = self.dy
+        dy[:, self.S_ids] = -infections - travel_component
+        dy[:, self.I_ids] = symptomatic - self.gamma * I
+        dy[:, self.A_ids] = self.asym * infections - self.gamma * A + travel_component
+        dy[:, self.R_ids] = self.gamma * (I + A)
+        dy[:, self.G_ids] = symptomatic
+
+        return dy.reshape(-1)
+
+    def jac(self, y, t):
+        """
+        Computes the exact block diagonal Jacobian of the ensemble in the banded
+        storage, with ml = mu = 5 * M_c - 1. The returned array is a buffer owned
+        by the model and is overwritten by the next call.
+        :param y: flattened values of the ensemble variables (numpy.array)
+        :param t: current time (float)
+        :return: banded Jacobian of the variables differentials (numpy.array)
+        """
+        self.jac_calls += 1
+
+        y = y.reshape(self.K, self.n)
+        S, I, A, R = y[:, self.S_ids], y[:, self.I_ids], y[:, self.A_ids], y[:, self.R_ids]
+        beta = self.beta_scaled * seasonal_function(t, self.phi, self.t_0)
+
+        d_force = beta * S
+        d_susceptible = beta * (I + A)
+
+        total = S + A + R
+        d_ratio = np.stack([-A, S + R, -A], axis=2) / total[:, :, None]**2
+        d_travel = self.travel_coupling[None, :, :, None] * d_ratio[:, None, :, :]
+
+        local = self.local_values
+        local[:, 0] = -d_susceptible
+        local[:, 1] = -d_force
+        local[:, 2] = -d_force
+        for k, frac in ((3, 1.0 - self.asym), (6, self.asym), (11, 1.0 - self.asym)):
+            local[:, k] = frac * d_susceptible
+            local[:, k + 1] = frac * d_force
+            local[:, k + 2] = frac * d_force
+        local[:, 4] -= self.gamma
+        local[:, 8] -= self.gamma
+        local[:, 9:11] = self.gamma
+
+        band = self.band
+        band.fill(0.0)
+        band[self.travel_band_rows, self.travel_band_cols] = np.stack([-d_travel, d_travel], axis=1)
+        band[self.local_band_rows, self.local_band_cols] += local
+
+        return band
+
+
+class MetaPopulationSensitivity:
+    """
+    Forward sensitivity system of the meta-population SIARW model. The state
+    holds the model variables followed by their derivatives over the P = Q + 4
+    parameters (asym, the Q transmission rates, t_0, init and phi), each block of the
+    length of the model state. The transmission rates are those of the cities, or of
+    classes of cities given by a map (as beta_classes), so that only the fitted
+    directions are integrated. The right hand side computes the model and all the
+    sensitivities from the same intermediate quantities (infections and travel
+    ratios), with one vectorised step over the P blocks. The Jacobian passed to the
+    integrator keeps only the block diagonal, the model Jacobian shared by all the
+    blocks, which slows down the convergence of the corrector iterations but not
+    their result, since the right hand side is exact and the sensitivities take part
+    in the error and convergence tests (tolerances).
+    """
+
+    def __init__(self, asym, beta, gamma, phi, t_0, Ns, M_c, travel_matrix, beta_map=None):
+        """
+        :param asym: fraction of asymptomatic cases (float)
+        :param beta: transmission rate/s (float/numpy.array)
+        :param gamma: recovery rate (float)
+        :param phi: seasonality phase (float)
+        :param t_0: seasonality parameter (float)
+        :param Ns: populations of the cities (numpy.array)
+        :param M_c: number of analysed cities (int)
+        :param travel_matrix: travelling rates, used as a dense matrix (numpy.array/scipy.sparse matrix)
+        :param beta_map: transmission rates of the cities per unit of the rate of every
+                         class, one class per column, None for the rates of the cities (numpy.array)
+        """
+        self.model = MetaPopulationModel(asym, beta, gamma, phi, t_0, Ns, M_c, dense_travel(travel_matrix))
+        self.beta_map = np.eye(M_c) if beta_map is None else np.asarray(beta_map, dtype=float)
+        Q = self.beta_map.shape[1]
+        self.n = 5 * M_c
+        self.P = Q + 4
+        self.mu = self.n - 1
+
+        rows, cols = np.meshgrid(np.arange(self.n), np.arange(self.n), indexing='ij')
+        self.band_rows = rows - cols + self.mu
+        self.band_cols = cols
+        # the banded storage of the model Jacobian, repeated for the model and every sensitivity block
+        self.bands = np.zeros((2 * self.n - 1, self.P + 1, self.n))
+        self.band = self.bands[:, 0, :]
+
+        # how the infections, travel and infections split by asym (the flows) and the
+        # recoveries enter the S, I, A, R and G equations
+        asym = self.model.asym
+        gamma = self.model.gamma
+        self.splits = np.array([[-1.0, 1.0 - asym, asym, 0.0, 1.0 - asym],
+                                [-1.0, 0.0, 1.0, 0.0, 0.0],
+                                [0.0, -1.0, 1.0, 0.0, -1.0]])
+        self.recovery = np.array([[0.0, 0.0, 0.0, 0.0, 0.0],
+                                  [0.0, -gamma, 0.0, gamma, 0.0],
+                                  [0.0, 0.0, -gamma, gamma, 0.0],
+                                  [0.0, 0.0, 0.0, 0.0, 0.0],
+                                  [0.0, 0.0, 0.0, 0.0, 0.0]])
+
+        # explicit derivatives of the infections over the transmission rates, t_0 and phi per
+        # contact, as the coefficients of the seasonality and its derivatives over t_0 and phi,
+        # with a row for the model and every sensitivity
+        self.explicit = np.zeros((self.P + 1, M_c, 3))
+        self.explicit[2:Q + 2, :, 0] = self.beta_map.T
+        self.explicit[Q + 2, :, 1] = self.model.beta
+        self.explicit[Q + 4, :, 2] = self.model.beta
+
+        self.derivatives = np.zeros((M_c, 5, 2))
+        self.flows = np.zeros((self.P + 1, M_c, 3))
+        self.dz = np.zeros((self.P + 1) * self.n)
+        self.dw = self.dz.reshape(self.P + 1, M_c, 5)
+
+    def initial_conditions(self, y0, init_n):
+        """
+        Extends the initial state with the initial sensitivities, which are non-zero
+        only for the initial cases moved from the susceptible to the asymptomatic.
+        :param y0: initial values of the meta-population ODEs variables (numpy.array)
+        :param init_n: number of cities with initial cases (int)
+        :return: initial values of the sensitivity system (numpy.array)
+        """
+        s0 = np.zeros((self.P, self.n))
+        s0[self.P - 2, 0 + 5 * np.arange(init_n)] = -1.0
+        s0[self.P - 2, 2 + 5 * np.arange(init_n)] = 1.0
+        return np.concatenate([y0, s0.reshape(-1)])
+
+    def tolerances(self, atol, init):
+        """
+        Absolute tolerances of the sensitivities scaled by the magnitudes of the parameters
+        (the default of CVODES), so that the error of a sensitivity times its parameter is
+        held to the tolerance of the model variables. The magnitudes are at least 1e-3, so
+        that a parameter near zero does not tighten its tolerance without bound.
+        :param atol: absolute tolerance of the model variables (float)
+        :param init: number of initial cases (float)
+        :return: absolute tolerance of every variable of the sensitivity system (numpy.array)
+        """
+        m = self.model
+        rates = np.linalg.lstsq(self.beta_map, m.beta, rcond=None)[0]
+        magnitudes = np.abs(np.concatenate(([m.asym], rates, [m.t_0, init, m.phi])))
+        atols = np.empty((self.P + 1, self.n))
+        atols[0] = atol
+        atols[1:] = atol / np.maximum(magnitudes, 1e-3)[:, None]
+        return atols.reshape(-1)
+
+    def rhs(self, z, t):
+        """
+        Computes the differentials of the model variables and of their sensitivities.
+        The model Jacobian is applied to the sensitivities directly, as the derivatives
+        of the infections and travel ratios of every city over its variables, without
+        forming it. The model and the sensitivities then share the steps from the flows
+        and recoveries to the differentials. The returned array is a buffer owned by the
+        model and is overwritten by the next call.
+        :param z: current values of the variables followed by the sensitivities (numpy.array)
+        :param t: current time (float)
+        :return: differentials of the sensitivity system (numpy.array)
+        """
+        m = self.model
+        w = z.reshape(self.P + 1, m.M_c, 5)
+        S, I, A, R = w[0, :, 0], w[0, :, 1], w[0, :, 2], w[0, :, 3]
+
+        seasonal = seasonal_function(t, m.phi, m.t_0)
+        d_phi, d_t_0 = seasonal_derivatives(t, m.phi, m.t_0)
+        beta = m.beta_scaled * seasonal
+        contacts = (I + A) * S / m.Ns
+        total = S + A + R
+
+        # derivatives of the infections and of the travel ratios A / (S + A + R) of a city
+        # over its S, I, A, R and G
+        derivatives = self.derivatives
+        derivatives[:, 0, 0] = beta * (I + A)
+        derivatives[:, 1, 0] = beta * S
+        derivatives[:, 2, 0] = derivatives[:, 1, 0]
+        derivatives[:, 0, 1] = -A / total**2
+        derivatives[:, 2, 1] = (S + R) / total**2
+        derivatives[:, 3, 1] = derivatives[:, 0, 1]
+
+        # the infections and travel ratios followed by their derivatives along every sensitivity
+        flows = self.flows
+        np.matmul(w[1:].transpose(1, 0, 2), derivatives, out=flows[1:, :, :2].transpose(1, 0, 2))
+        flows[0, :, 0] = m.beta * seasonal * contacts
+        flows[0, :, 1] = A / total
+        flows[:, :, 0] += self.explicit.dot([seasonal, d_t_0, d_phi]) * contacts
+        flows[:, :, 1] = flows[:, :, 1].dot(m.travel_coupling.T)
+        # asym splits the infections between the symptomatic and the asymptomatic
+        flows[1, :, 2] = flows[0, :, 0]
+
+        dw = self.dw
+        np.matmul(w, self.recovery, out=dw)
+        dw += np.matmul(flows, self.splits)
+
+        return self.dz
+
+    def jac(self, z, t):
+        """
+        Computes the block diagonal approximation of the sensitivity system Jacobian
+        in the banded storage, with ml = mu = 5 * M_c - 1. The returned array is a buffer
+        owned by the model and is overwritten by the next call.
+        :param z: current values of the variables followed by the sensitivities (numpy.array)
+        :param t: current time (float)
+        :return: banded Jacobian (numpy.array)
+        """
+        self.band[self.band_rows, self.band_cols] = self.model.jac(z[:self.n], t)
+        self.bands[:, 1:, :] = self.band[:, None, :]
+        return self.bands.reshape(2 * self.n - 1, (self.P + 1) * self.n)
+
+
+class MetaPopulationTauLeaping:
+    """
+    Stochastic counterpart of the meta-population SIARW model, with whole individuals
+    in the compartments, simulated by tau-leaping for r replicates at once. The state
+    has shape (r, M_c, 5), with the variables of a city in the order of the ODEs. In a
+    step of length dt every flow of the ODEs becomes a random number of individuals
+    with the same mean rate: the exits from a compartment are binomial (competing exits
+    split binomially), so that no compartment becomes negative, and the infections
+    imported by travel are Poisson, capped at the remaining susceptible.
+    """
+
+    def __init__(self, asym, beta, gamma, phi, t_0, Ns, M_c, travel_matrix):
+        """
+        :param asym: fraction of asymptomatic cases (float)
+        :param beta: transmission rate/s (float/numpy.array)
+        :param gamma: recovery rate (float)
+        :param phi: seasonality phase (float)
+        :param t_0: seasonality parameter (float)
+        :param Ns: populations of the cities (numpy.array)
+        :param M_c: number of analysed cities (int)
+        :param travel_matrix: travelling rates (numpy.array/scipy.sparse matrix)
+        """
+        self.asym = asym
+        self.gamma = gamma
+        self.phi = phi
+        self.t_0 = t_0
+        self.M_c = M_c
+
+        self.beta_scaled = np.broadcast_to(np.asarray(beta, dtype=float), (M_c,)) / Ns
+        self.travel_matrix = sparse.csr_matrix(travel_matrix) if sparse.issparse(travel_matrix) else travel_matrix
+        self.travel_sums = np.asarray(travel_matrix.sum(1)).ravel()
+
+    def step(self, y, t, dt, rng):
+        """
+        Advances all the replicates by a single step, in place.
+        :param y: numbers of individuals in the compartments (numpy.array of shape (r, M_c, 5))
+        :param t: current time (float)
+        :param dt: length of the step (float)
+        :param rng: random number generator (numpy.random.Generator)
+        """
+        S, I, A, R = y[:, :, 0], y[:, :, 1], y[:, :, 2], y[:, :, 3]
+        beta = self.beta_scaled * seasonal_function(t, self.phi, self.t_0)
+
+        total = S + A + R
+        travel_ratios = np.divide(A, total, out=np.zeros(total.shape), where=total > 0)
+        imported = self.travel_matrix.dot(travel_ratios.T).T
+        exported = np.divide(self.travel_sums, total, out=np.zeros(total.shape), where=total > 0)
+
+        infections = rng.binomial(S, -np.expm1(-beta * (I + A) * dt))
+        symptomatic = rng.binomial(infections, 1.0 - self.asym)
+        imports = np.minimum(rng.poisson(imported * dt), S - infections)
+
+        # the asymptomatic either recover or travel, which swaps them with susceptible elsewhere
+        exit_rate = self.gamma + exported
+        leaving = rng.binomial(A, -np.expm1(-exit_rate * dt))
+        recovered_A = rng.binomial(leaving, self.gamma / exit_rate)
+        recovered_I = rng.binomial(I, -np.expm1(-self.gamma * dt))
+
+        y[:, :, 0] -= infections + imports - (leaving - recovered_A)
+        y[:, :, 1] += symptomatic - recovered_I
+        y[:, :, 2] += infections - symptomatic + imports - leaving
+        y[:, :, 3] += recovered_I + recovered_A
+        y[:, :, 4] += symptomatic
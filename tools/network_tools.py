@@ -0,0 +1,93 @@
+import numpy as np
+
+from scipy import sparse
+
+
+def synthetic_populations(M_c, rng, median=5e4, sigma=1.2, minimum=1e3):
+    """
+    Draws the populations of the cities from a log-normal distribution, which gives
+    a few large cities among many small towns.
+    :param M_c: number of cities (int)
+    :param rng: random number generator (numpy.random.Generator)
+    :param median: median population (float)
+    :param sigma: standard deviation of the logarithm of the populations (float)
+    :param minimum: minimal population (float)
+    :return: populations of the cities (numpy.array)
+    """
+    return np.maximum(np.round(rng.lognormal(np.log(median), sigma, M_c)), minimum)
+
+
+def gravity_travel(Ns, distances, exponent=2.0):
+    """
+    Travelling weights of the gravity model, proportional to the product of the
+    populations divided by a power of the distance.
+    :param Ns: populations of the cities (numpy.array)
+    :param distances: distances between the cities (numpy.array)
+    :param exponent: exponent of the distance (float)
+    :return: travelling weights with zero diagonal (numpy.array)
+    """
+    with np.errstate(divide='ignore'):
+        weights = np.outer(Ns, Ns) / distances**exponent
+    np.fill_diagonal(weights, 0.0)
+    return weights
+
+
+def radiation_travel(Ns, distances):
+    """
+    Travelling weights of the radiation model, N_i N_j / ((N_i + s_ij) (N_i + N_j + s_ij)),
+    where s_ij is the population living closer to i than j (apart from i and j).
+    :param Ns: populations of the cities (numpy.array)
+    :param distances: distances between the cities (numpy.array)
+    :return: travelling weights with zero diagonal (numpy.array)
+    """
+    M_c = Ns.shape[0]
+    order = np.argsort(distances, axis=1, kind='stable')
+    # population within the circle around i reaching j, including i and j
+    within = np.empty((M_c, M_c))
+    np.put_along_axis(within, order, np.cumsum(Ns[order], axis=1), axis=1)
+    s = within - Ns[:, None] - Ns[None, :]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        weights = np.outer(Ns, Ns) / ((Ns[:, None] + s) * (Ns[:, None] + Ns[None, :] + s))
+    np.fill_diagonal(weights, 0.0)
+    return weights
+
+
+def synthetic_network(M_c, model='gravity', seed=None, travel=0.01, neighbours=None, size=500.0, as_sparse=False):
+    """
+    Generates a reproducible meta-population: cities placed at random in a square, with
+    log-normal populations and travelling rates from a mobility model. Every city sends
+    a fixed fraction of its population per day, split among the destinations by the
+    weights of the model, and the rates are symmetrised as in data/travel.csv.
+    :param M_c: number of cities (int)
+    :param model: 'gravity' or 'radiation' (str)
+    :param seed: seed of the random generator (int)
+    :param travel: fraction of the population travelling per day (float)
+    :param neighbours: number of the strongest destinations kept for every city, None for all (int)
+    :param size: side of the square in km (float)
+    :param as_sparse: whether to return the travelling rates as a sparse matrix (bool)
+    :return: populations, travelling rates and positions of the cities
+             (numpy.array, numpy.array/scipy.sparse.csr_matrix, numpy.array)
+    """
+    rng = np.random.default_rng(seed)
+    positions = rng.random((M_c, 2)) * size
+    Ns = synthetic_populations(M_c, rng)
+    distances = np.sqrt(((positions[:, None, :] - positions[None, :, :])**2).sum(2))
+
+    if model == 'gravity':
+        weights = gravity_travel(Ns, distances)
+    elif model == 'radiation':
+        weights = radiation_travel(Ns, distances)
+    else:
+        raise ValueError('unknown mobility model {}'.format(model))
+
+    if neighbours is not None and neighbours < M_c - 1:
+        weakest = np.argsort(weights, axis=1)[:, :M_c - neighbours]
+        np.put_along_axis(weights, weakest, 0.0, axis=1)
+
+    travel_matrix = travel * Ns[:, None] * weights / weights.sum(1, keepdims=True)
+    travel_matrix = (travel_matrix + travel_matrix.T) / 2.0
+
+    if as_sparse:
+        travel_matrix = sparse.csr_matrix(travel_matrix)
+    return Ns, travel_matrix, positions
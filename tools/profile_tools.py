@@ -0,0 +1,118 @@
+import numpy as np
+
+from scipy.stats import chi2
+
+from tools.fitting_tools import local_start, run_problems
+
+
+def profile_grid(optimum, lower, upper, points=20):
+    """
+    Builds an evenly spaced grid of a parameter between its bounds, split at the optimum
+    into the two chains of a profile, both running away from the optimum.
+    :param optimum: optimal value of the parameter (float)
+    :param lower: lower end of the grid (float)
+    :param upper: upper end of the grid (float)
+    :param points: number of grid points (int)
+    :return: values below the optimum in decreasing order and above it in increasing order
+             (numpy.array, numpy.array)
+    """
+    grid = np.linspace(lower, upper, points)
+    return grid[grid < optimum][::-1], grid[grid > optimum]
+
+
+def profile_chain(item, objective, arguments, limits, gradient=None):
+    """
+    Minimises the objective over the other parameters with one parameter fixed at every
+    value of a chain in turn, each minimisation starting from the optimum of the previous
+    value (the first one from the overall optimum).
+    :param item: index of the fixed parameter, its values and the overall optimum (tuple)
+    :param objective: objective function (callable)
+    :param arguments: additional arguments of the objective (tuple)
+    :param limits: bounds of the parameters (list)
+    :param gradient: objective returning also its exact gradient, None for finite differences (callable)
+    :return: optimal parameters followed by the objective value, one value of the chain per row (list)
+    """
+    k, values, x0 = item
+    x = np.array(x0, dtype=float)
+    rows = []
+    for value in values:
+        fixed = list(limits)
+        fixed[k] = [value, value]
+        x[k] = value
+        rows.append(local_start(x, objective, arguments, fixed, gradient))
+        x = np.array(rows[-1][:-1])
+    return rows
+
+
+def profile_likelihood(objective, arguments, limits, optimum, grids, gradient=None, workers=1):
+    """
+    Computes the profiles of the objective along given grids of the parameters: the
+    minimum over the other parameters with one parameter fixed. Every profile is run as
+    two chains of warm started minimisations from the optimum, one downwards and one
+    upwards, and all the chains run in parallel.
+    :param objective: objective function (callable)
+    :param arguments: additional arguments of the objective (tuple)
+    :param limits: bounds of the parameters (list)
+    :param optimum: optimal parameters followed by the objective value (numpy.array)
+    :param grids: values below and above the optimum of every profiled parameter, e.g.
+                  from profile_grid, keyed by the index of the parameter (dict)
+    :param gradient: objective returning also its exact gradient, None for finite differences (callable)
+    :param workers: number of worker processes (int)
+    :return: values of the parameter, profile and optimal parameters along it, in increasing
+             order of the values and including the optimum, keyed by the index of the
+             parameter (dict)
+    """
+    optimum = np.asarray(optimum, dtype=float)
+    items = []
+    labels = []
+    for k, (below, above) in grids.items():
+        items.extend([(k, below, optimum[:-1]), (k, above, optimum[:-1])])
+        labels.extend([{'parameter': k, 'chain': 'down'}, {'parameter': k, 'chain': 'up'}])
+    chains = run_problems(profile_chain, [(0, item) for item in items], [(objective, arguments, limits, gradient)],
+                          workers, labels=labels)
+
+    profiles = dict()
+    for i, k in enumerate(grids):
+        down, up = chains[2 * i], chains[2 * i + 1]
+        rows = np.array(down[::-1] + [list(optimum)] + up).reshape(-1, optimum.shape[0])
+        profiles[k] = (rows[:, k], rows[:, -1], rows[:, :-1])
+    return profiles
+
+
+def mse_threshold(minimum, n, level=0.95):
+    """
+    Threshold of a mean squared error objective at the boundary of a profile likelihood
+    confidence interval, for Gaussian residuals of unknown variance: the likelihood ratio
+    n log(MSE / minimum) is compared with the chi-squared quantile of one degree of freedom.
+    :param minimum: minimal objective value (float)
+    :param n: number of residuals in the objective (int)
+    :param level: confidence level (float)
+    :return: largest objective value within the interval (float)
+    """
+    return minimum * np.exp(chi2.ppf(level, 1) / n)
+
+
+def profile_interval(values, profile, threshold):
+    """
+    Finds the confidence interval of a parameter as the range where its profile stays
+    below the threshold, interpolating linearly at the crossings. An end which is not
+    reached within the grid is infinite, i.e. the parameter is not identifiable in that
+    direction.
+    :param values: values of the parameter in increasing order (numpy.array)
+    :param profile: profile of the objective (numpy.array)
+    :param threshold: largest objective value within the interval (float)
+    :return: lower and upper end of the interval (float, float)
+    """
+    best = int(np.argmin(profile))
+    ends = []
+    for direction in (-1, 1):
+        end = direction * np.inf
+        j = best
+        while 0 <= j + direction < values.shape[0]:
+            if profile[j + direction] > threshold:
+                share = (threshold - profile[j]) / (profile[j + direction] - profile[j])
+                end = values[j] + share * (values[j + direction] - values[j])
+                break
+            j += direction
+        ends.append(end)
+    return ends[0], ends[1]
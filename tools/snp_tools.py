@@ -0,0 +1,203 @@
+import numpy as np
+
+from tools.data_tools import set_of_names, all_cities
+
+_byte_counts = np.array([bin(k).count('1') for k in range(256)], dtype=np.uint8)
+
+
+def popcount(words):
+    """
+    :param words: 64 bit words (numpy.array)
+    :return: number of set bits of every word (numpy.array)
+    """
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(words)
+    # numpy before 2.0, through a table of the bytes
+    return _byte_counts[words.view(np.uint8)].reshape(*words.shape, 8).sum(-1)
+
+
+def bit_planes(codes, mask):
+    """
+    Splits packed codes into a plane of their high bits and a plane of their low bits, one
+    bit per site in the layout of the mask, so that two sequences differ at the sites where
+    either plane differs.
+    :param codes: packed codes with a row per sequence (numpy.array)
+    :param mask: packed mask of the gaps and ambiguous sites with a row per sequence (numpy.array)
+    :return: words of the high bits, the low bits and the valid sites (not masked), with a
+             row per sequence (numpy.array, numpy.array, numpy.array)
+    """
+    codes, mask = np.asarray(codes), np.asarray(mask)
+    shifts = np.array([6, 4, 2, 0], dtype=np.uint8)
+    sites = ((codes[..., None] >> shifts) & 3).reshape(codes.shape[0], -1)
+
+    planes = np.zeros((2,) + mask.shape, dtype=np.uint8)
+    width = -(-sites.shape[1] // 8)
+    planes[0, :, :width] = np.packbits(sites >> 1, axis=1)
+    planes[1, :, :width] = np.packbits(sites & 1, axis=1)
+    return planes[0].view(np.uint64), planes[1].view(np.uint64), (~mask).view(np.uint64)
+
+
+def plane_distances(planes_i, planes_j):
+    """
+    :param planes_i: bit planes of the first sequences, from bit_planes (tuple)
+    :param planes_j: bit planes of the second sequences (tuple)
+    :return: number of SNPs between every first and second sequence (numpy.array)
+    """
+    high_i, low_i, valid_i = planes_i
+    high_j, low_j, valid_j = planes_j
+    difference = high_i[:, None, :] ^ high_j[None, :, :]
+    difference |= low_i[:, None, :] ^ low_j[None, :, :]
+    difference &= valid_i[:, None, :]
+    difference &= valid_j[None, :, :]
+    return popcount(difference).sum(-1, dtype=np.int32)
+
+
+def distance_blocks(alignment, block=128):
+    """
+    Counts the SNPs between all the pairs of sequences, a block of rows against a block of
+    columns at a time, from the exclusive or of the bit planes of the packed codes. The
+    sites where either sequence has a gap or an ambiguous base are not counted. Only the
+    blocks on and above the diagonal are computed, and the memory is bounded by the block
+    size.
+    :param alignment: alignment (Alignment)
+    :param block: number of sequences of a block (int)
+    :return: rows and columns of every block and their numbers of SNPs (generator)
+    """
+    n = len(alignment)
+    for i in range(0, n, block):
+        rows = slice(i, min(i + block, n))
+        planes_i = bit_planes(alignment.codes[rows], alignment.mask[rows])
+        for j in range(i, n, block):
+            columns = slice(j, min(j + block, n))
+            planes_j = planes_i if j == i else bit_planes(alignment.codes[columns], alignment.mask[columns])
+            yield rows, columns, plane_distances(planes_i, planes_j)
+
+
+def pairwise_distances(alignment, block=128, out=None):
+    """
+    :param alignment: alignment (Alignment)
+    :param block: number of sequences of a block (int)
+    :param out: matrix the distances are written to, e.g. a memory-mapped file for large
+                alignments, None for a new one (numpy.array)
+    :return: number of SNPs between every pair of sequences (numpy.array)
+    """
+    n = len(alignment)
+    distances = np.zeros((n, n), dtype=np.int32) if out is None else out
+    for rows, columns, counts in distance_blocks(alignment, block):
+        distances[rows, columns] = counts
+        distances[columns, rows] = counts.T
+    return distances
+
+
+def reference_distances(alignment, reference, block=1024):
+    """
+    :param alignment: alignment (Alignment)
+    :param reference: packed codes and mask of the reference sequence (numpy.array, numpy.array)
+    :param block: number of sequences of a block (int)
+    :return: number of SNPs between every sequence and the reference (numpy.array)
+    """
+    codes, mask = reference
+    planes_r = bit_planes(codes.reshape(1, -1), mask.reshape(1, -1))
+
+    distances = np.zeros(len(alignment), dtype=np.int32)
+    for i in range(0, len(alignment), block):
+        rows = slice(i, min(i + block, len(alignment)))
+        distances[rows] = plane_distances(bit_planes(alignment.codes[rows], alignment.mask[rows]), planes_r)[:, 0]
+    return distances
+
+
+def consensus_sequence(alignment, block=1024):
+    """
+    Majority base of every site, counted a block of sequences at a time. The sites without
+    any base are masked.
+    :param alignment: alignment (Alignment)
+    :param block: number of sequences of a block (int)
+    :return: packed codes and mask of the consensus (numpy.array, numpy.array)
+    """
+    from tools.alignment_tools import unpack_codes, pack_sequence, bases
+
+    counts = np.zeros((4, alignment.length), dtype=np.int64)
+    for i in range(0, len(alignment), block):
+        sites = unpack_codes(alignment.codes[i:i + block], alignment.mask[i:i + block], alignment.length)
+        for code in range(4):
+            counts[code] += (sites == code).sum(0)
+    majority = np.argmax(counts, axis=0)
+    sequence = np.where(counts.sum(0) > 0, np.array(list(bases))[majority], '-')
+    return pack_sequence(''.join(sequence))
+
+
+def temporal_signal(dates, distances):
+    """
+    Root-to-tip regression of the distances of the sequences from a root (e.g. the
+    consensus) on their isolation dates. The slope is the substitution rate, and the date
+    where the regression line reaches zero estimates the date of the root.
+    :param dates: isolation dates (numpy.array)
+    :param distances: number of SNPs of every sequence from the root (numpy.array)
+    :return: substitutions per year, coefficient of determination and date of the root
+             (float, float, numpy.datetime64)
+    """
+    dates = np.asarray(dates, dtype='datetime64[D]')
+    known = ~np.isnat(dates)
+    years = (dates[known] - dates[known].min()).astype(float) / 365.25
+    y = np.asarray(distances, dtype=float)[known]
+
+    slope, intercept = np.polyfit(years, y, 1)
+    residuals = y - (slope * years + intercept)
+    r2 = 1.0 - (residuals**2).sum() / ((y - y.mean())**2).sum()
+    root = dates[known].min() + np.timedelta64(int(round(-intercept / slope * 365.25)), 'D') if slope > 0 else \
+        np.datetime64('NaT', 'D')
+    return float(slope), float(r2), root
+
+
+def sequence_cities(metadata, cities=all_cities):
+    """
+    Assigns the sequences to the cities of set_of_names by the geographic origin of their
+    records, the first matching city in the given order.
+    :param metadata: records of the sequences, from Alignment.metadata (pandas.DataFrame)
+    :param cities: cities (list)
+    :return: index of the city of every sequence, -1 for the other origins (numpy.array)
+    """
+    origins = metadata['Geographic.origin_NR'].to_numpy()
+    groups = np.full(origins.shape[0], -1)
+    for k in range(len(cities) - 1, -1, -1):
+        groups[np.isin(origins, set_of_names[cities[k]])] = k
+    return groups
+
+
+def city_distances(alignment, groups, M_c, block=128, linked=0):
+    """
+    Summarises the SNP distances within and between the cities, in the order of the cities
+    of the travel matrix, so that they can be compared with it. The distances are collected
+    into exact histograms block by block, without the full distance matrix.
+    :param alignment: alignment (Alignment)
+    :param groups: index of the city of every sequence, -1 for none, e.g. from sequence_cities (numpy.array)
+    :param M_c: number of cities (int)
+    :param block: number of sequences of a block (int)
+    :param linked: largest number of SNPs of a pair of sequences taken as a recent transmission (int)
+    :return: number of pairs, mean, median and minimal distance, and share of the pairs within
+             linked SNPs, for every pair of cities (dict)
+    """
+    groups = np.asarray(groups)
+    bins = alignment.length + 1
+    histogram = np.zeros(M_c * M_c * bins, dtype=np.int64)
+    for rows, columns, counts in distance_blocks(alignment, block):
+        a = np.broadcast_to(groups[rows][:, None], counts.shape)
+        b = np.broadcast_to(groups[columns][None, :], counts.shape)
+        # every pair once, i.e. without the diagonal and the lower triangle of the diagonal blocks
+        pairs = (a >= 0) & (b >= 0) & (np.arange(rows.start, rows.stop)[:, None] <
+                                      np.arange(columns.start, columns.stop)[None, :])
+        histogram += np.bincount((a[pairs] * M_c + b[pairs]) * bins + counts[pairs], minlength=histogram.shape[0])
+    histogram = histogram.reshape(M_c, M_c, bins)
+    histogram = histogram + histogram.transpose(1, 0, 2)
+    histogram[np.arange(M_c), np.arange(M_c)] //= 2
+
+    pairs = histogram.sum(-1)
+    snps = np.arange(bins)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        cumulative = np.cumsum(histogram, -1)
+        summary = {'pairs': pairs,
+                   'mean': histogram.dot(snps) / pairs,
+                   'median': np.where(pairs > 0, np.argmax(cumulative >= 0.5 * pairs[..., None], -1), np.nan),
+                   'min': np.where(pairs > 0, np.argmax(histogram > 0, -1), np.nan),
+                   'linked': cumulative[..., linked] / pairs}
+    return summary
@@ -0,0 +1,291 @@
+import json
+import time
+import warnings
+
+import numpy as np
+
+from scipy import sparse
+from scipy.integrate import BDF, LSODA, Radau, odeint
+
+# tolerance of the reference solutions the solvers are calibrated against
+reference_tol = 1e-13
+
+# the methods of solve_ivp used by ivp_solver
+_ivp_methods = {'LSODA': LSODA, 'Radau': Radau, 'BDF': BDF}
+
+# Dormand-Prince 5(4) tableau of the explicit Runge-Kutta solver, with the difference of the
+# two orders giving the error estimate; the last stage is the derivative at the new state
+_rk_c = np.array([0.0, 1.0 / 5.0, 3.0 / 10.0, 4.0 / 5.0, 8.0 / 9.0, 1.0])
+_rk_a = [np.array([]),
+         np.array([1.0 / 5.0]),
+         np.array([3.0 / 40.0, 9.0 / 40.0]),
+         np.array([44.0 / 45.0, -56.0 / 15.0, 32.0 / 9.0]),
+         np.array([19372.0 / 6561.0, -25360.0 / 2187.0, 64448.0 / 6561.0, -212.0 / 729.0]),
+         np.array([9017.0 / 3168.0, -355.0 / 33.0, 46732.0 / 5247.0, 49.0 / 176.0, -5103.0 / 18656.0])]
+_rk_b = np.array([35.0 / 384.0, 0.0, 500.0 / 1113.0, 125.0 / 192.0, -2187.0 / 6784.0, 11.0 / 84.0])
+_rk_e = np.array([-71.0 / 57600.0, 0.0, 71.0 / 16695.0, -71.0 / 1920.0, 17253.0 / 339200.0, -22.0 / 525.0,
+                  1.0 / 40.0])
+
+
+def solve_odeint(rhs, y0, t, Dfun=None, ml=None, mu=None, rtol=1e-11, atol=1e-11, mxstep=10000, statistics=False):
+    """
+    LSODA of odepack through odeint, switching between the non-stiff (Adams) and stiff
+    (BDF) methods.
+    :param rhs: right hand side of the ODEs, called with the state and the time (callable)
+    :param y0: initial values (numpy.array)
+    :param t: times at which to find the ODE solution (numpy.array)
+    :param Dfun: Jacobian of the right hand side, banded with ml and mu (callable)
+    :param ml: lower bandwidth of the Jacobian, None for a full one (int)
+    :param mu: upper bandwidth of the Jacobian, None for a full one (int)
+    :param rtol: relative tolerance (float)
+    :param atol: absolute tolerance (float)
+    :param mxstep: maximal number of steps between two output times (int)
+    :param statistics: whether to return the statistics of the solve (bool)
+    :return: solution of the ODEs and the statistics of the solve, None without them (numpy.array, dict)
+    """
+    if not statistics:
+        return odeint(rhs, y0, t, Dfun=Dfun, ml=ml, mu=mu, rtol=rtol, atol=atol, mxstep=mxstep), None
+
+    output, info = odeint(rhs, y0, t, Dfun=Dfun, ml=ml, mu=mu, rtol=rtol, atol=atol, mxstep=mxstep,
+                          full_output=True)
+    mused = info['mused']
+    return output, {'steps': info['nst'][-1], 'rhs_evaluations': info['nfe'][-1],
+                    'jacobian_evaluations': info['nje'][-1], 'method_switches': np.count_nonzero(np.diff(mused)),
+                    'last_method': mused[-1], 'last_step': info['hu'][-1], 'bdf_fraction': np.mean(mused == 2),
+                    'message': info['message']}
+
+
+def banded_to_sparse(band, ml, mu):
+    """
+    :param band: Jacobian in the banded storage of odeint, the derivative of the i-th
+                 equation with respect to the j-th variable at [i - j + mu, j] (numpy.array)
+    :param ml: lower bandwidth (int)
+    :param mu: upper bandwidth (int)
+    :return: Jacobian (scipy.sparse matrix)
+    """
+    n = band.shape[1]
+    return sparse.dia_matrix((band, mu - np.arange(ml + mu + 1)), shape=(n, n)).tocsc()
+
+
+def ivp_solver(method):
+    """
+    Builds a solver of solve_ivp with one of its implicit methods, stepped here rather than
+    through solve_ivp so that, as in odeint, at most mxstep steps are taken between two
+    output times. The solution is read at the output times from the dense output of the
+    method.
+    :param method: 'LSODA', 'Radau' or 'BDF' (str)
+    :return: solver with the arguments of solve_odeint (callable)
+    """
+    def solve(rhs, y0, t, Dfun=None, ml=None, mu=None, rtol=1e-11, atol=1e-11, mxstep=10000, statistics=False):
+        # the models return buffers overwritten by their next call, which the methods keep
+        options = dict()
+        if Dfun is not None and method == 'LSODA':
+            # LSODA takes the banded storage of odeint as it is
+            options['jac'] = lambda s, y: np.array(Dfun(y, s))
+            if ml is not None:
+                options.update(lband=ml, uband=mu)
+        elif Dfun is not None and ml is not None:
+            options['jac'] = lambda s, y: banded_to_sparse(Dfun(y, s), ml, mu)
+        elif Dfun is not None:
+            options['jac'] = lambda s, y: np.array(Dfun(y, s))
+
+        output = np.full((t.shape[0], y0.shape[0]), np.nan)
+        output[0] = y0
+        solver = _ivp_methods[method](lambda s, y: rhs(y, s).copy(), t[0], y0, t[-1], rtol=rtol, atol=atol,
+                                      **options)
+        i, taken, steps, message = 1, 0, 0, 'success'
+        while i < t.shape[0]:
+            if taken >= mxstep:
+                message = 'too many steps'
+                warnings.warn('{} reached {} steps before time {}'.format(method, mxstep, t[i]))
+                break
+            failure = solver.step()
+            if solver.status == 'failed':
+                message = failure
+                warnings.warn('{} failed at time {}: {}'.format(method, solver.t, failure))
+                break
+            taken += 1
+            steps += 1
+            # the output times the step went past are read from its interpolant
+            k = i + np.searchsorted(t[i:], solver.t, side='right')
+            if k > i:
+                output[i:k] = solver.dense_output()(t[i:k]).T
+                i, taken = k, 0
+
+        if not statistics:
+            return output, None
+        return output, {'steps': steps, 'rhs_evaluations': solver.nfev, 'jacobian_evaluations': solver.njev,
+                        'decompositions': solver.nlu, 'message': message}
+
+    solve.__name__ = 'solve_' + method.lower()
+    return solve
+
+
+def solve_rk(rhs, y0, t, Dfun=None, ml=None, mu=None, rtol=1e-11, atol=1e-11, mxstep=10000, statistics=False):
+    """
+    Explicit adaptive Runge-Kutta solver (Dormand-Prince 5(4)), for the non-stiff regime,
+    operating on the whole state vector (e.g. all the members of an ensemble) at once.
+    The steps are cut at the output times, so the solution is not interpolated, and the
+    Jacobian is not used.
+    :param rhs: right hand side of the ODEs, called with the state and the time (callable)
+    :param y0: initial values (numpy.array)
+    :param t: times at which to find the ODE solution (numpy.array)
+    :param Dfun: not used (callable)
+    :param ml: not used (int)
+    :param mu: not used (int)
+    :param rtol: relative tolerance (float)
+    :param atol: absolute tolerance (float)
+    :param mxstep: maximal number of steps between two output times (int)
+    :param statistics: whether to return the statistics of the solve (bool)
+    :return: solution of the ODEs and the statistics of the solve, None without them (numpy.array, dict)
+    """
+    y = np.array(y0, dtype=float)
+    output = np.full((t.shape[0], y.shape[0]), np.nan)
+    output[0] = y
+    k = np.empty((7, y.shape[0]))
+    k[0] = rhs(y, t[0])
+    evaluations, steps, rejected = 1, 0, 0
+
+    # initial step from the scale of the first derivative
+    scale = atol + rtol * np.abs(y)
+    h = 0.01 * np.sqrt(np.mean((y / scale)**2)) / max(np.sqrt(np.mean((k[0] / scale)**2)), 1e-10)
+    h = min(max(h, 1e-6), t[-1] - t[0])
+
+    s = t[0]
+    for i in range(1, t.shape[0]):
+        taken = 0
+        while s < t[i]:
+            if taken >= mxstep:
+                warnings.warn('rk reached {} steps before time {}'.format(mxstep, t[i]))
+                return output, ({'steps': steps, 'rhs_evaluations': evaluations, 'rejected_steps': rejected,
+                                 'message': 'too many steps'} if statistics else None)
+            step = min(h, t[i] - s)
+            for j in range(1, 6):
+                k[j] = rhs(y + step * _rk_a[j].dot(k[:j]), s + _rk_c[j] * step)
+            y_new = y + step * _rk_b.dot(k[:6])
+            k[6] = rhs(y_new, s + step)
+            evaluations += 6
+
+            scale = atol + rtol * np.maximum(np.abs(y), np.abs(y_new))
+            error = np.sqrt(np.mean((step * _rk_e.dot(k) / scale)**2))
+            factor = 10.0 if error == 0.0 else min(10.0, max(0.2, 0.9 * error**-0.2))
+            if error <= 1.0:
+                s = t[i] if step == t[i] - s else s + step
+                y = y_new
+                k[0] = k[6]
+                steps += 1
+                taken += 1
+                # a step cut at the output time does not shrink the next one
+                h = step * factor if step == h else max(h, step * factor)
+            else:
+                rejected += 1
+                h = step * factor
+        output[i] = y
+
+    if not statistics:
+        return output, None
+    return output, {'steps': steps, 'rhs_evaluations': evaluations, 'rejected_steps': rejected,
+                    'last_step': h, 'message': 'success'}
+
+
+solvers = {'odeint': solve_odeint, 'lsoda': ivp_solver('LSODA'), 'radau': ivp_solver('Radau'),
+           'bdf': ivp_solver('BDF'), 'rk': solve_rk}
+
+
+class Integrator:
+    """
+    Solver backend of all the ODE solves of the model, one of solvers. Each process holds
+    its own choice, which the pool workers inherit when they are forked.
+    """
+
+    def __init__(self, name='odeint'):
+        """
+        :param name: name of the solver, from solvers (str)
+        """
+        self.name = None
+        self.solve = None
+        self.select(name)
+
+    def select(self, name):
+        """
+        :param name: name of the solver, from solvers (str)
+        """
+        if name not in solvers:
+            raise ValueError('unknown solver {}, one of {}'.format(name, ', '.join(solvers)))
+        self.name = name
+        self.solve = solvers[name]
+
+
+integrator = Integrator()
+
+
+def calibrate(samples, parameter_sets, tols, error=1e-6, names=None):
+    """
+    Runs every solver at every tolerance on the parameter sets, and compares the samples
+    with reference ones from odeint at reference_tol. The error of a solver is the
+    largest difference from the reference samples over all the parameter sets, relative
+    to the largest reference sample (but at least one case).
+    :param samples: samples of the model for a parameter set and a tolerance (callable)
+    :param parameter_sets: representative parameter sets (list)
+    :param tols: tolerances (list)
+    :param error: largest accepted relative error (float)
+    :param names: names of the solvers, None for all of them (list)
+    :return: solver, tolerance, mean wall time of a solve, relative error and whether it is
+             accepted of every run, and the fastest accepted run, None if none is (list, dict)
+    """
+    names = list(solvers) if names is None else names
+    chosen = integrator.name
+    try:
+        integrator.select('odeint')
+        references = [samples(pars, reference_tol) for pars in parameter_sets]
+
+        runs = []
+        for name in names:
+            integrator.select(name)
+            for tol in tols:
+                errors = []
+                tic = time.perf_counter()
+                with warnings.catch_warnings():
+                    warnings.simplefilter('ignore')
+                    for pars, reference in zip(parameter_sets, references):
+                        difference = np.abs(samples(pars, tol) - reference).max()
+                        errors.append(difference / max(np.abs(reference).max(), 1.0))
+                elapsed = (time.perf_counter() - tic) / len(parameter_sets)
+                # a failed solve leaves nan in the samples
+                worst = max(errors) if not np.isnan(errors).any() else np.inf
+                runs.append({'solver': name, 'tol': float(tol), 'time': elapsed, 'error': float(worst),
+                             'accepted': bool(worst <= error)})
+    finally:
+        integrator.select(chosen)
+
+    accepted = [run for run in runs if run['accepted']]
+    return runs, min(accepted, key=lambda run: run['time']) if accepted else None
+
+
+def load_calibration(path):
+    """
+    :param path: calibration saved by calibrate.py, results/<name>_solvers.json (str)
+    :return: fastest run of the calibration within its error budget (dict)
+    """
+    with open(path) as f:
+        best = json.load(f)['best']
+    if best is None:
+        raise ValueError('no solver of the calibration {} meets its error budget'.format(path))
+    return best
+
+
+def format_calibration(runs, best):
+    """
+    Summarises the calibration of the solvers.
+    :param runs: solver, tolerance, mean wall time, relative error and acceptance of every run (list)
+    :param best: fastest accepted run, None if none is (dict)
+    :return: one line per run followed by the choice (str)
+    """
+    lines = ['{:>8}{:>10}{:>14}{:>12}{:>10}'.format('solver', 'tol', 'time [ms]', 'error', 'accepted')]
+    lines += ['{:>8}{:>10.0e}{:>14.2f}{:>12.2e}{:>10}'.format(run['solver'], run['tol'], 1e3 * run['time'],
+                                                              run['error'], str(run['accepted'])) for run in runs]
+    if best is None:
+        lines.append('no solver meets the error budget')
+    else:
+        lines.append('fastest within the error budget: -solver {} -tols {:.0e}'.format(best['solver'], best['tol']))
+    return '\n'.join(lines)
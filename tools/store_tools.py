@@ -0,0 +1,110 @@
+import json
+import os
+
+import numpy as np
+
+# leading columns of every record, followed by the parameters and the objective value
+record_columns = ['problem', 'stage', 'restart', 'time']
+
+# settings which do not change the results, so they may differ when a run is resumed
+execution_settings = ['workers', 'cache', 'log']
+
+
+class ResultStore:
+    """
+    Append-only store of the minimisation results, written restart by restart, so that
+    an interrupted run can be resumed without repeating the finished restarts. The store
+    consists of a header (path.json) with the settings of the run, its main seed and the
+    names of the columns, and of a table (path.rows) of float64 records, one per finished
+    minimisation, which can be memory-mapped by load_results.
+    """
+
+    def __init__(self, path, args, n_parameters, labels=None):
+        """
+        :param path: path of the store without extension (str)
+        :param args: settings of the run (argparse.Namespace)
+        :param n_parameters: number of fitted parameters (int)
+        :param labels: names of the fitted problems, None for a single problem (list)
+        """
+        self.header_path = path + '.json'
+        self.rows_path = path + '.rows'
+        settings = json.loads(json.dumps(vars(args)))
+        labels = list(labels) if labels is not None else ['main']
+
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        if os.path.exists(self.header_path):
+            with open(self.header_path) as f:
+                header = json.load(f)
+            changed = sorted(key for key in set(settings) | set(header['args'])
+                             if key not in execution_settings and settings.get(key) != header['args'].get(key))
+            if changed or header['labels'] != labels or header['n_parameters'] != n_parameters:
+                raise ValueError('store {} was created with different settings ({}), use another name'.format(
+                    path, ', '.join(changed) if changed else 'problems'))
+        else:
+            # without a given seed the drawn one is stored, so that a resumed run continues the same restarts
+            header = {'args': settings, 'seed': int(np.random.SeedSequence(args.seed).entropy),
+                      'labels': labels, 'n_parameters': n_parameters,
+                      'columns': record_columns + ['x{}'.format(k) for k in range(n_parameters)] + ['objective']}
+            temporary = self.header_path + '.tmp'
+            with open(temporary, 'w') as f:
+                json.dump(header, f, indent=1)
+            os.replace(temporary, self.header_path)
+
+        self.seed = header['seed']
+        self.labels = labels
+        self.width = len(header['columns'])
+
+        # a record cut short by an interrupted write is dropped
+        size = os.path.getsize(self.rows_path) if os.path.exists(self.rows_path) else 0
+        if size % (8 * self.width):
+            os.truncate(self.rows_path, size - size % (8 * self.width))
+
+        self.records = dict()
+        for record in load_results(path)[1]:
+            self.records[tuple(int(v) for v in record[:3])] = np.array(record[len(record_columns):])
+
+    def get(self, problem, stage, restart):
+        """
+        :param problem: index of the fitted problem (int)
+        :param stage: index of the fidelity stage (int)
+        :param restart: index of the restart (int)
+        :return: stored optimal parameters followed by the objective value, None if not finished (numpy.array)
+        """
+        return self.records.get((problem, stage, restart))
+
+    def append(self, problem, stage, restart, result, elapsed):
+        """
+        Writes the result of a finished minimisation to the disk.
+        :param problem: index of the fitted problem (int)
+        :param stage: index of the fidelity stage (int)
+        :param restart: index of the restart (int)
+        :param result: optimal parameters followed by the objective value (list)
+        :param elapsed: wall time of the minimisation in seconds (float)
+        """
+        record = np.array([problem, stage, restart, elapsed] + list(result), dtype=np.float64)
+        with open(self.rows_path, 'ab') as f:
+            f.write(record.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        self.records[(problem, stage, restart)] = record[len(record_columns):]
+
+    def __len__(self):
+        return len(self.records)
+
+
+def load_results(path):
+    """
+    Opens a result store for reading, with the records memory-mapped from the disk.
+    :param path: path of the store without extension (str)
+    :return: header with the settings and the names of the columns, and the records
+             with one row per finished minimisation (dict, numpy.array)
+    """
+    with open(path + '.json') as f:
+        header = json.load(f)
+    width = len(header['columns'])
+
+    rows_path = path + '.rows'
+    n = (os.path.getsize(rows_path) if os.path.exists(rows_path) else 0) // (8 * width)
+    if n == 0:
+        return header, np.empty((0, width))
+    return header, np.memmap(rows_path, dtype=np.float64, mode='r', shape=(n, width))
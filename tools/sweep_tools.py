@@ -0,0 +1,176 @@
+import itertools
+
+import numpy as np
+
+from tools import (squared_error, squared_error_gradient, undercount_error, undercount_error_gradient,
+                   repeated_squared_error, repeated_squared_error_gradient, aggregate_samples,
+                   meta_population_sample, meta_population_stochastic_sample, load_specific_city, data_travel,
+                   beta_classes, noisy_replicates, synthetic_plan, SamplingPlan)
+from tools.data_tools import all_cities, all_Ns
+
+noise_models = ['data', 'gauss', 'gamma', 'negbinom']
+
+losses = {'squared': (squared_error, squared_error_gradient),
+          'undercount': (undercount_error, undercount_error_gradient),
+          'repeated': (repeated_squared_error, repeated_squared_error_gradient)}
+
+
+def expand_sweep(cs, models, noises, loss_types):
+    """
+    Expands the sweep into the list of fitting tasks, one for every combination of the
+    number of cities, noise model, noise level and loss. The observed data ('data' model)
+    is not perturbed, so it enters the sweep once regardless of the noise levels.
+    :param cs: numbers of cities (list)
+    :param models: noise models, from noise_models (list)
+    :param noises: noise levels (list)
+    :param loss_types: losses, keys of losses (list)
+    :return: number of cities, noise model, noise level, loss and label of every task (list)
+    """
+    for model in models:
+        if model not in noise_models:
+            raise ValueError('unknown noise model {}'.format(model))
+    for loss in loss_types:
+        if loss not in losses:
+            raise ValueError('unknown loss {}'.format(loss))
+
+    tasks = []
+    for c, model, loss in itertools.product(cs, models, loss_types):
+        for noise in ([0.0] if model == 'data' else noises):
+            label = 'c{}_{}_{:g}_{}'.format(c, model, noise, loss) if model != 'data' else \
+                'c{}_data_{}'.format(c, loss)
+            tasks.append({'c': c, 'model': model, 'noise': noise, 'loss': loss, 'label': label})
+    return tasks
+
+
+class SweepData:
+    """
+    Data shared by the tasks of a sweep: the sampling structure, observed cases and
+    noise-free synthetic cases are computed once for every number of cities.
+    """
+
+    def __init__(self, data, args):
+        """
+        :param data: daily number of cases (CaseCounts)
+        :param args: settings shared by all the tasks (argparse.Namespace)
+        """
+        self.data = data
+        self.args = args
+        self.travel = data_travel() / args.travel_norm
+        self.samplings = dict()
+        self.plans = dict()
+        self.observed = dict()
+        self.clean = dict()
+
+    def setup(self, c):
+        """
+        :param c: number of cities (int)
+        :return: populations and travelling rates of the first c cities (numpy.array, numpy.array)
+        """
+        return all_Ns[:c], self.travel[:c, :c]
+
+    def sampling(self, c):
+        """
+        :param c: number of cities (int)
+        :return: sampling structure and observed number of cases of the first c cities (dict, numpy.array)
+        """
+        if c not in self.samplings:
+            sampling = dict()
+            y_sample = []
+            for city in all_cities[:c]:
+                x, z = load_specific_city(self.data, city, self.args.start, self.args.end)
+                sampling[city] = x[z > 0.0]
+                y_sample.append(z[z > 0.0])
+            self.samplings[c] = sampling
+            self.observed[c] = np.concatenate(y_sample)
+        return self.samplings[c], self.observed[c]
+
+    def plan(self, c):
+        """
+        :param c: number of cities (int)
+        :return: plan of the synthetic samples of the first c cities (SamplingPlan)
+        """
+        if c not in self.plans:
+            self.plans[c] = synthetic_plan(self.sampling(c)[0], self.args.shift, self.args.active_sampling)
+        return self.plans[c]
+
+    def synthetic(self, c):
+        """
+        :param c: number of cities (int)
+        :return: noise-free synthetic number of cases of the first c cities (numpy.array)
+        """
+        if c not in self.clean:
+            args = self.args
+            Ns, travel_matrix = self.setup(c)
+            betas = beta_classes(Ns).dot(args.betas2[:2])
+            self.clean[c] = meta_population_sample(self.plan(c), args.asym, betas, args.gamma, args.phi, args.sin_0,
+                                                   args.init, args.shift, Ns, c, travel_matrix, init_n=c,
+                                                   active_sampling=args.active_sampling)
+        return self.clean[c]
+
+    def stochastic(self, c, r, rng):
+        """
+        :param c: number of cities (int)
+        :param r: number of replicates (int)
+        :param rng: random number generator (numpy.random.Generator)
+        :return: synthetic number of cases of the first c cities from r trajectories of the
+                 stochastic model, one per row (numpy.array)
+        """
+        args = self.args
+        Ns, travel_matrix = self.setup(c)
+        betas = beta_classes(Ns).dot(args.betas2[:2])
+        return meta_population_stochastic_sample(self.plan(c), args.asym, betas, args.gamma, args.phi, args.sin_0,
+                                                 args.init, args.shift, Ns, c, travel_matrix, r, rng, init_n=c,
+                                                 active_sampling=args.active_sampling)
+
+    def problem(self, task, schedule, rng):
+        """
+        Builds the fitting problem of a task.
+        :param task: number of cities, noise model, noise level and loss (dict)
+        :param schedule: tolerance, aggregation period and iteration budget of every stage (list)
+        :param rng: random number generator of the synthetic noise (numpy.random.Generator)
+        :return: objective, its additional arguments for every stage, bounds of the
+                 parameters and objective with gradient (or None) (tuple)
+        """
+        args = self.args
+        c, loss = task['c'], task['loss']
+        Ns, travel_matrix = self.setup(c)
+        sampling, observed = self.sampling(c)
+        r = args.r if loss == 'repeated' else 1
+
+        if task['model'] == 'data':
+            y_sample = np.repeat(observed, r)
+        else:
+            clean = self.stochastic(c, r, rng) if args.demographic else self.synthetic(c)
+            y_sample = noisy_replicates(clean, task['model'], task['noise'], r, rng,
+                                        args.negative_cases).T.reshape(-1)
+
+        stage_arguments = []
+        for tol, period, _ in schedule:
+            stage_sampling, stage_sample = aggregate_samples(sampling, y_sample, period, r)
+            # the objectives get the plan of the stage, built once instead of on every call
+            stage_plan = SamplingPlan(stage_sampling, args.shift, args.active_sampling)
+            common = (args.shift, args.gamma, Ns, c, travel_matrix, stage_plan, stage_sample, args.active_sampling)
+            if loss == 'squared':
+                stage_arguments.append(common + (args.weight if args.weighted else None, tol))
+            elif loss == 'undercount':
+                stage_arguments.append(common + (tol,))
+            else:
+                opt_ids = stage_sample > 0.0 if args.neglect_zeros else np.repeat(True, stage_sample.shape[0])
+                stage_arguments.append(common + (r, opt_ids, tol))
+
+        min_init = args.min_init if loss == 'squared' and task['model'] == 'data' else 0.0
+        limits = [[0.0, 1.0], [0.0, None], [0.0, None], [0.0, None], [min_init, None], [0.0, 2.0 * np.pi]]
+
+        objective, gradient = losses[loss]
+        return objective, stage_arguments, limits, gradient if args.gradient else None
+
+    def true_parameters(self, task):
+        """
+        :param task: number of cities, noise model, noise level and loss (dict)
+        :return: parameters the synthetic data is generated with, as stored by the synthetic
+                 experiments, or nothing for the observed data (list)
+        """
+        if task['model'] == 'data':
+            return []
+        args = self.args
+        return [args.asym, *args.betas2[:2], args.sin_0, args.init, args.phi, task['noise'], args.shift, args.gamma]
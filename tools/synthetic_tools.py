@@ -0,0 +1,97 @@
+import numpy as np
+
+from tools import meta_population_sample, meta_population_stochastic_sample, SamplingPlan
+
+
+def noisy_replicates(y_sample, model, noise, r, rng, negative_cases=False):
+    """
+    Draws r noisy replicates of the noise-free synthetic samples at once. Samples without
+    cases (possible in stochastic trajectories) stay without cases under gamma and
+    negative binomial noise.
+    :param y_sample: noise-free number of cases, shared or one row per replicate (numpy.array)
+    :param model: 'gauss' (additive), 'gamma' or 'negbinom' (with standard deviation noise) (str)
+    :param noise: noise level (float)
+    :param r: number of replicates (int)
+    :param rng: random number generator (numpy.random.Generator)
+    :param negative_cases: whether negative case counts are possible (bool)
+    :return: noisy number of cases with one replicate per row (numpy.array)
+    """
+    size = (r, y_sample.shape[-1])
+    cases = np.where(y_sample > 0.0, y_sample, 1.0)
+    if model == 'gauss':
+        replicates = y_sample + rng.normal(size=size, scale=noise)
+    elif model == 'gamma':
+        thetas = noise**2.0 / cases
+        kappas = cases / thetas
+        replicates = np.where(y_sample > 0.0, rng.gamma(kappas, thetas, size=size), 0.0)
+    elif model == 'negbinom':
+        pp = cases / noise**2.0
+        nn = pp * cases / (1.0 - pp)
+        replicates = np.where(y_sample > 0.0, rng.negative_binomial(nn, pp, size=size), 0.0)
+    else:
+        raise ValueError('unknown noise model {}'.format(model))
+
+    if not negative_cases:
+        replicates[replicates < 0.0] = 0.0
+    return replicates
+
+
+def synthetic_plan(sampling, shift, active_sampling=14):
+    """
+    :param sampling: sampling structure or its plan (dict/SamplingPlan)
+    :param shift: difference in days between first day and the first cases day (int)
+    :param active_sampling: number of past days a single sampling includes (int)
+    :return: plan of the sampling structure with the sampling days as times (SamplingPlan)
+    """
+    if isinstance(sampling, SamplingPlan):
+        if sampling.relative:
+            raise ValueError('synthetic samples are taken at times, not at days from the shift')
+        if sampling.shift != shift or sampling.active_sampling != active_sampling:
+            raise ValueError('sampling plan was built for shift {} and active sampling {}'.format(
+                sampling.shift, sampling.active_sampling))
+        return sampling
+    return SamplingPlan(sampling, shift, active_sampling, relative=False)
+
+
+def synthetic_data(sampling, asym, beta, gamma, phi, t_0, init, shift, Ns, M_c, travel_matrix, model, noise, r,
+                   rng, init_n=4, active_sampling=14, negative_cases=False, demographic=False):
+    """
+    Generates synthetic samples for all the cities with a single solution of the ODEs,
+    and r noisy replicates of them. As in meta_population_cumulative, which the synthetic
+    experiments were generated with, the sampling days are times rather than days from
+    the shift (synthetic_plan). With demographic noise every replicate observes its
+    own trajectory of the stochastic model (meta_population_stochastic_sample) instead
+    of the ODE solution. The replicates are also returned flattened with the r values of
+    every sample next to each other, the layout used by repeated_squared_error.
+    :param sampling: sampling structure or its plan from synthetic_plan (dict/SamplingPlan)
+    :param asym: fraction of asymptomatic cases (float)
+    :param beta: transmission rate/s (float/numpy.array)
+    :param gamma: recovery rate (float)
+    :param phi: seasonality phase (float)
+    :param t_0: seasonality parameter (float)
+    :param init: number of initial cases (float/numpy.array)
+    :param shift: difference in days between first day and the first cases day (int)
+    :param Ns: populations of the cities (numpy.array)
+    :param M_c: number of analysed cities (int)
+    :param travel_matrix: travelling rates (numpy.array)
+    :param model: 'gauss', 'gamma' or 'negbinom' (str)
+    :param noise: noise level (float)
+    :param r: number of replicates (int)
+    :param rng: random number generator (numpy.random.Generator)
+    :param init_n: number of cities with initial cases (int)
+    :param active_sampling: number of past days a single sampling includes (int)
+    :param negative_cases: whether negative case counts are possible (bool)
+    :param demographic: whether the replicates include demographic noise (bool)
+    :return: noise-free samples, noisy replicates with one replicate per row and the
+             flattened replicates (numpy.array, numpy.array, numpy.array)
+    """
+    plan = synthetic_plan(sampling, shift, active_sampling)
+    y_sample = meta_population_sample(plan, asym, beta, gamma, phi, t_0, init, shift, Ns, M_c, travel_matrix,
+                                      init_n=init_n, active_sampling=active_sampling)
+    trajectories = y_sample
+    if demographic:
+        trajectories = meta_population_stochastic_sample(plan, asym, beta, gamma, phi, t_0, init, shift, Ns, M_c,
+                                                         travel_matrix, r, rng, init_n=init_n,
+                                                         active_sampling=active_sampling)
+    replicates = noisy_replicates(trajectories, model, noise, r, rng, negative_cases)
+    return y_sample, replicates, replicates.T.reshape(-1)